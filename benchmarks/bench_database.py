@@ -0,0 +1,58 @@
+"""
+Microbenchmark comparing the connect-per-call db_execute path with the pooled path.
+
+Run from the repository root:
+    python -m benchmarks.bench_database (<number of guilds>) (<number of queries>)
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from utils.database import createTable, db_execute, open_pool, close_pool
+
+GUILDS = 1000
+QUERIES = 2000
+CONCURRENCY = 16
+
+async def _setup(db_path, guilds):
+    await createTable(db_path, 'config', {'guildID INTEGER PRIMARY KEY' : -1, 'prefix TEXT' : "'^^'"})
+    for guildID in range(guilds):
+        await db_execute(db_path, 'INSERT INTO config (guildID, prefix) VALUES (?, ?)', guildID, '^^', exec_type='update')
+
+async def _run(db_path, guilds, queries):
+    """Run the prefix select like get_prefix does, and a few updates like set_prefix"""
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i):
+        async with sem:
+            if i % 50 == 0:
+                await db_execute(db_path, 'UPDATE config SET prefix=? WHERE guildID=?', '!!', i % guilds, exec_type='update')
+            else:
+                await db_execute(db_path, 'SELECT prefix FROM config WHERE guildID=?', i % guilds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(queries)])
+    return time.perf_counter() - start
+
+async def main(guilds, queries):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        await _setup(db_path, guilds)
+
+        perCall = await _run(db_path, guilds, queries)
+        print(f'connect per call : {perCall:.3f} s ({queries/perCall:,.0f} queries/s)')
+
+        pool = await open_pool(db_path)
+        pooled = await _run(db_path, guilds, queries)
+        print(f'pooled           : {pooled:.3f} s ({queries/pooled:,.0f} queries/s)')
+        print(f'speedup          : {perCall/pooled:.1f}x')
+        print(f'pool stats       : {pool.stats()}')
+        await close_pool(db_path)
+
+if __name__ == '__main__':
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else GUILDS
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else QUERIES
+    asyncio.run(main(guilds, queries))
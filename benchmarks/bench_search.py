@@ -0,0 +1,74 @@
+"""
+Measure the build time, memory and query latency of the emote name search index.
+
+Names are made of common emote words ('cat', 'pepe', ...) and of random syllable words, so
+some trigrams are in a large share of the names, like in real emote names.
+
+Run from the repository root:
+    python -m benchmarks.bench_search (<number of emotes>)
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from utils.emotesearch import EmoteNameIndex
+
+EMOTES = 500000
+WORDS = ['pepe', 'cat', 'kek', 'haerin', 'minji', 'hanni', 'dani', 'hyein', 'newjeans', 'bunny', 'cry',
+         'happy', 'sad', 'angry', 'love', 'wave', 'dance', 'blush', 'pat', 'hug', 'nod', 'shrug',
+         'think', 'wow', 'omg', 'lol', 'sip', 'tea', 'heart', 'fire', 'clap', 'yes', 'no', 'poggers',
+         'sleepy', 'smug', 'peek', 'run', 'jam', 'vibe', 'bonk', 'sus', 'based', 'copium', 'ez']
+
+SYLLABLES = ['ka', 'ri', 'mo', 'chi', 'pu', 'ne', 'so', 'ta', 'yu', 'lo', 'bi', 'zen', 'ha', 'ju', 'ro', 'mi']
+VOCABULARY = WORDS + [''.join(random.Random(i).choices(SYLLABLES, k=random.Random(-i).randint(2, 4))) for i in range(5000)]
+
+def make_name(rand):
+    words = [rand.choice(WORDS) if rand.random() < 0.3 else rand.choice(VOCABULARY) for _ in range(rand.randint(1, 3))]
+    name = '_'.join(words)
+    if rand.random() < 0.5:
+        name += str(rand.randint(1, 999))
+    return name[:32]
+
+def time_queries(index, queries, repeat=200, fuzzy=True):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            index.search(query, fuzzy=fuzzy)
+    return (time.perf_counter() - start) / (repeat*len(queries))
+
+def main(count):
+    rand = random.Random(0)
+    emojis = [SimpleNamespace(id=10**17 + i, name=make_name(rand)) for i in range(count)]
+
+    index = EmoteNameIndex()
+    tracemalloc.start()
+    start = time.perf_counter()
+    index.build(emojis)
+    buildTime = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'build {count} emotes : {buildTime:.2f} s, {memory/1e6:.0f} MB ({memory/count:.0f} B per emote)')
+
+    cases = {
+        'prefix (1-2 chars)'     : ['h', 'pe', 'sl', 'zz'],
+        'substring, rare'        : ['haerin_cry_pat', 'newjeans_sip', 'bonk_sus7', 'copium_ez'],
+        'substring, common'      : ['cat', 'pepe', 'dance', 'heart'],
+        'substring, no match'    : ['xyzzy', 'qwerty', 'haerinz'],
+        'fuzzy (typo)'           : ['haerni_cry', 'newjaens', 'poggres', 'slepy_cat'],
+    }
+    for label, queries in cases.items():
+        print(f'{label:<24} : {1e6*time_queries(index, queries):.0f} us per query')
+
+    start = time.perf_counter()
+    for i in range(1000):
+        index.add(10**18 + i, make_name(rand))
+    for i in range(1000):
+        index.remove(10**18 + i)
+    print(f'add + remove           : {1e6*(time.perf_counter() - start)/1000:.0f} us per emote')
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else EMOTES
+    main(count)
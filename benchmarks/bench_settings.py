@@ -0,0 +1,51 @@
+"""
+Measure the memory per guild and the read time of the settings repository.
+
+Run from the repository root:
+    python -m benchmarks.bench_settings (<number of guilds>)
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from utils.database import createTable, connect, open_pool, close_pool
+from utils.settings import SettingsRepository
+from config import DATABASE_TABLES
+
+GUILDS = 100000
+
+async def main(guilds):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        await open_pool(db_path)
+        for table_name, columns_dict in DATABASE_TABLES.items():
+            await createTable(db_path, table_name, columns_dict)
+        async with connect(db_path, write=True) as db:
+            for table_name in DATABASE_TABLES.keys():
+                await db.executemany(f'INSERT INTO {table_name} (guildID) VALUES (?)', [(i,) for i in range(guilds)])
+            await db.commit()
+
+        settings = SettingsRepository(db_path, DATABASE_TABLES)
+        tracemalloc.start()
+        start = time.perf_counter()
+        await settings.load()
+        loadTime = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'load {guilds} guilds : {loadTime:.2f} s, {memory/1e6:.1f} MB ({memory/guilds:.0f} B per guild)')
+
+        start = time.perf_counter()
+        for i in range(guilds):
+            settings.get('config', i).prefix
+        readTime = time.perf_counter() - start
+        print(f'prefix read        : {1e9*readTime/guilds:.0f} ns')
+
+        await close_pool(db_path)
+
+if __name__ == '__main__':
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else GUILDS
+    asyncio.run(main(guilds))
@@ -2,7 +2,8 @@ import discord
 from discord.ext import commands
 import json
 import aiosqlite
-from utils.database import db_execute
+from utils.database import get_pool
+from utils.bot_initialization import reset_cached_prefix
 
 with open('config.json', 'r') as config_file:
     configData = json.load(config_file)
@@ -17,6 +18,7 @@ class Config(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = configData["DATABASE"]
+        self.settings = bot.settings
 
     
     @commands.command(
@@ -38,7 +40,7 @@ class Config(commands.Cog):
         administrator
         """
 
-        current_prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        current_prefix = self.settings.get('config', ctx.guild.id).prefix
         
         if new_prefix is None:
             await ctx.send(f'>>> {self.set_prefix.help.format(prefix=current_prefix)}\n\nCurrent prefix is set to `{current_prefix}`')
@@ -48,7 +50,8 @@ class Config(commands.Cog):
             await ctx.send('Invalid prefix. Choose something shorter.')
             return
         
-        await db_execute(self.db, 'UPDATE config SET prefix=? WHERE guildID=?', new_prefix, ctx.guild.id, exec_type='update')
+        await self.settings.update('config', ctx.guild.id, prefix=new_prefix)
+        reset_cached_prefix(ctx.guild.id)
         await ctx.send(f'Prefix has been set to `{new_prefix}`. If there are issues, '+
                     f'use "{self.bot.user.mention} `set_prefix <new prefix>`" to set a different prefix')
 
@@ -77,7 +80,7 @@ class Config(commands.Cog):
         Permissions:
         is_owner
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         if not cogs:
             await ctx.send(f'>>> {self.reload.help.format(prefix=prefix)}')
@@ -121,6 +124,54 @@ class Config(commands.Cog):
 
         return
 
+    @commands.command(
+        name='dbstats',
+        brief='database pool stats',
+        hidden=True
+    )
+    @is_owner()
+    async def dbstats(self, ctx):
+        """
+        Command: **dbstats**
+
+        Show the database connection pool, write-behind queue, emote log dispatcher, emote display and asset cache statistics.
+
+        __Usage:__
+        `{prefix}dbstats`
+
+        Permissions:
+        is_owner
+        """
+        pool = get_pool(self.db)
+        if pool is None:
+            await ctx.send('The database pool is not open')
+            return
+
+        stats = pool.stats()
+        msg = f"Pool size: {stats['size']} (idle readers: {stats['idle_readers']}, writer busy: {stats['writer_busy']})\n"
+        for kind in ('reader', 'writer'):
+            checkouts = stats[kind]['checkouts']
+            avgWait = 1000 * stats[kind]['wait_total'] / checkouts if checkouts else 0
+            msg += f"{kind}: {checkouts} checkouts, avg wait {avgWait:.2f} ms, max wait {1000*stats[kind]['wait_max']:.2f} ms\n"
+        if self.bot.writes is not None:
+            wb = self.bot.writes.metrics()
+            msg += (f"write-behind: depth {wb['depth']} (max {wb['max_depth']}), {wb['queued']} queued, {wb['coalesced']} coalesced, "
+                    f"{wb['written']} written in {wb['flushes']} flushes, avg flush {1000*wb['flush_avg']:.2f} ms, max flush {1000*wb['flush_max']:.2f} ms\n")
+        emoteCog = self.bot.get_cog('Emote')
+        if emoteCog is not None:
+            ld = emoteCog.logDispatcher.metrics()
+            msg += (f"emote log: {ld['queued']} queued, {ld['flushes']} flushes ({ld['failures']} failed), avg {ld['flush_avg']:.2f} s, "
+                    f"max {ld['flush_max']:.2f} s, {ld['published']} published, {ld['publishing']} waiting to publish\n")
+            dd = emoteCog.displayDebounce.metrics()
+            msg += (f"emote display: {dd['runs']} updates ({dd['failures']} failed) for {dd['triggers']} emote changes, "
+                    f"{dd['coalesced']} coalesced, {dd['cancelled']} stale updates cancelled, {dd['scheduled']} scheduled\n")
+            lc = emoteCog.layouts.stats()
+            msg += f"display layouts: {lc['layouts']}/{lc['size']} cached, hit rate {100*lc['hit_rate']:.1f}% ({lc['hits']} hits, {lc['misses']} misses)\n"
+        ac = self.bot.assets.stats()
+        msg += (f"asset cache: {ac['objects']} files, {ac['bytes'] / 2**20:.1f}/{ac['max_bytes'] / 2**20:.0f} MB, "
+                f"hit rate {100*ac['hit_rate']:.1f}% ({ac['hits']} hits, {ac['misses']} misses)\n")
+        await ctx.send(f'>>> {msg}')
+
     @commands.command(
         name='invite',
         brief='create bot invite',
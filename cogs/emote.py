@@ -1,23 +1,71 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 import json
+import config
 # import aiosqlite
-from utils.database import db_execute
-import requests
+from utils import emotelog as pendinglog
+from utils import emotedisplay
+from utils.scheduler import DeadlineScheduler, Debouncer
+from utils.dispatcher import LogDispatcher
+from utils.rest import StatusMessage, split_message
+from utils.images import sniff_animated
+from utils.emotefilter import EmoteFilter, is_filter
+from utils.emotehash import distance
+import time
 import asyncio
 from io import BytesIO
+from datetime import timedelta
 
 with open('config.json', 'r') as config_file:
     configData = json.load(config_file)
 
+logger = config.logging.getLogger("bot")
+
 class Emote(commands.Cog):
     """Commands related to emote shenanigans"""
 
     def __init__(self, bot):
 
         self.bot = bot
-        self._timed_update.start()
         self.db = configData["DATABASE"]
+        self.settings = bot.settings
+        self.pending = bot.pending
+        self.hashes = bot.hashes
+        self.duplicateDistance = configData["EMOTE_DUPLICATE_DISTANCE"]
+        self.duplicates = configData["EMOTE_DUPLICATES"]
+        self._background = set() # running background tasks, referenced until done
+        self._hashTasks = {} # guildID -> running hashing of the guild's emotes
+        self._hashSlots = asyncio.Semaphore(configData["DOWNLOAD_CONCURRENCY"]) # emote downloads of the hashing, all guilds
+        self._displayLocks = {} # guildID -> lock, one display update at a time
+        self.layouts = emotedisplay.LayoutCache()
+        # one display update per burst of emote changes, DISPLAY_DEBOUNCE after the last one
+        self.displayDebounce = Debouncer(self._display_update, configData["DISPLAY_DEBOUNCE"])
+        # automatic log posts, EMOTELOG_INTERVAL after the first pending entry of a guild
+        self.logInterval = configData["EMOTELOG_INTERVAL"]
+        self.logSchedule = DeadlineScheduler(self._timed_update)
+        # log posts of different guilds run concurrently on a few workers
+        self.logDispatcher = LogDispatcher(self._send_update, workers=configData["EMOTELOG_WORKERS"])
+
+    async def cog_load(self):
+        """Schedule the log posts of the logs pending since before startup, and reconcile the displays"""
+        for guild_id in self.pending.guilds():
+            self.logSchedule.schedule(guild_id, self.pending.first_added(guild_id) + self.logInterval - time.time())
+        self.logSchedule.start()
+        self.logDispatcher.start()
+        self.displayDebounce.start()
+        task = asyncio.create_task(self._display_reconcile())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def cog_unload(self):
+        """Stop the timed log updates and flush the queued database writes"""
+        await self.logSchedule.stop()
+        await self.logDispatcher.stop()
+        await self.displayDebounce.stop()
+        for task in self._hashTasks.values():
+            task.cancel()
+        if self.bot.writes is not None:
+            await self.bot.writes.stop()
 
     def is_bot(self, message):
         return message.author == self.bot.user
@@ -38,6 +86,8 @@ class Emote(commands.Cog):
         `{prefix}emote remove` - Removes given emotes
         `{prefix}emote rename` - Rename an existng emote
         `{prefix}emote source` - Post the source images of the emotes given
+        `{prefix}emote similar` - Find emotes that look like an image, in every server
+        `{prefix}emote search` - Find emotes by name, in every server
 
         - **Emote Logging**
         `{prefix}emote log` - Set the channel and settings for logging emotes
@@ -55,7 +105,7 @@ class Emote(commands.Cog):
 
     async def _emote_help(self, ctx):
         """Give the help result for the emote module"""
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
         emb = discord.Embed(title=f'{prefix}emote',
                             description=f'{self.emote.help.format(prefix=prefix)}',
                             color=discord.Color.dark_green())
@@ -81,7 +131,7 @@ class Emote(commands.Cog):
         __Usage:__
         `{prefix}emote add (<emote name 1> <emote name 2> ...) <source link/upload 1> <source link/upload 2> ...`
 
-        Source links must be 'http' links. Supported formats are PNG, JPG, and GIF.
+        Source links must be 'http' links. Supported formats are PNG, JPG, GIF, WebP and APNG. Images are resized to fit the emoji limits.
 
         Permissions:
         create_expressions
@@ -91,7 +141,7 @@ class Emote(commands.Cog):
         all_sources = False
         if not args: # no names, all uploads
             all_sources = True
-            sources = [source.url for source in ctx.message.attachments]
+            sources = ctx.message.attachments
         elif ("http" in args[0]) and ("http" in args[-1]): # all links
             all_sources = True
             sources = args
@@ -105,53 +155,192 @@ class Emote(commands.Cog):
                 sources = args[splitInd:]
             else: # uploads and names
                 emote_names = args
-                sources = [source.url for source in ctx.message.attachments]
+                sources = ctx.message.attachments
                 if len(emote_names) != len(sources):
                     await ctx.send("Invalid input. There must be equal emote names to sources and sources must be all upload or all links.")
                     return
 
-        emote_sources = []
-        filenames = []
-        for source in sources:
-                filenames.append(source.split('/')[-1].split('.')[0])
-                response = requests.get(source)
-                emote_sources.append(response.content)
-        
+        filenames = [(source if isinstance(source, str) else source.filename).split('/')[-1].split('.')[0] for source in sources]
         if all_sources:
             emote_names = filenames
 
         # truncate emote names
         emote_names = [name[:32] for name in emote_names]
 
-        successAdd = []
-        successSources = []
-        failAdd = []
-        for name, source in zip(emote_names, emote_sources):
+        # skip what can't fit in the free static/animated emoji slots, before downloading
+        emote_names, sources, failAdd = await self._plan_slots(ctx.guild, emote_names, sources)
+
+        # download, convert (to a size and format discord accepts) and hash all sources
+        # concurrently, and create each emote as soon as it is ready, EMOJI_CREATE_CONCURRENCY
+        # at a time (the guild's REST slots)
+        async def prepare(source):
+            data = await self.bot.downloader.fetch(source)
+            data, _ = await self.bot.images.normalize(data)
+            return data, await self.bot.images.dhash(data)
+        prepared = [asyncio.create_task(prepare(source)) for source in sources]
+        # duplicates are checked against the emotes hashed so far, the rest is hashed in the background
+        self._hash_guild(ctx.guild)
+
+        total = len(emote_names) + len(failAdd)
+        status = StatusMessage(await ctx.send(f"Adding {total} emotes..."))
+        progress = {'done' : len(failAdd), 'failed' : len(failAdd)}
+        added = [] # the emotes added so far, in the order they were created
+        batchHashes = [] # (name, hash) of the uploads checked so far
+        checked = [asyncio.Event() for _ in prepared]
+
+        async def add(i, name, task):
             try:
-                # Create the emote in the guild
-                emote = await ctx.guild.create_custom_emoji(name=name, image=source)
-                successAdd.append(str(emote))
-                successSources.append((name, source, emote.animated))
-            except Exception as e:
-                failAdd.append((name, e))
-                pass
+                try:
+                    source, emoteHash = await task
+                    # near-duplicates of the guild emotes and of the uploads before this one,
+                    # checked in upload order so the first of two similar uploads is kept
+                    if i > 0:
+                        await checked[i-1].wait()
+                    matches = self.hashes.matches(ctx.guild.id, emoteHash, self.duplicateDistance)
+                    match = next(filter(None, (ctx.guild.get_emoji(emojiID) for _, emojiID in matches)), None)
+                    if match is None:
+                        match = next((f'`:{other}:`' for other, otherHash in batchHashes
+                                      if distance(emoteHash, otherHash) <= self.duplicateDistance), None)
+                    if (match is not None) and (self.duplicates == 'skip'):
+                        raise ValueError(f'duplicate of {match}')
+                    batchHashes.append((name, emoteHash))
+                finally:
+                    checked[i].set()
+
+                # Create the emote in the guild, paced by the guild's emoji create slots
+                async with self.bot.rest.slot(ctx.guild.id):
+                    emote = await ctx.guild.create_custom_emoji(name=name, image=source)
+                await self.hashes.add(ctx.guild.id, emote.id, emoteHash)
+                await self.bot.assets.put(source, key=f'emoji:{emote.id}')
+                added.append(str(emote))
+                return emote, source, match
+            except Exception:
+                progress['failed'] += 1
+                raise
+            finally:
+                progress['done'] += 1
+                await status.update(f"Adding emotes... {progress['done']}/{total} ({progress['failed']} failed)\n{' '.join(added)}")
 
-        if successAdd:
-            await ctx.send(f"Emotes added successfully:")
-            await ctx.send(' '.join(successAdd))
+        try:
+            results = await asyncio.gather(*(add(i, name, task) for i, (name, task) in enumerate(zip(emote_names, prepared))),
+                                           return_exceptions=True)
+        finally:
+            for task in prepared:
+                task.cancel()
 
+        # collect the results in upload order
+        successAdd = []
+        successSources = []
+        similar = []
+        for name, result in zip(emote_names, results):
+            if isinstance(result, BaseException):
+                failAdd.append((name, result))
+                continue
+            emote, source, match = result
+            successAdd.append(str(emote))
+            successSources.append((name, source, emote.animated))
+            if match is not None:
+                similar.append((emote, match))
+
+        # final report, in the status message (and follow-ups if too long)
+        lines = [f"Added {len(successAdd)}/{total} emotes" + (':' if successAdd else '')]
+        if successAdd:
+            lines.append(' '.join(successAdd))
         if failAdd:
-            await ctx.send(f"Failed to add:")
-            for name, e in failAdd:
-                await ctx.send(f"{name}: {e}")
-
-        srcChID = (await db_execute(self.db, 'SELECT sourceChannelID FROM emotelog WHERE guildID=?', ctx.guild.id))[0]
+            lines.append("Failed to add:")
+            lines += [f"{name}: {e}" for name, e in failAdd]
+        if similar:
+            lines.append("Possible duplicates:")
+            lines += [f"{emote} looks like {match}" for emote, match in similar]
+        report = split_message(lines)
+        await status.update(report[0], force=True)
+        for message in report[1:]:
+            await ctx.send(message)
+
+        # archive the sources, up to 10 files per message
+        srcChID = self.settings.get('emotelog', ctx.guild.id).sourceChannelID
         if srcChID:
             srcCh = discord.utils.get(ctx.guild.channels, id=int(srcChID))
-            for name, source, ani in successSources:
-                fileExt = '.gif' if ani else '.png'
-                file = discord.File(BytesIO(source), filename=name+fileExt)
-                await srcCh.send(content=f'`:{name}:`', file=file)
+            for i in range(0, len(successSources), 10):
+                batch = successSources[i:i+10]
+                files = [discord.File(BytesIO(source), filename=name+('.gif' if ani else '.png')) for name, source, ani in batch]
+                await srcCh.send(content=' '.join(f'`:{name}:`' for name, _, _ in batch), files=files)
+
+    async def _hash_emojis(self, guild, emojis=None):
+        """
+        Add the emotes of a guild missing from the hash index, and drop the deleted ones.
+
+        Emote images come from the asset cache, or are downloaded without being cached, so
+        hashing whole guilds doesn't evict the working set of the cache.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild.
+        emojis : list, None
+            The emojis to hash if missing. If None, all the guild emojis, and the hashes of
+            emojis no longer in the guild are removed.
+        """
+        if emojis is None:
+            emojis = guild.emojis
+            await self.hashes.prune(guild.id, [emoji.id for emoji in emojis])
+        missing = set(self.hashes.missing(guild.id, [emoji.id for emoji in emojis]))
+
+        async def hash_emoji(emoji):
+            # bounded, so hashing a large guild doesn't flood the CDN
+            async with self._hashSlots:
+                data = await self.bot.assets.get(f'emoji:{emoji.id}', count=False)
+                if data is None:
+                    data = await emoji.read()
+                await self.hashes.add(guild.id, emoji.id, await self.bot.images.dhash(data))
+        results = await asyncio.gather(*(hash_emoji(emoji) for emoji in emojis if emoji.id in missing), return_exceptions=True)
+        for emoji, result in zip([emoji for emoji in emojis if emoji.id in missing], results):
+            if isinstance(result, Exception):
+                logger.error(f"Hashing emoji {emoji.id} of guild {guild.id} failed: {result}")
+
+    def _hash_guild(self, guild):
+        """Hash the emotes of a guild missing from the index, in the background. Returns the running task"""
+        task = self._hashTasks.get(guild.id)
+        if (task is None) or task.done():
+            task = self._hashTasks[guild.id] = asyncio.create_task(self._hash_emojis(guild))
+            task.add_done_callback(lambda done: self._hashTasks.pop(guild.id, None) if self._hashTasks.get(guild.id) is done else None)
+        return task
+
+    async def _plan_slots(self, guild, names, sources):
+        """
+        Sort emote add requests into what fits in the free emoji slots of the guild and what doesn't.
+
+        Static and animated emojis have separate slots. Whether a source is animated is told from
+        its first bytes (a Range request), not from a full download. Sources that can't be told
+        are kept and left for discord to accept or refuse.
+
+        Returns
+        -------
+        names, sources, skipped : list, list, list
+            The names and sources that fit, in order, and the (name, reason) of the others.
+        """
+        staticFree = guild.emoji_limit - sum(1 for emoji in guild.emojis if not emoji.animated)
+        animatedFree = guild.emoji_limit - sum(1 for emoji in guild.emojis if emoji.animated)
+        if len(sources) <= min(staticFree, animatedFree): # everything fits, no need to look
+            return list(names), list(sources), []
+
+        heads = await asyncio.gather(*map(self.bot.downloader.fetch_head, sources), return_exceptions=True)
+        keptNames, keptSources, skipped = [], [], []
+        for name, source, head in zip(names, sources, heads):
+            animated = None if isinstance(head, Exception) else sniff_animated(head)
+            if animated is True:
+                if animatedFree <= 0:
+                    skipped.append((name, f'no animated emoji slots left ({guild.emoji_limit} max)'))
+                    continue
+                animatedFree -= 1
+            elif animated is False:
+                if staticFree <= 0:
+                    skipped.append((name, f'no static emoji slots left ({guild.emoji_limit} max)'))
+                    continue
+                staticFree -= 1
+            keptNames.append(name)
+            keptSources.append(source)
+        return keptNames, keptSources, skipped
 
     @emote.command(
             name='remove',
@@ -168,16 +357,24 @@ class Emote(commands.Cog):
 
         __Usage:__
         `{prefix}emote remove (nolog) (<custom header>) <:emote1:> <:emote2:> ...`
+        `{prefix}emote remove (nolog) --match <regex> (--animated/--static) (--ids <:emote:> ...) (--dry-run)`
         
         The emotes must be spaced apart evenly by either 0 or 1 spaces.
+        With filters, every emote matching all of them is removed, after a preview to confirm. `--match` searches the names with a regex, ex: `--match ^tmp_`. `--dry-run` only shows the preview.
 
         Permissions:
         manage_expressions
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
         log = True # default
 
+        if not emotes:
+            raise ValueError(f'No emotes given. Use `{prefix}help emote remove` for more information')
+        if is_filter(emotes[int(emotes[0].lower() == 'nolog'):]):
+            await self._bulk_remove(ctx, emotes)
+            return
+
         if emotes[0].lower() == 'nolog':
             log = False
             emotes = emotes[1:]
@@ -204,49 +401,132 @@ class Emote(commands.Cog):
         except:
             await ctx.send(f'Invalid input. Use `{prefix}help emote remove` for more information')
             return
-        emotes = [ctx.guild.get_emoji(id) for id in emoteIDs]
-
-        # get log channel
-        if log:
-            emoteLogChID = (await db_execute(self.db, 'SELECT logChannelID FROM emotelog WHERE guildID=?', ctx.guild.id))[0]
-            if emoteLogChID:
-                emoteLogCh = discord.utils.get(ctx.guild.channels, id=int(emoteLogChID))
-            at_least_one_removed = False
 
-        # remove emotes
-        successRemove = []
+        # emotes not in this server fail right away
+        toRemove = []
         failRemove = []
-        for emote, id in zip(emotes, emoteIDs):
-            try:
-                if emote in ctx.guild.emojis:
-                    emote_name = emote.name
-                    if log:
-                        if not at_least_one_removed:
-                            if emoteLogChID:
-                                updateMsg = f'**{customMsg}**' if customMsg else '**Removed:**'
-                                await emoteLogCh.send(updateMsg)
-                            at_least_one_removed = True
-                        if emoteLogChID:
-                            await emoteLogCh.send(emote)
-                    await emote.delete()
-                    successRemove.append(f'`:{emote_name}:`')
-                else:
-                    try:
-                        emt = discord.utils.get(self.bot.emojis, id=id)
-                        emote_name = emt.name
-                    except:
-                        emote_name = id
-                    failRemove.append((f'`:{emote_name}:`', 'This emote is not in this server'))
-            except Exception as e:
-                failRemove.append((f'`:{id}:`', e))
+        for id in dict.fromkeys(emoteIDs):
+            emote = ctx.guild.get_emoji(id)
+            if emote is not None:
+                toRemove.append(emote)
+            else:
+                emt = self.bot.get_emoji(id)
+                failRemove.append((f'`:{emt.name if emt else id}:`', 'This emote is not in this server'))
+
+        successRemove, removeFails = await self._remove_emojis(ctx, toRemove)
+        failRemove += [(f'`:{emote.name}:`', e) for emote, e in removeFails]
+        if log:
+            await self._log_removed(ctx.guild, successRemove, customMsg)
 
+        # a single report for all emotes (split if too long)
+        lines = []
         if successRemove:
-            await ctx.send(f"Successfully removed emotes: {', '.join(successRemove)}")
-        
+            lines.append(f"Successfully removed emotes: {', '.join(f'`:{emote.name}:`' for emote in successRemove)}")
         if failRemove:
-            await ctx.send(f"Failed to remove emotes:")
-            for name, e in failRemove:
-                await ctx.send(f"{name}: {e}")
+            lines.append("Failed to remove emotes:")
+            lines += [f"{name}: {e}" for name, e in failRemove]
+        for message in split_message(lines):
+            await ctx.send(message)
+
+    async def _log_removed(self, guild, emojis, header=''):
+        """Post removed emotes to the emote log channel, packed in rows like the emote log"""
+        settings = self.settings.get('emotelog', guild.id)
+        if (not emojis) or (not settings.logChannelID):
+            return
+        emoteLogCh = discord.utils.get(guild.channels, id=int(settings.logChannelID))
+        updateMsg = f'**{header}**' if header else '**Removed:**'
+        rows = pendinglog.grid([str(emoji) for emoji in emojis], settings.maxCol, 1)
+        for message in split_message([updateMsg] + rows):
+            await emoteLogCh.send(message)
+
+    async def _remove_emojis(self, ctx, emojis):
+        """Delete emojis of the context guild concurrently, see _run_emoji_jobs"""
+        return await self._run_emoji_jobs(ctx, emojis, lambda emoji: emoji.delete(), ('Removing', 'Removed'))
+
+    async def _run_emoji_jobs(self, ctx, emojis, job, verbs):
+        """
+        Run a REST call for each emoji of the context guild concurrently, paced by the guild's REST
+        slots, with a progress message for more than one emoji.
+
+        Parameters
+        ----------
+        emojis : list
+            The emojis.
+        job : callable
+            Makes the coroutine of an emoji, ex: lambda emoji: emoji.delete().
+        verbs : tuple
+            The progress and done verbs of the status message, ex: ('Removing', 'Removed').
+
+        Returns
+        -------
+        done, failed : list, list
+            The emojis the call succeeded for, in order, and the (emoji, exception) of the others.
+        """
+        if not emojis:
+            return [], []
+        status = StatusMessage(await ctx.send(f"{verbs[0]} {len(emojis)} emotes...")) if len(emojis) > 1 else None
+        count = 0
+
+        async def run(emoji):
+            nonlocal count
+            try:
+                async with self.bot.rest.slot(ctx.guild.id):
+                    await job(emoji)
+            finally:
+                count += 1
+                if status is not None:
+                    await status.update(f"{verbs[0]} emotes... {count}/{len(emojis)}")
+
+        results = await asyncio.gather(*map(run, emojis), return_exceptions=True)
+        done = [emoji for emoji, result in zip(emojis, results) if not isinstance(result, BaseException)]
+        failed = [(emoji, result) for emoji, result in zip(emojis, results) if isinstance(result, BaseException)]
+        if status is not None:
+            await status.update(f"{verbs[1]} {len(done)}/{len(emojis)} emotes", force=True)
+        return done, failed
+
+    async def _confirm(self, ctx, question, timeout=60):
+        """Ask the author to confirm with a reaction, True if they did"""
+        yes, no = '<a:ahaerinnodders:1147403485722193920>', '<a:ahaerinnopers:1147403691977080845>'
+        confirmation_message = await ctx.reply(question, delete_after=timeout + 5)
+        await confirmation_message.add_reaction(yes)
+        await confirmation_message.add_reaction(no)
+        def check(reaction, user):
+            return (user == ctx.author) and (reaction.message.id == confirmation_message.id) and (str(reaction.emoji) in [yes, no])
+        try:
+            reaction, user = await self.bot.wait_for('reaction_add', timeout=timeout, check=check)
+        except asyncio.TimeoutError:
+            return False
+        await confirmation_message.delete()
+        return str(reaction.emoji) == yes
+
+    async def _bulk_remove(self, ctx, args):
+        """emote remove with filters: preview, confirm, then remove concurrently"""
+        log = args[0].lower() != 'nolog'
+        emoteFilter = EmoteFilter(args[int(not log):])
+        selected = emoteFilter.select(ctx.guild.emojis)
+        if not selected:
+            await ctx.send('No emotes match the filters')
+            return
+
+        maxCol = self.settings.get('emotelog', ctx.guild.id).maxCol
+        preview = [f'**{len(selected)} emotes will be removed:**'] + pendinglog.grid([str(emoji) for emoji in selected], maxCol, 1)
+        for message in split_message(preview):
+            await ctx.send(message)
+        if emoteFilter.dryRun:
+            return
+        if not await self._confirm(ctx, f'Remove these {len(selected)} emotes?'):
+            await ctx.reply('Removal was cancelled', delete_after=10)
+            return
+
+        removed, failed = await self._remove_emojis(ctx, selected)
+        if log:
+            await self._log_removed(ctx.guild, removed)
+        lines = [f"Removed {len(removed)}/{len(selected)} emotes"]
+        if failed:
+            lines.append("Failed to remove emotes:")
+            lines += [f"`:{emoji.name}:`: {e}" for emoji, e in failed]
+        for message in split_message(lines):
+            await ctx.send(message)
 
 
     @emote.command(
@@ -254,19 +534,30 @@ class Emote(commands.Cog):
             brief='rename an existing emote'
     )
     @commands.has_permissions(manage_expressions=True)
-    async def emote_rename(self, ctx, emote : discord.Emoji, newName : str = ''):
+    async def emote_rename(self, ctx, *args):
         """
         Command: **emote rename**
 
-        Rename an existing emote.
+        Rename an existing emote, or many at once with a regex.
 
         __Usage:__
         `{prefix}emote rename <:emote:> <new name>`
+        `{prefix}emote rename --pattern <regex> <new name> (--match <regex>) (--animated/--static) (--ids <:emote:> ...) (--dry-run)`
+
+        With `--pattern`, every emote whose name matches the regex (and the other filters) is renamed, after a preview to confirm. Groups of the regex can be used in the new name, ex: `--pattern old_(.*) new_\\1` renames `old_cat` to `new_cat`. `--dry-run` only shows the preview.
 
         Permissions:
         manage_expressions
         """
 
+        if is_filter(args):
+            await self._bulk_rename(ctx, args)
+            return
+        if not args:
+            raise ValueError('An emote and a new name must be given.')
+        emote = await commands.EmojiConverter().convert(ctx, args[0])
+        newName = args[1] if len(args) > 1 else ''
+
         if len(newName) < 2:
             raise ValueError('A new name must be given with at least 2 characters length.')
         
@@ -275,6 +566,129 @@ class Emote(commands.Cog):
 
         await ctx.send(f'Emote `{oldName}` successfully renamed to `{newName}`')
 
+    async def _bulk_rename(self, ctx, args):
+        """emote rename with filters: preview, confirm, then rename concurrently"""
+        emoteFilter = EmoteFilter(args, rename=True)
+        renames, invalid = emoteFilter.renames(ctx.guild.emojis)
+        if not (renames or invalid):
+            await ctx.send('No emotes match the filters')
+            return
+
+        lines = [f'**{len(renames)} emotes will be renamed:**']
+        lines += [f'{emoji} `{emoji.name}` → `{newName}`' for emoji, newName in renames]
+        if invalid:
+            lines.append('**Skipped:**')
+            lines += [f'{emoji} `{emoji.name}`: {reason}' for emoji, reason in invalid]
+        for message in split_message(lines):
+            await ctx.send(message)
+        if emoteFilter.dryRun or not renames:
+            return
+        if not await self._confirm(ctx, f'Rename these {len(renames)} emotes?'):
+            await ctx.reply('Rename was cancelled', delete_after=10)
+            return
+
+        newNames = {emoji.id : newName for emoji, newName in renames}
+        renamed, failed = await self._run_emoji_jobs(ctx, [emoji for emoji, _ in renames],
+                                                     lambda emoji: emoji.edit(name=newNames[emoji.id]),
+                                                     ('Renaming', 'Renamed'))
+        lines = [f"Renamed {len(renamed)}/{len(renames)} emotes"]
+        if failed:
+            lines.append("Failed to rename emotes:")
+            lines += [f"`:{emoji.name}:`: {e}" for emoji, e in failed]
+        for message in split_message(lines):
+            await ctx.send(message)
+
+
+    @emote.command(
+        name='similar',
+        brief='find emotes that look like an image'
+    )
+    @commands.has_permissions(manage_expressions=True)
+    async def emote_similar(self, ctx, source : str = ''):
+        """
+        Command: **emote similar**
+
+        Finds the emotes that look like an image, in every server Haerin Bot is in.
+
+        __Usage:__
+        `{prefix}emote similar <emote/link/upload>`
+
+        Shows the 10 closest emotes. The emotes of a server are indexed on its first emote add or emote similar, or when Haerin Bot joins it, so results may be partial for a while.
+
+        Permissions:
+        manage_expressions
+        """
+
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        try:
+            if ctx.message.attachments:
+                data = await self.bot.downloader.fetch(ctx.message.attachments[0])
+            elif 'http' in source:
+                data = await self.bot.downloader.fetch(source)
+            else:
+                emote = discord.PartialEmoji.from_str(source)
+                if emote.id is None:
+                    raise ValueError(f'Invalid input. Use `{prefix}help emote similar` for more information')
+                data = await self.bot.assets.fetch(f'emoji:{emote.id}', emote.read)
+            queryHash = await self.bot.images.dhash(data)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f'The image could not be read: {e}')
+
+        # index this server's emotes, in the background
+        self._hash_guild(ctx.guild)
+
+        matches = []
+        for bits, guildID, emojiID in self.hashes.similar().search(queryHash, k=20, max_distance=self.duplicateDistance*2):
+            emoji = self.bot.get_emoji(emojiID)
+            if emoji is not None:
+                matches.append(f'{emoji} `:{emoji.name}:` in {emoji.guild.name} ({100 - 100*bits // 64}% similar)')
+            if len(matches) >= 10:
+                break
+
+        indexed = f'{self.hashes.count()}/{len(self.bot.emojis)} emotes indexed'
+        if not matches:
+            await ctx.send(f'No similar emotes found ({indexed})')
+            return
+        for message in split_message(['**Similar emotes:**'] + matches + [f'-# {indexed}']):
+            await ctx.send(message)
+
+    @emote.command(
+        name='search',
+        brief='find emotes by name'
+    )
+    async def emote_search(self, ctx, *, query : str = ''):
+        """
+        Command: **emote search**
+
+        Finds emotes by name, in every server Haerin Bot is in.
+
+        __Usage:__
+        `{prefix}emote search <name>`
+
+        Names starting with the query come first, then names containing it, then close names (for typos). Shows up to 25 emotes.
+        """
+
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        if not query.strip(': '):
+            raise ValueError(f'No name given. Use `{prefix}help emote search` for more information')
+
+        start = time.perf_counter()
+        emojiIDs = self.bot.names.search(query.strip())
+        elapsed = time.perf_counter() - start
+
+        matches = []
+        for emojiID in emojiIDs:
+            emoji = self.bot.get_emoji(emojiID)
+            if emoji is not None:
+                matches.append(f'{emoji} `:{emoji.name}:` in {emoji.guild.name}')
+        if not matches:
+            await ctx.send(f'No emotes found for `{query}`')
+            return
+        footer = f'-# {len(matches)} results from {len(self.bot.names)} emotes in {1000*elapsed:.2f} ms'
+        for message in split_message([f'**Emotes matching** `{query}`**:**'] + matches + [footer]):
+            await ctx.send(message)
 
     @emote.command(
         name='source',
@@ -297,7 +711,10 @@ class Emote(commands.Cog):
         emote_files = []
         for emote in emotes:
             if isinstance(emote, discord.PartialEmoji):
-                emote_file = await emote.to_file()
+                # emoji assets never change, so they are cached by emoji ID
+                fileExt = 'gif' if emote.animated else 'png'
+                data = await self.bot.assets.fetch(f'emoji:{emote.id}', emote.read)
+                emote_file = discord.File(BytesIO(data), filename=f'{emote.id}.{fileExt}')
             emote_files.append(emote_file)
             if len(emote_files) >= 10:
                 break
@@ -343,12 +760,12 @@ class Emote(commands.Cog):
         manage_channels
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         # handle empty string
         if channel == '':
             # get log channel
-            currentLogChannelID =(await db_execute(self.db, 'SELECT logChannelID FROM emotelog WHERE guildID=?', ctx.guild.id))[0]
+            currentLogChannelID = self.settings.get('emotelog', ctx.guild.id).logChannelID
             if currentLogChannelID:
                 currentLogChannel = discord.utils.get(ctx.guild.channels, id=int(currentLogChannelID))
                 await ctx.send(f"Emote log channel is currently set to {currentLogChannel.mention}")
@@ -366,7 +783,7 @@ class Emote(commands.Cog):
 
         # if a channel, set it
         if newLogChannel:
-            await db_execute(self.db, 'UPDATE emotelog SET logChannelID=? WHERE guildID=?', channelID, ctx.guild.id, exec_type='update')
+            await self.settings.update('emotelog', ctx.guild.id, logChannelID=int(channelID))
             await ctx.send(f"Emote log updates will now post to {newLogChannel.mention}")
         else:
             await ctx.send(f"Invalid channel. Use `{prefix}emote log <#channel>` to select a channel to enable emote logging")
@@ -393,7 +810,7 @@ class Emote(commands.Cog):
         manage_webhooks
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         if option.lower() == 'on':
             desiredStatus = 1
@@ -401,7 +818,7 @@ class Emote(commands.Cog):
             desiredStatus = 0
         else:
             desiredStatus = ''
-        currentStatus = (await db_execute(self.db, 'SELECT autopublish FROM emotelog WHERE guildID=?', ctx.guild.id))[0]
+        currentStatus = self.settings.get('emotelog', ctx.guild.id).autopublish
 
         # handle invalid argument
         if (option == '') or (desiredStatus == ''):
@@ -417,7 +834,7 @@ class Emote(commands.Cog):
             await ctx.send(f'Autopublish is already set to {statusStr}')
             return
         else:
-            await db_execute(self.db, "UPDATE emotelog SET autopublish=? WHERE guildID=?", desiredStatus, ctx.guild.id, exec_type='update')
+            await self.settings.update('emotelog', ctx.guild.id, autopublish=desiredStatus)
         
         await ctx.send(f'Autopublish is now set to {statusStr}')
 
@@ -441,8 +858,8 @@ class Emote(commands.Cog):
         create_expressions
         manage_channels
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
-        currentSourceChannelID = (await db_execute(self.db, 'SELECT sourceChannelID FROM emotelog WHERE guildID=?',ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        currentSourceChannelID = self.settings.get('emotelog', ctx.guild.id).sourceChannelID
         
         # handle empty
         if channel == '':
@@ -458,7 +875,7 @@ class Emote(commands.Cog):
             return
         
         if channel.lower() == 'disable':
-            await db_execute(self.db, 'UPDATE emotelog SET sourceChannelID=? WHERE guildID=?', 0, ctx.guild.id, exec_type='update')
+            await self.settings.update('emotelog', ctx.guild.id, sourceChannelID=0)
             await ctx.send('Source logging is now disabled')
             return
         
@@ -473,7 +890,7 @@ class Emote(commands.Cog):
             return
         
         # set channel
-        await db_execute(self.db, 'UPDATE emotelog SET sourceChannelID=? WHERE guildID=?', srcCh.id, ctx.guild.id, exec_type='update')
+        await self.settings.update('emotelog', ctx.guild.id, sourceChannelID=srcCh.id)
         await ctx.send(f'Source logging is now set to {srcCh.mention}. Emote sources will be logged there whenever `{prefix}emote add` is used.')
 
 
@@ -499,13 +916,14 @@ class Emote(commands.Cog):
         manage_messages
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
-        logChID, updateMsg, updateMsgSt = await db_execute(self.db, 'SELECT logChannelID, updateMessage, updateMessageStickers FROM emotelog WHERE guildID=?', ctx.guild.id)
+        logChID = self.settings.get('emotelog', ctx.guild.id).logChannelID
         logChannel = discord.utils.get(ctx.guild.channels, id=int(logChID))
+        pending = self.pending.get(ctx.guild.id)
 
         if logChID:
-            if updateMsg or updateMsgSt:
+            if pending[pendinglog.EMOJI] or pending[pendinglog.STICKER]:
                 hdr = custom_header if custom_header else ''
                 await self._send_update(ctx.guild.id, header=hdr)
                 await ctx.send(f"Emote log has been updated in {logChannel.mention}")
@@ -535,31 +953,22 @@ class Emote(commands.Cog):
         manage_messages
         """
 
-        updateMsg, updateMsgStick = await db_execute(self.db, 'SELECT updateMessage, updateMessageStickers FROM emotelog WHERE guildID=?', ctx.guild.id)
+        pending = self.pending.get(ctx.guild.id)
+        updateMsgs, stickerPosts = self._log_posts(ctx.guild.id, pending)
 
-        if (updateMsg == '') and (updateMsgStick == ''):
+        if (not updateMsgs) and (not stickerPosts):
             await ctx.send('There is currently no awaiting log update')
             return
         
-        if updateMsg:
+        if updateMsgs:
             hdr = f'**Added:**'
             await ctx.send(hdr)
-            await ctx.send(updateMsg)
+            for updateMsg in updateMsgs:
+                await ctx.send(updateMsg)
 
         # handle stickers
-        if updateMsgStick:
-            stickers = []
-            stickerCount = 0
-            for stickerID in updateMsgStick.split(' '):
-                sticker = self.bot.get_sticker(int(stickerID))
-                stickers.append(sticker)
-                stickerCount += 1
-                if stickerCount >= 3:
-                    await ctx.send(stickers=stickers)
-                    stickers = []
-                    stickerCount = 0
-            if stickers:
-                await ctx.send(stickers=stickers)
+        for stickers in stickerPosts:
+            await ctx.send(stickers=stickers)
 
 
     @emotelog.command(
@@ -583,11 +992,11 @@ class Emote(commands.Cog):
         manage_messages
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
-        logChID = (await db_execute(self.db, 'SELECT logChannelID FROM emotelog WHERE guildID=?', ctx.guild.id))[0]
+        logChID = self.settings.get('emotelog', ctx.guild.id).logChannelID
         if logChID:
-            await db_execute(self.db, 'UPDATE emotelog SET logChannelID=? WHERE guildID=?', 0, ctx.guild.id, exec_type='update')
+            await self.settings.update('emotelog', ctx.guild.id, logChannelID=0)
             await ctx.send(f"Emote logging has been disabled. To re-enable, use `{prefix}emote log <#channel>`")
         else:
             await ctx.send("Emote logging is already disabled")
@@ -620,42 +1029,60 @@ class Emote(commands.Cog):
 
     async def _reset(self, guild_id):
         """Resets message data"""
-        await db_execute(self.db, 'UPDATE emotelog SET updateMessage=?, updateMessageStickers=?, messageColumnCount=?, messageRowCount=? WHERE guildID=?', "", "", 0, 0, guild_id, exec_type='update')
+        await self.pending.clear(guild_id)
+        self.logSchedule.cancel(guild_id)
+
+
+    def _log_posts(self, guild_id, pending):
+        """Build the emote grid messages and the sticker groups of a pending log"""
+        maxCol, maxRow = self.settings.get('emotelog', guild_id).maxCol, self.settings.get('emotelog', guild_id).maxRow
+        emotes = [str(emoji) for emoji in map(self.bot.get_emoji, pending[pendinglog.EMOJI]) if emoji is not None]
+        stickers = [sticker for sticker in map(self.bot.get_sticker, pending[pendinglog.STICKER]) if sticker is not None]
+        updateMsgs = pendinglog.grid(emotes, maxCol, maxRow)
+        stickerPosts = [stickers[i:i+3] for i in range(0, len(stickers), 3)]
+        return updateMsgs, stickerPosts
             
     
     async def _send_update(self, guild_id, header=''):
         """Update the emote log"""
 
-        logChID, updateMsg, updateMsgStick, autopublish = await db_execute(self.db, 'SELECT logChannelID, updateMessage, updateMessageStickers, autopublish FROM emotelog WHERE guildID=?', guild_id)
+        settings = self.settings.get('emotelog', guild_id)
+        logChID, autopublish = settings.logChannelID, settings.autopublish
+        if not logChID:
+            return
+        guild = self.bot.get_guild(guild_id)
+        channel = discord.utils.get(guild.channels, id=logChID) if guild is not None else None
+        if channel is None: # left the guild or channel deleted, the log stays pending
+            return
 
-        if logChID:
-            guild = self.bot.get_guild(guild_id)
-            channel = discord.utils.get(guild.channels, id=logChID)
-            hdr = f'**{header}**' if header else '**Added:**'
-            msg1 = await channel.send(hdr)
-            if updateMsg:
-                msg2 = await channel.send(updateMsg)
-                if (autopublish) and (channel.type == discord.ChannelType.news):
-                    await msg1.publish()
-                    await asyncio.sleep(5)
-                    await msg2.publish()
-
-            # handle stickers
-            if updateMsgStick:
-                stickers = []
-                stickerCount = 0
-                for stickerID in updateMsgStick.split(' '):
-                    sticker = self.bot.get_sticker(int(stickerID))
-                    stickers.append(sticker)
-                    stickerCount += 1
-                    if stickerCount >= 3:
-                        await channel.send(stickers=stickers)
-                        stickers = []
-                        stickerCount = 0
-                if stickers:
-                    await channel.send(stickers=stickers)
+        # take the awaiting update and reset it in one go, so emotes added while posting
+        # go to the next update instead of being reset. If posting fails, it is put back.
+        snapshot = self.pending.snapshot(guild_id)
+        pending = await self.pending.take(guild_id)
+        self.logSchedule.cancel(guild_id)
 
-            await self._reset(guild_id)
+        updateMsgs, stickerPosts = self._log_posts(guild_id, pending)
+        hdr = f'**{header}**' if header else '**Added:**'
+        publish = (autopublish) and (channel.type == discord.ChannelType.news)
+        try:
+            async with self.logDispatcher.channel(logChID):
+                msg1 = await channel.send(hdr)
+                for updateMsg in updateMsgs:
+                    msg2 = await channel.send(updateMsg)
+                    # publishes wait for the channel publish limit in the background
+                    if publish:
+                        if msg1 is not None:
+                            self.logDispatcher.publish(msg1)
+                            msg1 = None
+                        self.logDispatcher.publish(msg2)
+
+                # handle stickers
+                for stickers in stickerPosts:
+                    await channel.send(stickers=stickers)
+        except BaseException: # also when cancelled, ex: cog unload while posting
+            await self.pending.restore(guild_id, snapshot)
+            self.logSchedule.schedule(guild_id, self.logInterval)
+            raise
 
 
     # -------------------------------------------------
@@ -684,6 +1111,8 @@ class Emote(commands.Cog):
         ↳ Delete the display in the display channel and cease display updates.
         `{prefix}emote display [col | row] <number>`
         ↳ Set the display max columns and rows per message. Note: Setting a total of more than 30 emotes per message may shrink the emotes.
+        `{prefix}emote display image (<server ID>) [(static) (animated) | (all)]`
+        ↳ Post the gallery as images of the emotes with their names, 100 emotes per image.
         """
         
         await self._emotedisplay(ctx, *args)
@@ -692,7 +1121,7 @@ class Emote(commands.Cog):
     async def _emotedisplay(self, ctx, *args):
         """Produces a gallery for the emotes in this server"""
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         emoteBools = {'static':True, 'animated':True, 'sticker':False, 'stickers':False} # redundancy on "sticker(s)"
         emoteSelection = ['static', 'animated', 'sticker', 'stickers', 'all']
@@ -749,51 +1178,37 @@ class Emote(commands.Cog):
             guild = ctx.guild
 
         # now post selected emotes
-        emotes = []
-        aemotes = []
-        stickers = []
-        for emoji in guild.emojis:
-            if emoji.animated:
-                aemotes.append("<a:{0}:{1}>".format(emoji.name, emoji.id))
-            else:
-                emotes.append("<:{0}:{1}>".format(emoji.name, emoji.id))
-        for sticker in guild.stickers:
-            stickers.append(sticker)
+        animatedCount = sum(1 for emoji in guild.emojis if emoji.animated)
+        stickers = list(guild.stickers)
 
         # confirm continue in case of many emotes
-        if (ctx.invoked_with == 'channel') or (ctx.invoked_with == 'autoupdate'):
-            pass
-        else:
-            totEmotes = 0
-            if emoteBools['static']:
-                totEmotes += len(emotes)
-            if emoteBools['animated']:
-                totEmotes += len(aemotes)
-            if (emoteBools['sticker']) or (emoteBools['stickers']):
-                totEmotes += len(stickers)
-            if totEmotes > 100:
-                confirmation_message = await ctx.reply(f"There are {totEmotes} emotes/stickers to display. Continue?", delete_after=65)
-                await confirmation_message.add_reaction('<a:ahaerinnodders:1147403485722193920>')
-                await confirmation_message.add_reaction('<a:ahaerinnopers:1147403691977080845>')
-                def check(reaction, user):
-                    return user == ctx.author and str(reaction.emoji) in ['<a:ahaerinnodders:1147403485722193920>', '<a:ahaerinnopers:1147403691977080845>']
-                try:
-                    reaction, user = await self.bot.wait_for("reaction_add", timeout=60, check=check)
-                    if str(reaction.emoji) == '<a:ahaerinnodders:1147403485722193920>':
-                        await confirmation_message.delete()
-                    elif str(reaction.emoji) == '<a:ahaerinnopers:1147403691977080845>':
-                        await confirmation_message.delete()
-                        await ctx.reply('Display was cancelled', delete_after=10)
-                        return
-                except asyncio.TimeoutError:
+        totEmotes = 0
+        if emoteBools['static']:
+            totEmotes += len(guild.emojis) - animatedCount
+        if emoteBools['animated']:
+            totEmotes += animatedCount
+        if (emoteBools['sticker']) or (emoteBools['stickers']):
+            totEmotes += len(stickers)
+        if totEmotes > 100:
+            confirmation_message = await ctx.reply(f"There are {totEmotes} emotes/stickers to display. Continue?", delete_after=65)
+            await confirmation_message.add_reaction('<a:ahaerinnodders:1147403485722193920>')
+            await confirmation_message.add_reaction('<a:ahaerinnopers:1147403691977080845>')
+            def check(reaction, user):
+                return user == ctx.author and str(reaction.emoji) in ['<a:ahaerinnodders:1147403485722193920>', '<a:ahaerinnopers:1147403691977080845>']
+            try:
+                reaction, user = await self.bot.wait_for("reaction_add", timeout=60, check=check)
+                if str(reaction.emoji) == '<a:ahaerinnodders:1147403485722193920>':
+                    await confirmation_message.delete()
+                elif str(reaction.emoji) == '<a:ahaerinnopers:1147403691977080845>':
+                    await confirmation_message.delete()
+                    await ctx.reply('Display was cancelled', delete_after=10)
                     return
+            except asyncio.TimeoutError:
+                return
         
-        # formatting control
-        maxCol, maxRow = await db_execute(self.db, 'SELECT maxCol, maxRow FROM emotedisplay WHERE guildID = ?', ctx.guild.id)
-        column_counter = 0
-        row_counter = 0
-        this_message = ""
-        totalMessageCount = 0
+        # the layout is cached until the emotes of the guild change
+        settings = self.settings.get('emotedisplay', ctx.guild.id)
+        messages = self.layouts.get(guild, settings.maxCol, settings.maxRow, static=emoteBools['static'], animated=emoteBools['animated'])
 
         async def checked_send(ctx, message=None, stickers=None):
             if ctx.author.guild_permissions.manage_expressions:
@@ -807,62 +1222,16 @@ class Emote(commands.Cog):
                 elif stickers:
                     await ctx.author.send('Discord has not allowed bots to send stickers outside of the server yet...', delete_after=20)
 
-        # display static emotes
-        if emoteBools['static']:
-            for emoji in emotes:
-                
-                this_message += emoji
-                column_counter += 1
-                
-                if column_counter >= maxCol:
-                    column_counter = 0
-                    row_counter += 1
-                    this_message += '\n'
-                
-                if row_counter >= maxRow:
-                    row_counter = 0
-                    await checked_send(ctx, this_message)
-                    totalMessageCount += 1
-                    this_message = ""
-
-            await checked_send(ctx, this_message)
-            column_counter = 0
-            row_counter = 0
-            this_message = ""
-            totalMessageCount += 1
-
-        # display animated emotes
-        if emoteBools['animated']:
-            if emoteBools['static']:
-                await checked_send(ctx, "<:blank:1144405351333113886>")
-                totalMessageCount += 1
-            for emoji in aemotes:
-                
-                this_message += emoji
-                column_counter += 1
-
-                if column_counter >= maxCol:
-                    column_counter = 0
-                    row_counter += 1
-                    this_message += '\n'
-                
-                if row_counter >= maxRow:
-                    row_counter = 0
-                    await checked_send(ctx, this_message)
-                    totalMessageCount += 1
-                    this_message = ""
-
-            await checked_send(ctx, this_message)
-            totalMessageCount += 1
-            this_message = ""
+        for message in messages:
+            await checked_send(ctx, message)
 
         # display stickers
         if emoteBools['sticker'] or emoteBools['stickers']:
             if guild.id != ctx.guild.id:
                 await ctx.reply('Discord has not allowed bots to send external stickers yet...', delete_after=20)
             else:
-                if (emoteBools['static']) or (emoteBools['animated']):
-                    await checked_send(ctx, "<:blank:1144405351333113886>")
+                if messages:
+                    await checked_send(ctx, emotedisplay.BLANK)
                 stickerPost = []
                 stickerCount = 0
                 stickerLimit = 3
@@ -877,12 +1246,101 @@ class Emote(commands.Cog):
                         stickerCount = 0
                 if stickerPost:
                     await checked_send(ctx, stickers=stickerPost)
-        
-        # update count for display channel
-        if (ctx.invoked_with == 'channel') or (ctx.invoked_with == 'autoupdate'):
-            await db_execute(self.db, 'UPDATE emotedisplay SET messageCount=? WHERE guildID=?', totalMessageCount, ctx.guild.id, exec_type='update')
 
     
+    @emotedisplay.command(
+        name='image'
+    )
+    async def emotedisplay_image(self, ctx, *args):
+        """
+        Command: **emote display image**
+
+        Post a gallery of this server's emotes, or of another server if given, as images with the emote names. A few images instead of a message per row of emotes. Animated emotes show their first frame.
+
+        __Usage:__
+        `{prefix}emote display image (<server ID>) [(static) (animated) | (all)]`
+        ↳ Default displays static and animated. Sent via DM if user does not have manage_expressions permission.
+        """
+
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        guild = ctx.guild
+        if args and args[0].isdigit():
+            guild = self.bot.get_guild(int(args[0]))
+            if guild is None:
+                raise ValueError(f'Haerin Bot is not in server with server ID "{args[0]}"')
+            args = args[1:]
+        selection = {arg.lower() for arg in args}
+        if selection - {'static', 'animated', 'all'}:
+            raise ValueError(f'Did not understand emote type input. Use `{prefix}emote display image (<server id>) [(static) (animated) | (all)]`')
+        static = (not selection) or bool(selection & {'static', 'all'})
+        animated = (not selection) or bool(selection & {'animated', 'all'})
+
+        emojis = [emoji for emoji in guild.emojis if (static and not emoji.animated) or (animated and emoji.animated)]
+        if not emojis:
+            await ctx.send('There are no emotes to display')
+            return
+
+        async with ctx.typing():
+            sheets = await self._render_sheets(emojis)
+
+        # as few messages as possible: up to 10 files each, under the upload size limit
+        destination = ctx if ctx.author.guild_permissions.manage_expressions else ctx.author
+        sizeLimit = ctx.guild.filesize_limit
+        batches = [[]]
+        for sheet in sheets:
+            batch = batches[-1]
+            if batch and ((len(batch) >= 10) or (sum(map(len, batch)) + len(sheet) > sizeLimit)):
+                batches.append([sheet])
+            else:
+                batch.append(sheet)
+        posted = 0
+        for batch in batches:
+            files = [discord.File(BytesIO(sheet), filename=f'{guild.name}_emotes_{posted + i + 1}.png') for i, sheet in enumerate(batch)]
+            await destination.send(content=f'**{guild.name}** emotes ({len(emojis)})' if posted == 0 else None, files=files)
+            posted += len(batch)
+
+    async def _render_sheets(self, emojis):
+        """
+        Render the sprite sheets of emotes, in the image process pool.
+
+        Tiles and sheets are kept in the asset cache, so only the tiles of new or renamed emotes
+        are drawn and only the sheets that changed are pasted again. An emote that can't be
+        downloaded gets a tile with its name only, not cached, so the next render tries again.
+
+        Returns
+        -------
+        sheets : list
+            The sheet PNGs, SHEET_COLUMNS x SHEET_ROWS emotes each.
+        """
+        async def tile(emoji):
+            # (tile, cacheable)
+            key = emotedisplay.tile_key(emoji)
+            data = await self.bot.assets.get(key)
+            if data is not None:
+                return data, True
+            try:
+                image = await self.bot.assets.fetch(f'emoji:{emoji.id}', emoji.read)
+            except Exception as e:
+                logger.error(f"Downloading emoji {emoji.id} for a sprite sheet failed: {e}")
+                return await self.bot.images.tile(None, emoji.name), False
+            data = await self.bot.images.tile(image, emoji.name)
+            await self.bot.assets.put(data, key)
+            return data, True
+
+        async def sheet(emojis):
+            key = emotedisplay.sheet_key(emojis, emotedisplay.SHEET_COLUMNS)
+            data = await self.bot.assets.get(key)
+            if data is not None:
+                return data
+            tiles = await asyncio.gather(*map(tile, emojis))
+            data = await self.bot.images.sheet([data for data, _ in tiles], emotedisplay.SHEET_COLUMNS)
+            if all(cacheable for _, cacheable in tiles):
+                await self.bot.assets.put(data, key)
+            return data
+
+        perSheet = emotedisplay.SHEET_COLUMNS * emotedisplay.SHEET_ROWS
+        return await asyncio.gather(*(sheet(emojis[i:i+perSheet]) for i in range(0, len(emojis), perSheet)))
+
     @emotedisplay.command(
         name='channel'
     )
@@ -903,8 +1361,8 @@ class Emote(commands.Cog):
         manage_channels
         manage_messages
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
-        currentDisplayChannelID = (await db_execute(self.db, 'SELECT displayChannelID FROM emotedisplay WHERE guildID=?',ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        currentDisplayChannelID = self.settings.get('emotedisplay', ctx.guild.id).displayChannelID
         
         # handle empty
         if channel == '':
@@ -929,14 +1387,10 @@ class Emote(commands.Cog):
             raise ValueError('Invalid channel.')
             return
         
-        # set channel
-        await db_execute(self.db, 'UPDATE emotedisplay SET displayChannelID=? WHERE guildID=?', disCh.id, ctx.guild.id, exec_type='update')
-
-        # display
-        new_ctx = await self.bot.get_context(ctx.message, cls=commands.Context)
-        new_ctx.channel = disCh
-        new_ctx.invoked_with = 'channel'
-        await new_ctx.invoke(self.emotedisplay)
+        # remove the current display, then set channel and display
+        await self._display_remove(ctx.guild)
+        await self.settings.update('emotedisplay', ctx.guild.id, displayChannelID=disCh.id)
+        await self._display_sync(ctx.guild)
 
         await ctx.send(f'Emote display and auto updates are now enabled in {disCh.mention}')
 
@@ -961,12 +1415,12 @@ class Emote(commands.Cog):
         manage_messages
         """
 
-        currentDisChID, msgCount = await db_execute(self.db, 'SELECT displayChannelID, messageCount FROM emotedisplay WHERE guildID=?', ctx.guild.id)
+        currentDisChID = self.settings.get('emotedisplay', ctx.guild.id).displayChannelID
 
         if currentDisChID:
             disCh = discord.utils.get(ctx.guild.channels, id=int(currentDisChID))
-            await disCh.purge(limit=msgCount, check=self.is_bot)
-            await db_execute(self.db, 'UPDATE emotedisplay SET displayChannelID=? WHERE guildID=?', 0, ctx.guild.id, exec_type='update')
+            await self._display_remove(ctx.guild)
+            await self.settings.update('emotedisplay', ctx.guild.id, displayChannelID=0)
             await ctx.send(f'Emote display updating is now disabled, the gallery has been removed in {disCh.mention}')
         else:
             await ctx.send('Emote display updating is already disabled')
@@ -991,7 +1445,7 @@ class Emote(commands.Cog):
         manage_channels
         manage_messages
         """
-        await db_execute(self.db, 'UPDATE emotedisplay SET maxRow=? WHERE guildID=?', number, ctx.guild.id, exec_type='update')
+        await self.settings.update('emotedisplay', ctx.guild.id, maxRow=number)
         await ctx.send(f'The max rows for emote displaying is now set to {number}')
 
 
@@ -1014,31 +1468,114 @@ class Emote(commands.Cog):
         manage_channels
         manage_messages
         """
-        await db_execute(self.db, 'UPDATE emotedisplay SET maxCol=? WHERE guildID=?', number, ctx.guild.id, exec_type='update')
+        await self.settings.update('emotedisplay', ctx.guild.id, maxCol=number)
         await ctx.send(f'The max columns for emote displaying is now set to {number}')
     
-    async def _display_update(self, guild):
-        """Update the display"""
+    async def _display_update(self, guild_id):
+        """Update the display, DISPLAY_DEBOUNCE after the last emote change of a guild"""
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None:
+            await self._display_sync(guild)
 
-        await asyncio.sleep(5)
-        disChID, msgCount = await db_execute(self.db, 'SELECT displayChannelID, messageCount FROM emotedisplay WHERE guildID=?', guild.id)
+    def _display_channel(self, guild):
+        disChID = self.settings.get('emotedisplay', guild.id).displayChannelID
+        return discord.utils.get(guild.channels, id=int(disChID)) if disChID else None
 
-        if disChID:
-            disCh = discord.utils.get(guild.channels, id=int(disChID))
-            
-            async for msg in disCh.history(limit=100):
-                if msg.author == self.bot.user:
-                    lastMsg = msg
-                    break
-            else:
-                return
-            
-            new_ctx = await self.bot.get_context(lastMsg, cls=commands.Context)
-            await disCh.purge(limit=msgCount, check=self.is_bot)
+    async def _display_sync(self, guild):
+        """
+        Bring the display channel of a guild up to date with its emotes.
+
+        Only the messages whose text changed are edited, new ones are appended and extra ones
+        deleted. If a display message was deleted by hand, the display is posted again. If
+        cancelled midway, what was posted so far is recorded, so the next update picks up from it.
+        """
+        disCh = self._display_channel(guild)
+        if disCh is None:
+            return
+        async with self._displayLocks.setdefault(guild.id, asyncio.Lock()):
+            settings = self.settings.get('emotedisplay', guild.id)
+            new = self.layouts.get(guild, settings.maxCol, settings.maxRow)
+            channelID, messageIDs, texts = self.bot.displays.get(guild.id)
+            if messageIDs and (channelID != disCh.id):
+                # the display channel changed, the old display goes
+                await self._display_delete(discord.utils.get(guild.channels, id=channelID), messageIDs)
+                messageIDs, texts = [], []
+            if (not messageIDs) and settings.messageCount:
+                # a display posted before its message IDs were kept, replaced once
+                await disCh.purge(limit=settings.messageCount, check=self.is_bot)
+                await self.settings.update('emotedisplay', guild.id, defer=True, messageCount=0)
+
+            try:
+                try:
+                    edits, appends, deletes = emotedisplay.diff(texts, new)
+                    for i, text in edits:
+                        await disCh.get_partial_message(messageIDs[i]).edit(content=text)
+                        texts[i] = text
+                    if deletes:
+                        await self._display_delete(disCh, messageIDs[len(new):])
+                        del texts[len(new):], messageIDs[len(new):]
+                except discord.NotFound:
+                    await self._display_delete(disCh, messageIDs)
+                    texts, messageIDs, appends = [], [], new
+                for text in appends:
+                    messageIDs.append((await disCh.send(text)).id)
+                    texts.append(text)
+            finally:
+                await self.bot.displays.set(guild.id, disCh.id, messageIDs, texts)
+
+    async def _display_delete(self, disCh, messageIDs):
+        """
+        Delete display messages by ID, skipping the ones already deleted.
 
-            new_ctx.channel = disCh
-            new_ctx.invoked_with = 'autoupdate'
-            await new_ctx.invoke(self.emotedisplay)
+        Messages less than 14 days old are deleted in bulk, 100 per call. Older ones (and a bulk
+        delete that fails, ex: missing manage_messages) are deleted one at a time.
+        """
+        if (disCh is None) or (not messageIDs):
+            return
+        cutoff = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(days=13))
+        recent = [messageID for messageID in messageIDs if messageID > cutoff]
+        single = [messageID for messageID in messageIDs if messageID <= cutoff]
+        for i in range(0, len(recent), 100):
+            batch = recent[i:i+100]
+            try:
+                await disCh.delete_messages([discord.Object(id=messageID) for messageID in batch])
+            except discord.HTTPException:
+                single += batch
+        for messageID in single:
+            try:
+                await disCh.get_partial_message(messageID).delete()
+            except discord.NotFound:
+                pass
+
+    async def _display_remove(self, guild):
+        """Delete the display of a guild from its channel"""
+        self.displayDebounce.cancel(guild.id)
+        async with self._displayLocks.setdefault(guild.id, asyncio.Lock()):
+            settings = self.settings.get('emotedisplay', guild.id)
+            channelID, messageIDs, _ = self.bot.displays.get(guild.id)
+            if messageIDs:
+                await self._display_delete(discord.utils.get(guild.channels, id=channelID), messageIDs)
+            elif settings.messageCount and (self._display_channel(guild) is not None):
+                await self._display_channel(guild).purge(limit=settings.messageCount, check=self.is_bot)
+            await self.bot.displays.clear(guild.id)
+            if settings.messageCount:
+                await self.settings.update('emotedisplay', guild.id, messageCount=0)
+
+    async def _display_reconcile(self):
+        """
+        Match the recorded display messages with the display settings at startup: remove the
+        displays of disabled channels, forget the ones of guilds the bot left, and update the
+        others with the emote changes made while the bot was offline.
+        """
+        for guildID in self.bot.displays.guilds():
+            guild = self.bot.get_guild(guildID)
+            if guild is None:
+                await self.bot.displays.clear(guildID)
+            elif not self.settings.get('emotedisplay', guildID).displayChannelID:
+                await self._display_remove(guild)
+        for guild in self.bot.guilds:
+            if self.settings.get('emotedisplay', guild.id).displayChannelID:
+                self.displayDebounce.trigger(guild.id)
 
 
     # -------------------------------------------------
@@ -1046,95 +1583,81 @@ class Emote(commands.Cog):
     # -------------------------------------------------
 
 
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        """Index the emotes of a new guild for emote similar and duplicate checks"""
+        self._hash_guild(guild)
+
     @commands.Cog.listener()
     async def on_guild_emojis_update(self, guild, before, after):
         """Records added emotes for the emote log"""
 
-        updateMsg, msgCol, msgRow, maxCol, maxRow = await db_execute(self.db, 'SELECT updateMessage, messageColumnCount, messageRowCount, maxCol, maxRow FROM emotelog WHERE guildID=?', guild.id)
+        # the log state is in memory, its writes are batched by the write-behind queue
+        sendNow = False
+        beforeIDs = {emoji.id for emoji in before}
+        afterIDs = {emoji.id for emoji in after}
+        settings = self.settings.get('emotelog', guild.id)
 
         # handle added emote
-        added = len(after) > len(before)
-        removed = len(after) < len(before)
+        added = [emoji.id for emoji in after if emoji.id not in beforeIDs]
+        removed = [emoji.id for emoji in before if emoji.id not in afterIDs]
+
+        # keep the duplicate index up to date (emotes from emote add are already in)
+        for emojiID in removed:
+            await self.hashes.remove(guild.id, emojiID)
         if added:
-            added_emote = after[-1]
-            newMsg = str(updateMsg) + str(added_emote)
-            newCol = msgCol + 1
-
-            await db_execute(self.db, 'UPDATE emotelog SET updateMessage=?, messageColumnCount=? WHERE guildID=?', newMsg, newCol, guild.id, exec_type='update')
-
-            # formatting of emote log display
-            if newCol >= maxCol:
-                newMsg += "\n"
-                newCol = 0
-                newRow = msgRow + 1
-                await db_execute(self.db, 'UPDATE emotelog SET updateMessage=?, messageColumnCount=?, messageRowCount=? WHERE guildID=?', newMsg, newCol, newRow, guild.id, exec_type='update')
-
-                # if reached emote display limit, update now
-                if newRow >= maxRow:
-                    newRow = 0
-                    await db_execute(self.db, 'UPDATE emotelog SET messageRowCount=? WHERE guildID=?', newRow, guild.id, exec_type='update')
-                    await self._send_update(guild.id)
+            addedIDs = set(added)
+            task = asyncio.create_task(self._hash_emojis(guild, [emoji for emoji in after if emoji.id in addedIDs]))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        if added:
+            for emojiID in added:
+                pendingCount = await self.pending.add(guild.id, pendinglog.EMOJI, emojiID)
+            self.logSchedule.schedule(guild.id, self.logInterval)
+
+            # if reached emote display limit, update now
+            if pendingCount >= settings.maxCol * settings.maxRow:
+                sendNow = True
     
         # if emote is removed, take it out of the update message
         elif removed:
-            beforeSet = set(before)
-            afterSet = set(after)
-            removed_emote = list(beforeSet - afterSet)[0]
-            newMsg = str(updateMsg).replace(str(removed_emote),'')
-            if newMsg == updateMsg: # removed emote was not in log
-                return
-            else: # remove the emote from the log update message
-                if msgCol == 0:
-                    if msgRow == 0:
-                        newRow = msgRow
-                        newCol = msgCol
-                    else:
-                        newRow = msgRow - 1
-                        newCol = maxCol - 1
-                else:
-                    if msgRow == 0:
-                        newRow = msgRow
-                        newCol = msgCol - 1
-                    else:
-                        newRow = msgRow
-                        newCol = msgCol - 1
-                await db_execute(self.db, 'UPDATE emotelog SET updateMessage=?, messageColumnCount=?, messageRowCount=? WHERE guildID=?', newMsg, newCol, newRow, guild.id, exec_type='update')
+            wasPending = False
+            for emojiID in removed:
+                wasPending |= await self.pending.remove(guild.id, pendinglog.EMOJI, emojiID)
+            if wasPending and (self.pending.first_added(guild.id) is None):
+                self.logSchedule.cancel(guild.id)
+
+        if sendNow:
+            self.logDispatcher.submit(guild.id)
 
-        # emote display
-        await self._display_update(guild)
+        # emote display, once the burst of changes is over
+        if self.settings.get('emotedisplay', guild.id).displayChannelID:
+            self.displayDebounce.trigger(guild.id)
 
 
     @commands.Cog.listener()
     async def on_guild_stickers_update(self, guild, before, after):
         """Add/remove stickers to log update"""
 
-        updateMsgSt = (await db_execute(self.db, 'SELECT updateMessageStickers FROM emotelog WHERE guildID=?', guild.id))[0]
-
+        beforeIDs = {sticker.id for sticker in before}
+        afterIDs = {sticker.id for sticker in after}
         # handle added sticker
-        added = len(after) > len(before)
-        removed = len(after) < len(before)
-        if added:
-            added_sticker = after[-1]
-            stickerID = added_sticker.id
-            updateList = str(updateMsgSt) + ' ' + str(stickerID) if updateMsgSt else str(stickerID)
-            await db_execute(self.db, 'UPDATE emotelog SET updateMessageStickers=? WHERE guildID=?', updateList, guild.id, exec_type='update')
+        for stickerID in afterIDs - beforeIDs:
+            await self.pending.add(guild.id, pendinglog.STICKER, stickerID)
+            self.logSchedule.schedule(guild.id, self.logInterval)
         
         # if sticker is removed, take it out of the update message
-        elif removed:
-            beforeSet = set([sticker.id for sticker in before])
-            afterSet = set([sticker.id for sticker in after])
-            removed_sticker = list(beforeSet - afterSet)[0]
-            newUpdateList = str(updateMsgSt).replace(str(removed_sticker),'').replace('  ', ' ')
-            await db_execute(self.db, 'UPDATE emotelog SET updateMessageStickers=? WHERE guildID=?', newUpdateList, guild.id, exec_type='update')
+        for stickerID in beforeIDs - afterIDs:
+            await self.pending.remove(guild.id, pendinglog.STICKER, stickerID)
+        if self.pending.first_added(guild.id) is None:
+            self.logSchedule.cancel(guild.id)
 
 
     # timed log update posts
-    @tasks.loop(minutes=30)
-    async def _timed_update(self):
-        """Update log every 30mins max"""
-        guildIDs = (await db_execute(self.db, 'SELECT guildID FROM emotelog WHERE updateMessage != ?',"", fetch='all'))
-        for guild_id in guildIDs:
-            await self._send_update(guild_id[0])
+    async def _timed_update(self, guild_id):
+        """Post the log of a guild EMOTELOG_INTERVAL after its first pending entry"""
+        if self.pending.first_added(guild_id) is not None:
+            self.logDispatcher.submit(guild_id)
 
 
     # -------------------------------------------------
@@ -1158,7 +1681,7 @@ class Emote(commands.Cog):
         # ends other instances
         not_timed_out = False
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
         version = configData['VERSION']
         owner = configData['AUTHOR']
         try:
@@ -5,7 +5,6 @@ from discord.errors import Forbidden
 import json
 import aiosqlite
 
-from utils.database import db_execute
 
 """This custom help command is a perfect replacement for the default one on any Discord Bot written in Discord.py!
 However, you must put "bot.remove_command('help')" in your bot, and the command must be in a cog for it to work.
@@ -87,6 +86,7 @@ class Help(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = configData["DATABASE"]
+        self.settings = bot.settings
 
     @commands.command(
             name='help',
@@ -107,7 +107,7 @@ class Help(commands.Cog):
         """
 	
 	# !SET THOSE VARIABLES TO MAKE THE COG FUNCTIONAL!
-        guildPrefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        guildPrefix = self.settings.get('config', ctx.guild.id).prefix
         prefix = guildPrefix
         version = configData['VERSION']
         owner = configData['AUTHOR']
@@ -2,8 +2,8 @@ import discord
 from discord.ext import commands
 import json
 # import aiosqlite
-import requests
-from utils.database import db_execute
+from utils.database import transaction
+from utils.download import DownloadError
 
 with open('config.json', 'r') as config_file:
     configData = json.load(config_file)
@@ -13,6 +13,7 @@ class Message(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = configData["DATABASE"]
+        self.settings = bot.settings
 
 
     @commands.command(
@@ -86,8 +87,9 @@ class Message(commands.Cog):
         Permissions:
         administrator
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
-        currentWelcomeChannelID, currentEmbedBool = await db_execute(self.db, 'SELECT welcomeChannelID, embedBool FROM message WHERE guildID=?',ctx.guild.id)
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        settings = self.settings.get('message', ctx.guild.id)
+        currentWelcomeChannelID, currentEmbedBool = settings.welcomeChannelID, settings.embedBool
 
         # handle empty input
         if not message:
@@ -128,8 +130,7 @@ class Message(commands.Cog):
             newEmbedBool = currentEmbedBool
 
         # set new channel, message, and embed bool
-        await db_execute(self.db, 'UPDATE message SET welcomeChannelID=?, welcomeMessage=?, embedBool=? WHERE guildID=?', 
-                             int(channel_id), message, int(newEmbedBool), ctx.guild.id, exec_type='update')
+        await self.settings.update('message', ctx.guild.id, welcomeChannelID=int(channel_id), welcomeMessage=message, embedBool=int(newEmbedBool))
         
         embStr = "with" if newEmbedBool else "without"
         await ctx.send(f'Welcome message has been set {embStr} embed and channel {channel.mention}!')
@@ -170,8 +171,8 @@ class Message(commands.Cog):
         Permissions:
         administrator
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
-        currentEmbedBool = (await db_execute(self.db, 'SELECT embedBool FROM message WHERE guildID=?',ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        currentEmbedBool = self.settings.get('message', ctx.guild.id).embedBool
 
         if currentEmbedBool:
             embed = "enabled"
@@ -202,7 +203,7 @@ class Message(commands.Cog):
         administrator
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         if text == '':
             raise ValueError(f'Invalid input. Did you mean `{prefix}welcome embed disable` or `{prefix}welcome embed reset title`?')
@@ -211,7 +212,7 @@ class Message(commands.Cog):
         if len(text) > 256:
             raise ValueError('Title can only be up to 256 characters.')
         
-        await db_execute(self.db, 'UPDATE message SET embedTitle=? WHERE guildID=?', text, ctx.guild.id, exec_type='update')
+        await self.settings.update('message', ctx.guild.id, embedTitle=text)
         await ctx.send('Welcome embed title is set')
 
     @welcome_embed.command(
@@ -239,7 +240,7 @@ class Message(commands.Cog):
         administrator
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         if color == '':
             raise ValueError(f'Invalid input. Did you mean `{prefix}welcome embed disable` or `{prefix}welcome embed reset color`?')
@@ -253,7 +254,7 @@ class Message(commands.Cog):
         except ValueError:
             raise ValueError('Invalid color input.')
         
-        await db_execute(self.db, 'UPDATE message SET embedColor=? WHERE guildID=?', newColor, ctx.guild.id, exec_type='update')
+        await self.settings.update('message', ctx.guild.id, embedColor=newColor)
         await ctx.send('Welcome embed color is set')
 
     @welcome_embed.command(
@@ -275,7 +276,7 @@ class Message(commands.Cog):
         administrator
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         if text == '':
             raise ValueError(f'Invalid input. Did you mean `{prefix}welcome embed disable` or `{prefix}welcome embed reset footer`?')
@@ -284,7 +285,7 @@ class Message(commands.Cog):
         if len(text) > 2048:
             raise ValueError('Footer can only be up to 2048 characters.')
         
-        await db_execute(self.db, 'UPDATE message SET embedFooter=? WHERE guildID=?', text, ctx.guild.id, exec_type='update')
+        await self.settings.update('message', ctx.guild.id, embedFooter=text)
         await ctx.send('Welcome embed footer is set')
 
     @welcome_embed.command(
@@ -306,7 +307,7 @@ class Message(commands.Cog):
         administrator
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         uploads = [source.url for source in ctx.message.attachments]
         if uploads:
@@ -322,13 +323,12 @@ class Message(commands.Cog):
 
         # test if image works
         try:
-            response = requests.get(image_url)
-            image = response.content
-        except:
+            await self.bot.downloader.check(image_url)
+        except DownloadError:
             raise ValueError('Input image was not found.')
             return
         
-        await db_execute(self.db, 'UPDATE message SET embedImage=? WHERE guildID=?', image_url, ctx.guild.id, exec_type='update')
+        await self.settings.update('message', ctx.guild.id, embedImage=image_url)
         await ctx.send('Welcome embed image is set')
 
     @welcome_embed.command(
@@ -350,7 +350,7 @@ class Message(commands.Cog):
         administrator
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
         uploads = [source.url for source in ctx.message.attachments]
         if uploads:
@@ -366,13 +366,12 @@ class Message(commands.Cog):
 
         # test if image works
         try:
-            response = requests.get(thumbnail_url)
-            thumbnail = response.content
-        except:
+            await self.bot.downloader.check(thumbnail_url)
+        except DownloadError:
             raise ValueError('Input image was not found.')
             return
         
-        await db_execute(self.db, 'UPDATE message SET embedthumbnail=? WHERE guildID=?', thumbnail_url, ctx.guild.id, exec_type='update')
+        await self.settings.update('message', ctx.guild.id, embedThumbnail=thumbnail_url)
         await ctx.send('Welcome embed thumbnail is set')
 
     @welcome_embed.command(
@@ -393,29 +392,31 @@ class Message(commands.Cog):
         Permissions:
         administrator
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
         invalid_options = []
         success_resets = []
         if options:
-            for option in options:
-                if option.lower() not in ['title', 'color', 'footer', 'image', 'thumbnail', 'all']:
-                    invalid_options.append(option)
-                    continue
-                if (option.lower() == 'title') or (option.lower() == 'all'):
-                    await db_execute(self.db,'UPDATE message SET embedTitle=? WHERE guildID=?', "", ctx.guild.id, exec_type='update')
-                    success_resets.append('title')
-                if (option.lower() == 'color') or (option.lower() == 'all'):
-                    await db_execute(self.db,'UPDATE message SET embedColor=? WHERE guildID=?', "#2fcc70", ctx.guild.id, exec_type='update')
-                    success_resets.append('color')
-                if (option.lower() == 'footer') or (option.lower() == 'all'):
-                    await db_execute(self.db,'UPDATE message SET embedFooter=? WHERE guildID=?', "", ctx.guild.id, exec_type='update')
-                    success_resets.append('footer')
-                if (option.lower() == 'image') or (option.lower() == 'all'):
-                    await db_execute(self.db,'UPDATE message SET embedImage=? WHERE guildID=?', "", ctx.guild.id, exec_type='update')
-                    success_resets.append('image')
-                if (option.lower() == 'thumbnail') or (option.lower() == 'all'):
-                    await db_execute(self.db,'UPDATE message SET embedThumbnail=? WHERE guildID=?', "", ctx.guild.id, exec_type='update')
-                    success_resets.append('thumbnail')
+            # reset all selected settings with one commit
+            async with transaction(self.db) as tx:
+                for option in options:
+                    if option.lower() not in ['title', 'color', 'footer', 'image', 'thumbnail', 'all']:
+                        invalid_options.append(option)
+                        continue
+                    if (option.lower() == 'title') or (option.lower() == 'all'):
+                        await self.settings.update('message', ctx.guild.id, tx=tx, embedTitle="")
+                        success_resets.append('title')
+                    if (option.lower() == 'color') or (option.lower() == 'all'):
+                        await self.settings.update('message', ctx.guild.id, tx=tx, embedColor="#2fcc70")
+                        success_resets.append('color')
+                    if (option.lower() == 'footer') or (option.lower() == 'all'):
+                        await self.settings.update('message', ctx.guild.id, tx=tx, embedFooter="")
+                        success_resets.append('footer')
+                    if (option.lower() == 'image') or (option.lower() == 'all'):
+                        await self.settings.update('message', ctx.guild.id, tx=tx, embedImage="")
+                        success_resets.append('image')
+                    if (option.lower() == 'thumbnail') or (option.lower() == 'all'):
+                        await self.settings.update('message', ctx.guild.id, tx=tx, embedThumbnail="")
+                        success_resets.append('thumbnail')
             if invalid_options:
                 await ctx.reply(f'Invalid settings: {" ".join(invalid_options)} were ignored', delete_after=20)
             if success_resets:
@@ -442,11 +443,11 @@ class Message(commands.Cog):
         Permissions:
         administrator
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
-        currentEmbedBool = (await db_execute(self.db, 'SELECT embedBool FROM message WHERE guildID=?',ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
+        currentEmbedBool = self.settings.get('message', ctx.guild.id).embedBool
 
         if currentEmbedBool:
-            await db_execute(self.db, 'UPDATE message SET embedBool=? WHERE guildID=?', 0, ctx.guild.id, exec_type='update')
+            await self.settings.update('message', ctx.guild.id, embedBool=0)
             msg = f'Embed has been disabled. To re-enable embed, add the parameter "embed" before the welcome message: `{prefix}welcome <#channel> embed <message>`'
         else:
             msg = f'Embed is already disabled.'
@@ -469,12 +470,11 @@ class Message(commands.Cog):
         Permissions:
         administrator
         """
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
 
-        welChID = (await db_execute(self.db, 'SELECT welcomeChannelID FROM message WHERE guildID=?',ctx.guild.id))[0]
+        welChID = self.settings.get('message', ctx.guild.id).welcomeChannelID
         if welChID:
-            await db_execute(self.db, 'UPDATE message SET welcomeChannelID=?, welcomeMessage=? WHERE guildID=?', 
-                             0, '', ctx.guild.id, exec_type='update')
+            await self.settings.update('message', ctx.guild.id, welcomeChannelID=0, welcomeMessage='')
             await ctx.send(f"Welcome has been disabled. To enable, use `{prefix}welcome <#channel> <message>`")
         else:
             await ctx.send(f"Welcome message is already disabled. To enable, use `{prefix}welcome <#channel> <message>`")
@@ -496,9 +496,10 @@ class Message(commands.Cog):
         administrator
         """
 
-        prefix = (await db_execute(self.db, 'SELECT prefix FROM config WHERE guildID=?', ctx.guild.id))[0]
+        prefix = self.settings.get('config', ctx.guild.id).prefix
         
-        welChID, welMsg = await db_execute(self.db, 'SELECT welcomeChannelID, welcomeMessage FROM message WHERE guildID=?',ctx.guild.id)
+        settings = self.settings.get('message', ctx.guild.id)
+        welChID, welMsg = settings.welcomeChannelID, settings.welcomeMessage
         if (not welChID) or (not welMsg):
             await ctx.send(f"Welcome message is disabled. To enable, use `{prefix}welcome <#channel> <message>`")
         
@@ -508,8 +509,8 @@ class Message(commands.Cog):
     async def _welcome_send(self, member, channel=''):
         """Send the welcome message"""
 
-        welChID, welMsg, embedBool, embedTitle, embedColor, embedFooter, embedImage, embedThumbnail = await db_execute(
-            self.db, 'SELECT welcomeChannelID, welcomeMessage, embedBool, embedTitle, embedColor, embedFooter, embedImage, embedThumbnail FROM message WHERE guildID=?',member.guild.id)
+        settings = self.settings.get('message', member.guild.id)
+        welChID, welMsg, embedBool, embedTitle, embedColor, embedFooter, embedImage, embedThumbnail = settings.welcomeChannelID, settings.welcomeMessage, settings.embedBool, settings.embedTitle, settings.embedColor, settings.embedFooter, settings.embedImage, settings.embedThumbnail
         if channel:
             welChID = channel[2:-1]
         if welChID:
@@ -20,6 +20,21 @@ PERMISSIONS_INT = "9332763524304"
 INVITE_URL = f"https://discord.com/api/oauth2/authorize?client_id=1144064286445019207&permissions={PERMISSIONS_INT}&scope=bot"
 CONFIG_PATH = os.path.join(HERE, 'config.json')
 DATABASE_PATH = os.path.join(HERE, 'data/haerin.db')
+DATABASE_READERS = 4
+WRITE_BEHIND_DELAY = 2 # seconds, 0 to disable the write-behind queue
+WRITE_BEHIND_MAX = 500
+EMOTELOG_INTERVAL = 30*60 # seconds from the first pending entry to the automatic log post
+EMOTELOG_WORKERS = 4 # emote logs of different guilds posted at the same time
+DOWNLOAD_MAX_BYTES = 8*1024*1024 # larger emote sources are not downloaded, smaller ones are shrunk to the emoji limits
+DOWNLOAD_TIMEOUT = 10 # seconds
+DOWNLOAD_CONCURRENCY = 4
+IMAGE_WORKERS = 2 # processes used to resize/convert emote images
+ASSET_CACHE_PATH = os.path.join(HERE, 'data/assets')
+ASSET_CACHE_MAX_BYTES = 256*1024*1024
+EMOJI_CREATE_CONCURRENCY = 1 # emoji creates running at the same time in a guild, they share one rate limit
+EMOTE_DUPLICATE_DISTANCE = 6 # emotes whose hashes differ by at most this many bits (of 64) are duplicates
+EMOTE_DUPLICATES = 'skip' # what emote add does with a duplicate upload, 'skip' or 'warn'
+DISPLAY_DEBOUNCE = 5 # seconds without emote changes before the display channel is updated
 _COGS_PATH = os.path.join(HERE, 'cogs')
 _COG_FILES = set(os.listdir(_COGS_PATH)) - {'__init__.py', '.hide', '__pycache__', '.DS_Store'}
 COGS = [f"cogs.{cog[:-3]}" for cog in _COG_FILES]
@@ -31,10 +46,6 @@ DATABASE_TABLES = {
     "emotelog" : {
         "guildID INTEGER PRIMARY KEY" : -1,
         "logChannelID INTEGER" : 0,
-        "updateMessage TEXT" : "''",
-        "updateMessageStickers TEXT" : "''",
-        "messageColumnCount INTEGER" : 0,
-        "messageRowCount INTEGER" : 0,
         "maxCol INTEGER" : 6,
         "maxRow INTEGER" : 5,
         "autopublish INTEGER" : 0,
@@ -142,6 +153,66 @@ if ("DATABASE" not in CONFIG) or (CONFIG["DATABASE"] != DATABASE_PATH):
     CONFIG["DATABASE"] = DATABASE_PATH
     UPDATE_CONFIG = True
 
+if ("DATABASE_READERS" not in CONFIG) or (CONFIG["DATABASE_READERS"] != DATABASE_READERS):
+    CONFIG["DATABASE_READERS"] = DATABASE_READERS
+    UPDATE_CONFIG = True
+
+if ("WRITE_BEHIND_DELAY" not in CONFIG) or (CONFIG["WRITE_BEHIND_DELAY"] != WRITE_BEHIND_DELAY):
+    CONFIG["WRITE_BEHIND_DELAY"] = WRITE_BEHIND_DELAY
+    UPDATE_CONFIG = True
+
+if ("WRITE_BEHIND_MAX" not in CONFIG) or (CONFIG["WRITE_BEHIND_MAX"] != WRITE_BEHIND_MAX):
+    CONFIG["WRITE_BEHIND_MAX"] = WRITE_BEHIND_MAX
+    UPDATE_CONFIG = True
+
+if ("EMOTELOG_INTERVAL" not in CONFIG) or (CONFIG["EMOTELOG_INTERVAL"] != EMOTELOG_INTERVAL):
+    CONFIG["EMOTELOG_INTERVAL"] = EMOTELOG_INTERVAL
+    UPDATE_CONFIG = True
+
+if ("EMOTELOG_WORKERS" not in CONFIG) or (CONFIG["EMOTELOG_WORKERS"] != EMOTELOG_WORKERS):
+    CONFIG["EMOTELOG_WORKERS"] = EMOTELOG_WORKERS
+    UPDATE_CONFIG = True
+
+if ("DOWNLOAD_MAX_BYTES" not in CONFIG) or (CONFIG["DOWNLOAD_MAX_BYTES"] != DOWNLOAD_MAX_BYTES):
+    CONFIG["DOWNLOAD_MAX_BYTES"] = DOWNLOAD_MAX_BYTES
+    UPDATE_CONFIG = True
+
+if ("DOWNLOAD_TIMEOUT" not in CONFIG) or (CONFIG["DOWNLOAD_TIMEOUT"] != DOWNLOAD_TIMEOUT):
+    CONFIG["DOWNLOAD_TIMEOUT"] = DOWNLOAD_TIMEOUT
+    UPDATE_CONFIG = True
+
+if ("DOWNLOAD_CONCURRENCY" not in CONFIG) or (CONFIG["DOWNLOAD_CONCURRENCY"] != DOWNLOAD_CONCURRENCY):
+    CONFIG["DOWNLOAD_CONCURRENCY"] = DOWNLOAD_CONCURRENCY
+    UPDATE_CONFIG = True
+
+if ("IMAGE_WORKERS" not in CONFIG) or (CONFIG["IMAGE_WORKERS"] != IMAGE_WORKERS):
+    CONFIG["IMAGE_WORKERS"] = IMAGE_WORKERS
+    UPDATE_CONFIG = True
+
+if ("ASSET_CACHE_PATH" not in CONFIG) or (CONFIG["ASSET_CACHE_PATH"] != ASSET_CACHE_PATH):
+    CONFIG["ASSET_CACHE_PATH"] = ASSET_CACHE_PATH
+    UPDATE_CONFIG = True
+
+if ("ASSET_CACHE_MAX_BYTES" not in CONFIG) or (CONFIG["ASSET_CACHE_MAX_BYTES"] != ASSET_CACHE_MAX_BYTES):
+    CONFIG["ASSET_CACHE_MAX_BYTES"] = ASSET_CACHE_MAX_BYTES
+    UPDATE_CONFIG = True
+
+if ("EMOJI_CREATE_CONCURRENCY" not in CONFIG) or (CONFIG["EMOJI_CREATE_CONCURRENCY"] != EMOJI_CREATE_CONCURRENCY):
+    CONFIG["EMOJI_CREATE_CONCURRENCY"] = EMOJI_CREATE_CONCURRENCY
+    UPDATE_CONFIG = True
+
+if ("EMOTE_DUPLICATE_DISTANCE" not in CONFIG) or (CONFIG["EMOTE_DUPLICATE_DISTANCE"] != EMOTE_DUPLICATE_DISTANCE):
+    CONFIG["EMOTE_DUPLICATE_DISTANCE"] = EMOTE_DUPLICATE_DISTANCE
+    UPDATE_CONFIG = True
+
+if ("EMOTE_DUPLICATES" not in CONFIG) or (CONFIG["EMOTE_DUPLICATES"] != EMOTE_DUPLICATES):
+    CONFIG["EMOTE_DUPLICATES"] = EMOTE_DUPLICATES
+    UPDATE_CONFIG = True
+
+if ("DISPLAY_DEBOUNCE" not in CONFIG) or (CONFIG["DISPLAY_DEBOUNCE"] != DISPLAY_DEBOUNCE):
+    CONFIG["DISPLAY_DEBOUNCE"] = DISPLAY_DEBOUNCE
+    UPDATE_CONFIG = True
+
 if ("COGS" not in CONFIG) or (CONFIG["COGS"] != COGS):
     CONFIG["COGS"] = COGS
     UPDATE_CONFIG = True
@@ -1,11 +1,23 @@
 import config
 import json
+import time
 import discord
 from discord.ext import commands
 # import aiosqlite
 
 
-from utils.database import createTable, db_execute
+from utils.database import open_pool, close_pool
+from utils.migrations import migrate
+from utils.settings import SettingsRepository
+from utils.writebehind import WriteBehindQueue
+from utils.emotelog import PendingLog
+from utils.emotehash import EmoteHashIndex
+from utils.emotesearch import EmoteNameIndex
+from utils.emotedisplay import DisplayMessages
+from utils.download import Downloader
+from utils.images import ImagePipeline
+from utils.assetcache import AssetCache
+from utils.rest import GuildRestScheduler
 import utils.bot_initialization as bot_init
 
 with open('config.json', 'r') as config_file:
@@ -13,6 +25,41 @@ with open('config.json', 'r') as config_file:
 
 logger = config.logging.getLogger("bot")
 
+class HaerinBot(commands.Bot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # batched writes of frequently updated state, None if disabled
+        self.writes = None
+        if configData["WRITE_BEHIND_DELAY"] > 0:
+            self.writes = WriteBehindQueue(configData["DATABASE"], delay=configData["WRITE_BEHIND_DELAY"], max_pending=configData["WRITE_BEHIND_MAX"])
+
+        # in-memory guild settings, pending emote logs, emote hashes and display messages, loaded in on_ready
+        self.settings = SettingsRepository(configData["DATABASE"], configData["DATABASE_TABLES"], writes=self.writes)
+        self.pending = PendingLog(configData["DATABASE"], writes=self.writes)
+        self.hashes = EmoteHashIndex(configData["DATABASE"], writes=self.writes)
+        self.displays = DisplayMessages(configData["DATABASE"])
+        # emote name search over all guilds, built in on_ready
+        self.names = EmoteNameIndex()
+        # on_ready fires again after every reconnect, the startup runs once
+        self.started = False
+
+        # disk cache of downloaded sources and emoji assets, and the shared HTTP session
+        self.assets = AssetCache(configData["ASSET_CACHE_PATH"], max_bytes=configData["ASSET_CACHE_MAX_BYTES"])
+        self.downloader = Downloader(max_bytes=configData["DOWNLOAD_MAX_BYTES"], timeout=configData["DOWNLOAD_TIMEOUT"], concurrency=configData["DOWNLOAD_CONCURRENCY"], cache=self.assets)
+        # emote image conversion, in worker processes
+        self.images = ImagePipeline(workers=configData["IMAGE_WORKERS"])
+        # per-guild pacing of bulk emoji REST calls
+        self.rest = GuildRestScheduler(concurrency=configData["EMOJI_CREATE_CONCURRENCY"])
+
+    async def close(self):
+        """Close the bot, the HTTP session and the image workers, flush the queued writes, then close the database connections"""
+        await super().close()
+        await self.downloader.close()
+        self.images.close()
+        if self.writes is not None:
+            await self.writes.stop()
+        await close_pool()
+
 # the main function
 def run():
 
@@ -32,23 +79,40 @@ def run():
 
     # -------------
 
-    bot = commands.Bot(command_prefix=bot_init.get_prefix, 
+    bot = HaerinBot(command_prefix=bot_init.get_prefix, 
                        intents=intents)
     bot.remove_command('help')
 
     @bot.event
     async def on_ready():
 
-        # initialize database - create all tables and update columns
-        db_tables = configData["DATABASE_TABLES"]
-        for table_name in db_tables.keys():
-            db_path = configData["DATABASE"]
-            default_values = db_tables[table_name]
-            await createTable(db_path, table_name, default_values)
+        # a reconnect: the state in memory is current (reloading it would race the queued writes)
+        if bot.started:
+            logger.info(f"Reconnected as {bot.user} to {len(bot.guilds)} guilds")
+            return
+        bot.started = True
+
+        start = time.perf_counter()
+
+        # open the database connection pool, kept open until the bot closes
+        pool = await open_pool(configData["DATABASE"], readers=configData["DATABASE_READERS"])
+
+        # initialize database - create all tables and update columns if the schema changed
+        await migrate(configData["DATABASE"], configData["DATABASE_TABLES"])
 
         # initialize all guilds if needed
-        for guild in bot.guilds:
-            await bot_init.initialize_database_per_guild(guild)
+        await bot_init.initialize_database(bot.guilds)
+
+        # load all guild settings into memory
+        await bot.settings.load()
+        await bot.pending.load()
+        await bot.hashes.load()
+        await bot.displays.load()
+
+        # index the emote names of all guilds for emote search, in a thread
+        indexStart = time.perf_counter()
+        await bot.names.rebuild(bot.emojis)
+        logger.info(f"Indexed {len(bot.names)} emote names in {time.perf_counter() - indexStart:.3f} s")
 
         # initialize extensions/cogs
         await bot_init.load_extensions(bot)
@@ -62,17 +126,34 @@ def run():
         await bot.change_presence(activity=activity)
 
         logger.info(f"User: {bot.user} (ID: {bot.user.id})")
+        logger.info(f"Database pool: {pool.stats()}")
+        logger.info(f"Startup took {time.perf_counter() - start:.3f} s for {len(bot.guilds)} guilds")
 
         print('- Haerin Bot is running '+'-'*50)
 
+    # keep the name search index up to date (added, removed and renamed emotes), from the
+    # start, so the events during the startup index build are replayed on it
+    @bot.listen('on_guild_emojis_update')
+    async def index_emoji_names(guild, before, after):
+        bot.names.update(before, after)
+
     @bot.event
     async def on_guild_join(guild):
         await bot_init.initialize_database_per_guild(guild)
+        await bot.settings.load_guild(guild.id)
+        bot_init.reset_cached_prefix(guild.id)
+        bot.names.update([], guild.emojis)
+
+    @bot.event
+    async def on_guild_remove(guild):
+        bot.settings.drop_guild(guild.id)
+        bot.names.update(guild.emojis, [])
+        bot_init.reset_cached_prefix(guild.id)
     
     @bot.event
     async def on_command_error(ctx, error):
         """Send a message if an input error occured"""
-        prefix = (await db_execute(configData['DATABASE'], 'SELECT prefix FROM config WHERE guildID = ?', ctx.guild.id))[0]
+        prefix = bot.settings.get('config', ctx.guild.id).prefix
         helpStr = f'Use `{prefix}help` for help'
         tooLong = '...' if len(str(error)) > 2000 else ''
         err = str(error)[:int(2000 - len(helpStr))]
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the bot runs from the repository root (config.json, logs/), run the tests the same way
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,58 @@
+import asyncio
+import hashlib
+import os
+
+from utils.assetcache import AssetCache
+
+
+def test_keys_share_objects_by_content(tmp_path):
+    async def run():
+        cache = AssetCache(str(tmp_path))
+        digest = await cache.put(b'image', key='https://x/a.png')
+        assert await cache.put(b'image', key='emoji:1') == digest
+        assert digest == hashlib.sha256(b'image').hexdigest()
+        assert await cache.get('https://x/a.png') == b'image'
+        assert await cache.get('emoji:1') == b'image'
+        assert await cache.get_hash(digest) == b'image'
+        assert await cache.get('emoji:2') is None
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert (stats['objects'], stats['bytes']) == (1, 5)
+    assert (stats['hits'], stats['misses']) == (2, 1)
+
+
+def test_least_recently_used_objects_are_evicted(tmp_path):
+    async def run():
+        cache = AssetCache(str(tmp_path), max_bytes=250)
+        await cache.put(b'a'*100, key='a')
+        await cache.put(b'b'*100, key='b')
+        await cache.get('a') # b is now the least recently used
+        await cache.put(b'c'*100, key='c')
+        found = {key : await cache.get(key) is not None for key in 'abc'}
+        return cache, found
+
+    cache, found = asyncio.run(run())
+    assert found == {'a' : True, 'b' : False, 'c' : True}
+    assert cache.stats()['bytes'] == 200
+    assert not os.path.exists(cache._key_path('b')) # dropped when looked up
+    assert not os.path.exists(cache._object_path(hashlib.sha256(b'b'*100).hexdigest()))
+
+
+def test_fetch_loads_once_and_survives_restarts(tmp_path):
+    loads = []
+    async def loader():
+        loads.append(1)
+        return b'data'
+
+    async def run():
+        cache = AssetCache(str(tmp_path))
+        assert await cache.fetch('emoji:1', loader) == b'data'
+        assert await cache.fetch('emoji:1', loader) == b'data'
+        restarted = AssetCache(str(tmp_path))
+        return await restarted.fetch('emoji:1', loader), restarted.stats()
+
+    data, stats = asyncio.run(run())
+    assert data == b'data'
+    assert len(loads) == 1
+    assert (stats['objects'], stats['bytes']) == (1, 4)
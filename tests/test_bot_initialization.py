@@ -0,0 +1,35 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import config
+import utils.bot_initialization as bot_init
+from utils.migrations import migrate
+
+
+def _select(path, query):
+    with sqlite3.connect(path) as db:
+        return db.execute(query).fetchall()
+
+
+def test_bootstrap_inserts_missing_rows_with_defaults(tmp_path, monkeypatch):
+    path = str(tmp_path / 'test.db')
+    monkeypatch.setitem(bot_init.configData, 'DATABASE', path)
+    monkeypatch.setitem(bot_init.configData, 'DATABASE_TABLES', config.DATABASE_TABLES)
+    guilds = [SimpleNamespace(id=guildID) for guildID in (1, 2, 3)]
+
+    async def run():
+        await migrate(path, config.DATABASE_TABLES)
+        with sqlite3.connect(path) as db:
+            db.execute("INSERT INTO config (guildID, prefix) VALUES (2, '!')")
+        first = await bot_init.initialize_database(guilds)
+        second = await bot_init.initialize_database(guilds + guilds) # repeated IDs are fine
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == {table : (2 if table == 'config' else 3) for table in config.DATABASE_TABLES}
+    assert second == {table : 0 for table in config.DATABASE_TABLES}
+    # defaults are stored as values, not as the quoted SQL literal
+    assert _select(path, 'SELECT guildID, prefix FROM config ORDER BY guildID') == [
+        (1, config.DEFAULT_PREFIX), (2, '!'), (3, config.DEFAULT_PREFIX)]
+    assert _select(path, 'SELECT maxCol, maxRow FROM emotelog WHERE guildID=1') == [(6, 5)]
@@ -0,0 +1,38 @@
+import asyncio
+
+from utils.database import ConnectionPool
+
+
+def test_cancelled_writer_rolls_back(tmp_path):
+    path = str(tmp_path / 'test.db')
+
+    async def run():
+        pool = ConnectionPool(path, readers=1)
+        await pool.open()
+        async with pool.writer() as db:
+            await db.execute('CREATE TABLE items (key TEXT PRIMARY KEY)')
+            await db.commit()
+
+        started = asyncio.Event()
+        async def write():
+            async with pool.writer() as db:
+                await db.execute("INSERT INTO items VALUES ('a')")
+                started.set()
+                await asyncio.sleep(10)
+                await db.commit()
+        task = asyncio.create_task(write())
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        # the next writer starts clean, its commit doesn't carry the cancelled insert
+        async with pool.writer() as db:
+            await db.execute("INSERT INTO items VALUES ('b')")
+            await db.commit()
+        async with pool.reader() as db:
+            cursor = await db.execute('SELECT key FROM items ORDER BY key')
+            rows = await cursor.fetchall()
+        await pool.close()
+        return rows
+
+    assert asyncio.run(run()) == [('b',)]
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from utils.assetcache import AssetCache
+from utils.download import Downloader, DownloadError, cache_key
+
+BODY = bytes(range(256))*64 # 16 KB
+
+
+async def _serve(run):
+    # a local server recording the requests it gets
+    requests = []
+    async def handle(request):
+        requests.append(request)
+        if request.path == '/missing':
+            return web.Response(status=404)
+        rng = request.headers.get('Range')
+        if (request.path == '/ranged') and rng:
+            end = int(rng.split('-')[1])
+            return web.Response(status=206, body=BODY[:end + 1])
+        if request.path == '/stream': # no Content-Length, so the cap applies while reading
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for i in range(0, len(BODY), 1024):
+                await response.write(BODY[i:i + 1024])
+            await response.write_eof()
+            return response
+        return web.Response(body=BODY)
+
+    app = web.Application()
+    app.router.add_get('/{name}', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await run(f'http://127.0.0.1:{port}', requests)
+    finally:
+        await runner.cleanup()
+
+
+def test_cache_key_drops_discord_signatures():
+    assert cache_key('https://cdn.discordapp.com/a/b.png?ex=1&hm=2') == 'https://cdn.discordapp.com/a/b.png'
+    assert cache_key('https://example.com/b.png?size=2') == 'https://example.com/b.png?size=2'
+
+
+def test_fetch_caps_the_size():
+    async def run(base, requests):
+        downloader = Downloader(max_bytes=len(BODY))
+        try:
+            assert await downloader.fetch(f'{base}/file') == BODY
+            errors = []
+            for url, cap in ((f'{base}/file', 1024), (f'{base}/stream', 1024), (f'{base}/missing', None)):
+                with pytest.raises(DownloadError) as info:
+                    await downloader.fetch(url, max_bytes=cap)
+                errors.append(str(info.value))
+            return errors
+        finally:
+            await downloader.close()
+
+    errors = asyncio.run(_serve(run))
+    assert errors[0].startswith('file is too large (16 KB')
+    assert errors[1] == 'file is too large (max 1 KB)'
+    assert errors[2] == 'download failed (HTTP 404)'
+
+
+def test_fetch_head_sends_a_range_request():
+    async def run(base, requests):
+        downloader = Downloader()
+        try:
+            ranged = await downloader.fetch_head(f'{base}/ranged', nbytes=100)
+            ignored = await downloader.fetch_head(f'{base}/file', nbytes=100) # server sends the whole body
+            return ranged, ignored, [r.headers.get('Range') for r in requests]
+        finally:
+            await downloader.close()
+
+    ranged, ignored, ranges = asyncio.run(_serve(run))
+    assert ranged == ignored == BODY[:100]
+    assert ranges == ['bytes=0-99', 'bytes=0-99']
+
+
+def test_downloads_are_cached(tmp_path):
+    async def run(base, requests):
+        downloader = Downloader(cache=AssetCache(str(tmp_path)))
+        try:
+            first = await downloader.fetch(f'{base}/file')
+            second = await downloader.fetch(f'{base}/file')
+            head = await downloader.fetch_head(f'{base}/file', nbytes=10)
+            with pytest.raises(DownloadError):
+                await downloader.fetch(f'{base}/file', max_bytes=1024) # cached, but over this cap
+            return first, second, head, len(requests)
+        finally:
+            await downloader.close()
+
+    first, second, head, requestCount = asyncio.run(_serve(run))
+    assert first == second == BODY
+    assert head == BODY[:10]
+    assert requestCount == 1
@@ -0,0 +1,297 @@
+import asyncio
+import sqlite3
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from cogs.emote import Emote, configData
+from utils import emotedisplay
+from utils.assetcache import AssetCache
+from utils.emotehash import EmoteHashIndex
+from utils.emotelog import EMOJI, PendingLog
+from utils.emotesearch import EmoteNameIndex
+from utils.images import TILE_EMOJI_SIZE, TILE_LABEL_HEIGHT, TILE_PADDING, render_tile, sprite_sheet
+from utils.rest import GuildRestScheduler
+from utils.writebehind import WriteBehindQueue
+
+GUILD_ID = 1
+LOG_CHANNEL_ID = 5
+
+
+def _make_db(path):
+    with sqlite3.connect(path) as db:
+        db.execute('CREATE TABLE emotelog_pending (guildID INTEGER, kind TEXT, itemID INTEGER, addedAt REAL, '
+                   'PRIMARY KEY (guildID, kind, itemID))')
+    return str(path)
+
+
+class FakeChannel:
+    def __init__(self, send):
+        self.id = LOG_CHANNEL_ID
+        self.type = None
+        self.send = send
+
+
+def _cog(path, channel):
+    settings = SimpleNamespace(get=lambda table, guildID: SimpleNamespace(prefix='!', logChannelID=LOG_CHANNEL_ID, autopublish=0, maxCol=6, maxRow=5, displayChannelID=0))
+    guild = SimpleNamespace(id=GUILD_ID, channels=[channel])
+    bot = SimpleNamespace(settings=settings, pending=PendingLog(path), hashes=None, writes=None,
+                          get_guild=lambda guildID: guild, get_emoji=lambda emojiID: f'<:e:{emojiID}>',
+                          get_sticker=lambda stickerID: None)
+    return Emote(bot)
+
+
+async def _log_two_emotes(cog):
+    await cog.pending.add(GUILD_ID, EMOJI, 10)
+    await cog.pending.add(GUILD_ID, EMOJI, 11)
+    return cog.pending.snapshot(GUILD_ID)
+
+
+def test_failed_post_keeps_the_log(tmp_path):
+    async def send(*args, **kwargs):
+        raise RuntimeError('Forbidden')
+
+    async def run():
+        cog = _cog(_make_db(tmp_path / 'test.db'), FakeChannel(send))
+        before = await _log_two_emotes(cog)
+        with pytest.raises(RuntimeError):
+            await cog._send_update(GUILD_ID)
+        return cog, before
+
+    cog, before = asyncio.run(run())
+    assert cog.pending.snapshot(GUILD_ID) == before
+    assert GUILD_ID in cog.logSchedule
+
+
+def test_cancelled_post_keeps_the_log(tmp_path):
+    posting = asyncio.Event()
+    async def send(*args, **kwargs):
+        posting.set()
+        await asyncio.sleep(10)
+
+    async def run():
+        cog = _cog(_make_db(tmp_path / 'test.db'), FakeChannel(send))
+        before = await _log_two_emotes(cog)
+        task = asyncio.create_task(cog._send_update(GUILD_ID))
+        await posting.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return cog, before
+
+    cog, before = asyncio.run(run())
+    assert cog.pending.snapshot(GUILD_ID) == before
+    assert GUILD_ID in cog.logSchedule
+
+
+def test_posted_log_is_cleared(tmp_path):
+    sent = []
+    async def send(content=None, **kwargs):
+        sent.append(content)
+
+    async def run():
+        cog = _cog(_make_db(tmp_path / 'test.db'), FakeChannel(send))
+        await _log_two_emotes(cog)
+        await cog._send_update(GUILD_ID)
+        return cog
+
+    cog = asyncio.run(run())
+    assert sent == ['**Added:**', '<:e:10><:e:11>']
+    assert cog.pending.guilds() == []
+
+
+def test_guild_hashing(tmp_path):
+    path = str(tmp_path / 'test.db')
+    with sqlite3.connect(path) as db:
+        db.execute('CREATE TABLE emote_hashes (guildID INTEGER, emojiID INTEGER, hash INTEGER, PRIMARY KEY (guildID, emojiID))')
+    running = {'now' : 0, 'peak' : 0}
+
+    class FakeEmoji:
+        def __init__(self, emojiID):
+            self.id = emojiID
+
+        async def read(self):
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            await asyncio.sleep(0.01)
+            running['now'] -= 1
+            return str(self.id).encode()
+
+    async def dhash(data):
+        return int(data)
+
+    async def run():
+        cog = _cog(_make_db(tmp_path / 'log.db'), FakeChannel(None))
+        cog.hashes = EmoteHashIndex(path)
+        cog.bot.assets = AssetCache(str(tmp_path / 'assets'))
+        cog.bot.images = SimpleNamespace(dhash=dhash)
+        guild = SimpleNamespace(id=GUILD_ID, emojis=[FakeEmoji(i) for i in range(1, 41)])
+        assert cog._hash_guild(guild) is cog._hash_guild(guild) # one hashing per guild at a time
+        await cog._hash_guild(guild)
+        assert cog.bot.assets.stats()['objects'] == 0 # hashing downloads are not cached
+
+        # a joined guild is hashed right away
+        joined = SimpleNamespace(id=GUILD_ID + 1, emojis=[FakeEmoji(100)])
+        await cog.on_guild_join(joined)
+        await cog._hash_guild(joined)
+        return [cog.hashes.missing(g.id, [emoji.id for emoji in g.emojis]) for g in (guild, joined)]
+
+    assert asyncio.run(run()) == [[], []]
+    assert running['peak'] == configData['DOWNLOAD_CONCURRENCY']
+
+
+def test_emote_changes_are_written_behind(tmp_path):
+    path = _make_db(tmp_path / 'test.db')
+
+    async def run():
+        cog = _cog(path, FakeChannel(None))
+        cog.pending = PendingLog(path, writes=WriteBehindQueue(path, delay=60))
+        cog.hashes = SimpleNamespace(remove=lambda *args: asyncio.sleep(0))
+        async def no_hashing(*args):
+            pass
+        cog._hash_emojis = no_hashing
+        guild = SimpleNamespace(id=GUILD_ID)
+        emojis = [SimpleNamespace(id=i) for i in (10, 11, 12)]
+
+        await cog.on_guild_emojis_update(guild, [], emojis)
+        await cog.on_guild_emojis_update(guild, emojis, emojis[:2]) # 12 deleted before the log post
+        assert cog.pending.get(GUILD_ID)[EMOJI] == [10, 11]
+        assert GUILD_ID in cog.logSchedule
+        # in memory and queued, nothing written yet
+        queued = cog.pending.writes.metrics()
+        with sqlite3.connect(path) as db:
+            assert db.execute('SELECT COUNT(*) FROM emotelog_pending').fetchone() == (0,)
+        await cog.pending.writes.stop()
+        return queued
+
+    queued = asyncio.run(run())
+    assert (queued['depth'], queued['coalesced']) == (3, 1)
+    with sqlite3.connect(path) as db:
+        assert db.execute('SELECT itemID FROM emotelog_pending ORDER BY addedAt').fetchall() == [(10,), (11,)]
+
+
+def test_emote_remove(tmp_path):
+    posts = []
+    async def post(content=None, **kwargs):
+        posts.append(content)
+    running = {'now' : 0, 'peak' : 0}
+
+    class FakeEmoji:
+        def __init__(self, emojiID, name):
+            self.id, self.name = emojiID, name
+
+        def __str__(self):
+            return f'<:{self.name}:{self.id}>'
+
+        async def delete(self):
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            await asyncio.sleep(0.01)
+            running['now'] -= 1
+            if self.name == 'locked':
+                raise RuntimeError('Forbidden')
+
+    emojis = {i : FakeEmoji(i, name) for i, name in ((1, 'a'), (2, 'b'), (3, 'locked'), (4, 'c'))}
+    replies = []
+    async def send(content=None, **kwargs):
+        replies.append(content)
+        return SimpleNamespace(edit=lambda **kwargs: asyncio.sleep(0))
+
+    async def run():
+        cog = _cog(_make_db(tmp_path / 'test.db'), FakeChannel(post))
+        cog.bot.rest = GuildRestScheduler(concurrency=2)
+        cog.bot.get_emoji = lambda emojiID: None # not in any server
+        guild = SimpleNamespace(id=GUILD_ID, channels=[FakeChannel(post)], get_emoji=emojis.get)
+        ctx = SimpleNamespace(guild=guild, send=send)
+        await Emote.emote_remove.callback(cog, ctx, 'Moved', 'away:', '<:a:1><:b:2>', '<:locked:3>', '<:a:1>', '<:x:9>', '<:c:4>')
+
+    asyncio.run(run())
+    assert running['peak'] == 2 # the guild's REST slots
+    # one batched log post of the removed emotes, with the custom header
+    assert posts == ['**Moved away:**\n<:a:1><:b:2><:c:4>']
+    assert replies[0] == 'Removing 4 emotes...'
+    assert replies[1:] == ["Successfully removed emotes: `:a:`, `:b:`, `:c:`\n"
+                           "Failed to remove emotes:\n"
+                           "`:9:`: This emote is not in this server\n"
+                           "`:locked:`: Forbidden"]
+
+
+def test_emote_search(tmp_path):
+    servers = [SimpleNamespace(name='Home'), SimpleNamespace(name='Other')]
+    class FakeEmoji(SimpleNamespace):
+        def __str__(self):
+            return f'<:{self.name}:{self.id}>'
+
+    emojis = {i : FakeEmoji(id=i, name=name, guild=servers[i % 2])
+              for i, name in enumerate(['happycat', 'dog', 'catjam', 'cat', 'caterpillar'])}
+    replies = []
+    async def send(content=None, **kwargs):
+        replies.append(content)
+
+    async def run():
+        cog = _cog(_make_db(tmp_path / 'test.db'), FakeChannel(None))
+        cog.bot.names = EmoteNameIndex()
+        cog.bot.names.build(emojis.values())
+        cog.bot.get_emoji = lambda emojiID: emojis.get(emojiID) if emojiID != 4 else None # 4 left its server
+        ctx = SimpleNamespace(guild=SimpleNamespace(id=GUILD_ID), send=send)
+        await Emote.emote_search.callback(cog, ctx, query=':CAT:')
+        await Emote.emote_search.callback(cog, ctx, query='zebra')
+        with pytest.raises(ValueError):
+            await Emote.emote_search.callback(cog, ctx, query='::')
+
+    asyncio.run(run())
+    lines = replies[0].split('\n')
+    assert lines[0] == '**Emotes matching** `:CAT:`**:**'
+    # exact and prefix matches first, then names containing the query
+    assert [line.split('`')[1] for line in lines[1:-1]] == [':cat:', ':catjam:', ':happycat:']
+    assert lines[1] == '<:cat:3> `:cat:` in Other'
+    assert lines[-1].startswith('-# 3 results from 5 emotes in ')
+    assert replies[1] == 'No emotes found for `zebra`'
+
+
+def test_sprite_sheets_reuse_cached_tiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(emotedisplay, 'SHEET_COLUMNS', 2)
+    monkeypatch.setattr(emotedisplay, 'SHEET_ROWS', 2)
+    drawn, pasted, reads = [], [], []
+
+    async def tile(data, name):
+        drawn.append(name if data is not None else None)
+        return render_tile(data, name)
+
+    async def sheet(tiles, columns):
+        pasted.append(len(tiles))
+        return sprite_sheet(tiles, columns)
+
+    class FakeEmoji(SimpleNamespace):
+        async def read(self):
+            reads.append(self.id)
+            if self.offline:
+                raise RuntimeError('Not Found')
+            out = BytesIO()
+            Image.new('RGBA', (32, 32), (10*self.id, 0, 0, 255)).save(out, format='PNG')
+            return out.getvalue()
+
+    emojis = [FakeEmoji(id=i, name=f'e{i}', offline=(i == 0)) for i in range(10)]
+
+    async def run():
+        cog = _cog(_make_db(tmp_path / 'test.db'), FakeChannel(None))
+        cog.bot.assets = AssetCache(str(tmp_path / 'assets'))
+        cog.bot.images = SimpleNamespace(tile=tile, sheet=sheet)
+        first = await cog._render_sheets(emojis)
+        emojis[0].offline = False
+        emojis[9].name = 'renamed'
+        return first, await cog._render_sheets(emojis)
+
+    first, second = asyncio.run(run())
+    # tiles and sheets are rendered concurrently, in any order
+    assert set(drawn[:10]) == {None} | {f'e{i}' for i in range(1, 10)}
+    assert sorted(pasted[:3]) == [2, 4, 4]
+    # then only the renamed tile and the one that failed, and their sheets
+    assert sorted(drawn[10:]) == ['e0', 'renamed']
+    assert sorted(pasted[3:]) == [2, 4]
+    assert sorted(reads) == [0] + list(range(10)) # emote images are downloaded once
+    assert second[1] == first[1]
+    assert second[2] != first[2]
+    assert Image.open(BytesIO(second[0])).size == (2*(TILE_EMOJI_SIZE + TILE_PADDING), 2*(TILE_EMOJI_SIZE + TILE_PADDING + TILE_LABEL_HEIGHT))
@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+from utils.emotedisplay import BLANK, DisplayMessages, LayoutCache, diff, layout
+
+
+class _Emoji:
+    def __init__(self, emojiID, animated=False):
+        self.id, self.name, self.animated = emojiID, f'e{emojiID}', animated
+
+    def __str__(self):
+        return f'<{"a" if self.animated else ""}:{self.name}:{self.id}>'
+
+
+def _apply(old, edits, appends, deletes):
+    new = list(old)
+    for i, text in edits:
+        new[i] = text
+    for i in sorted(deletes, reverse=True):
+        del new[i]
+    return new + appends
+
+
+def test_diff_edits_only_changed_messages():
+    old = ['a', 'b', 'c']
+    assert diff(old, ['a', 'b', 'c']) == ([], [], [])
+    assert diff(old, ['a', 'B', 'c']) == ([(1, 'B')], [], [])
+    assert diff(old, ['a', 'b', 'c', 'd', 'e']) == ([], ['d', 'e'], [])
+    assert diff(old, ['a']) == ([], [], [1, 2])
+    assert diff([], ['a']) == ([], ['a'], [])
+    assert diff(old, []) == ([], [], [0, 1, 2])
+
+
+def test_diff_applied_gives_the_new_display():
+    old = ['a', 'b', 'c', 'd']
+    for new in (['a', 'x'], ['x', 'b', 'c', 'd', 'e', 'f'], ['a', 'b', 'c', 'y'], []):
+        assert _apply(old, *diff(old, new)) == new
+
+
+def test_layout_separates_static_and_animated():
+    emojis = [_Emoji(i, animated=(i % 2 == 1)) for i in range(7)]
+    messages = layout(emojis, maxCol=2, maxRow=1)
+    assert messages == ['<:e0:0><:e2:2>', '<:e4:4><:e6:6>', BLANK, '<a:e1:1><a:e3:3>', '<a:e5:5>']
+    assert layout(emojis, 2, 1, animated=False) == messages[:2]
+    assert layout(emojis, 2, 1, static=False) == messages[3:]
+
+
+def test_layout_cache_follows_emote_changes():
+    cache = LayoutCache(size=1)
+    guild = SimpleNamespace(id=1, emojis=[_Emoji(1), _Emoji(2)])
+    first = cache.get(guild, 5, 5)
+    assert cache.get(guild, 5, 5) is first
+    guild.emojis[1].name = 'renamed'
+    assert cache.get(guild, 5, 5) != first
+    cache.get(SimpleNamespace(id=2, emojis=[]), 5, 5) # evicts guild 1
+    cache.get(guild, 5, 5)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 4
+
+
+def _make_db(path):
+    with sqlite3.connect(path) as db:
+        db.execute('CREATE TABLE emotedisplay_messages (guildID INTEGER, position INTEGER, channelID INTEGER, '
+                   'messageID INTEGER, content TEXT, PRIMARY KEY (guildID, position))')
+    return str(path)
+
+
+def test_display_messages_are_committed_right_away(tmp_path):
+    path = _make_db(tmp_path / 'test.db')
+
+    async def reloaded(guildID):
+        displays = DisplayMessages(path)
+        await displays.load()
+        return displays.get(guildID)
+
+    async def run():
+        displays = DisplayMessages(path)
+        await displays.set(1, 100, [11, 12, 13], ['a', 'b', 'c'])
+        assert await reloaded(1) == (100, [11, 12, 13], ['a', 'b', 'c'])
+        await displays.set(1, 100, [11, 14], ['a', 'B'])
+        assert await reloaded(1) == (100, [11, 14], ['a', 'B'])
+        await displays.set(1, 200, [21], ['a']) # moved to another channel
+        assert await reloaded(1) == (200, [21], ['a'])
+        await displays.clear(1)
+        assert await reloaded(1) == (None, [], [])
+        return displays.guilds()
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,75 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.emotefilter import EmoteFilter, FilterError, is_filter
+
+EMOJIS = [SimpleNamespace(id=1, name='old_cat', animated=False),
+          SimpleNamespace(id=2, name='old_dog', animated=True),
+          SimpleNamespace(id=3, name='new_cat', animated=False),
+          SimpleNamespace(id=4, name='old_x', animated=False)]
+
+
+def _ids(emojis):
+    return [emoji.id for emoji in emojis]
+
+
+def test_is_filter():
+    assert is_filter(['--match', 'cat'])
+    assert not is_filter(['<:cat:1>', 'dog'])
+    assert not is_filter([])
+
+
+def test_flags_combine():
+    assert _ids(EmoteFilter(['--match', "'cat$'"]).select(EMOJIS)) == [1, 3]
+    assert _ids(EmoteFilter(['--match', 'old', '--static']).select(EMOJIS)) == [1, 4]
+    assert _ids(EmoteFilter(['--ANIMATED']).select(EMOJIS)) == [2]
+    assert _ids(EmoteFilter(['--ids', '<:old_cat:1><a:old_dog:2>', '4', '--static']).select(EMOJIS)) == [1, 4]
+    assert EmoteFilter(['--static', '--dry-run']).dryRun
+
+
+@pytest.mark.parametrize('args, message', [
+    (['--match'], '--match needs a regex'),
+    (['--match', '('], 'Invalid regex'),
+    (['--ids', '--static'], '--ids needs emotes'),
+    (['--ids', 'cat'], 'is not an emote'),
+    (['--bogus'], 'Unknown option `--bogus`'),
+    (['--dry-run'], 'No filter given'),
+    (['--pattern', 'a', 'b'], 'Unknown option `--pattern`'), # rename only
+])
+def test_invalid_filters(args, message):
+    with pytest.raises(FilterError, match=message):
+        EmoteFilter(args)
+
+
+def test_renames():
+    renames, invalid = EmoteFilter(['--pattern', '"old_(.*)"', "'new_\\1'"], rename=True).renames(EMOJIS)
+    assert [(emoji.id, name) for emoji, name in renames] == [(1, 'new_cat'), (2, 'new_dog'), (4, 'new_x')]
+    assert invalid == []
+
+    # names not matching are left out, too short new names are invalid
+    renames, invalid = EmoteFilter(['--pattern', '^old_(.*)$', '\\1', '--static'], rename=True).renames(EMOJIS)
+    assert [(emoji.id, name) for emoji, name in renames] == [(1, 'cat')]
+    assert [emoji.id for emoji, _ in invalid] == [4]
+
+    with pytest.raises(FilterError, match='needs --pattern'):
+        EmoteFilter(['--static'], rename=True)
+    with pytest.raises(FilterError, match='Invalid new name'):
+        EmoteFilter(['--pattern', 'old', '\\2'], rename=True).renames(EMOJIS)
+
+
+@pytest.mark.parametrize('pattern', ['(a+)+$', '(a|aa)*b', '(a?){30}a{30}', '((ab)*c)+', '.*.*.*.*x', 'a'*101])
+def test_hostile_patterns_are_refused(pattern):
+    with pytest.raises(FilterError):
+        EmoteFilter(['--match', pattern])
+    with pytest.raises(FilterError):
+        EmoteFilter(['--pattern', pattern, 'new'], rename=True)
+
+
+def test_allowed_patterns_stay_fast():
+    # the slowest accepted shape, against the longest names that can't match
+    emojis = [SimpleNamespace(id=i, name='a'*32, animated=False) for i in range(250)]
+    start = time.perf_counter()
+    assert EmoteFilter(['--match', '.*.*.*x']).select(emojis) == []
+    assert time.perf_counter() - start < 1
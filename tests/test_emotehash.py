@@ -0,0 +1,44 @@
+import random
+
+from utils.emotehash import SimilarityIndex, distance
+
+
+def _flip(value, bits, rand):
+    for bit in rand.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+def _index(rand):
+    # clusters of near hashes around a few centers, plus random ones
+    index, hashes = SimilarityIndex(), {}
+    centers = [rand.getrandbits(64) for _ in range(5)]
+    for emojiID in range(2000):
+        value = _flip(rand.choice(centers), rand.randint(0, 20), rand) if emojiID % 2 else rand.getrandbits(64)
+        index.add(emojiID % 7, emojiID, value)
+        hashes[emojiID] = (emojiID % 7, value)
+    return index, hashes, centers
+
+
+def test_search_matches_brute_force():
+    rand = random.Random(0)
+    index, hashes, centers = _index(rand)
+    for query in centers + [_flip(center, 3, rand) for center in centers]:
+        for k, maxDistance in ((5, 12), (50, 8), (1000, 16)):
+            expected = sorted((distance(query, value), emojiID) for emojiID, (_, value) in hashes.items()
+                              if distance(query, value) <= maxDistance)[:k]
+            found = index.search(query, k=k, max_distance=maxDistance)
+            assert [(bits, emojiID) for bits, _, emojiID in found] == expected
+            assert all(guildID == hashes[emojiID][0] for _, guildID, emojiID in found)
+
+
+def test_remove_and_replace():
+    index = SimilarityIndex()
+    index.add(1, 10, 0)
+    index.add(1, 11, 0b111)
+    index.add(1, 10, 0xFFFF) # replaced
+    assert index.search(0, max_distance=4) == [(3, 1, 11)]
+    index.remove(11)
+    index.remove(11)
+    assert index.search(0, max_distance=4) == []
+    assert len(index) == 1
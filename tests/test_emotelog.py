@@ -0,0 +1,37 @@
+import asyncio
+import sqlite3
+
+from utils.emotelog import EMOJI, STICKER, PendingLog
+
+
+def _make_db(path):
+    with sqlite3.connect(path) as db:
+        db.execute('CREATE TABLE emotelog_pending (guildID INTEGER, kind TEXT, itemID INTEGER, addedAt REAL, '
+                   'PRIMARY KEY (guildID, kind, itemID))')
+    return str(path)
+
+
+def test_restore_puts_back_taken_entries(tmp_path):
+    path = _make_db(tmp_path / 'test.db')
+
+    async def run():
+        pending = PendingLog(path)
+        await pending.add(1, EMOJI, 10)
+        await pending.add(1, EMOJI, 11)
+        await pending.add(1, STICKER, 20)
+        snapshot = pending.snapshot(1)
+        taken = await pending.take(1)
+        assert taken == {EMOJI : [10, 11], STICKER : [20]}
+        assert pending.get(1) == {EMOJI : [], STICKER : []}
+
+        # added while posting, kept after the restored ones
+        await pending.add(1, EMOJI, 12)
+        await pending.restore(1, snapshot)
+        assert pending.get(1) == {EMOJI : [10, 11, 12], STICKER : [20]}
+        assert pending.first_added(1) == snapshot[EMOJI][10]
+
+        reloaded = PendingLog(path)
+        await reloaded.load()
+        return reloaded.get(1)
+
+    assert asyncio.run(run()) == {EMOJI : [10, 11, 12], STICKER : [20]}
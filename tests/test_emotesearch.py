@@ -0,0 +1,63 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import utils.emotesearch as emotesearch
+from utils.emotesearch import EmoteNameIndex
+
+NAMES = ['cat', 'catjam', 'Cat_Wave', 'happycat', 'dog', 'hotdog', 'caterpillar']
+
+
+def _index():
+    index = EmoteNameIndex()
+    index.build([SimpleNamespace(id=i, name=name) for i, name in enumerate(NAMES)])
+    return index
+
+def _names(emojiIDs):
+    return [NAMES[emojiID].lower() for emojiID in emojiIDs]
+
+
+def test_prefix_then_substring_matches():
+    index = _index()
+    assert _names(index.search('cat', fuzzy=False)) == ['cat', 'cat_wave', 'caterpillar', 'catjam', 'happycat']
+    assert _names(index.search(':DOG:', fuzzy=False)) == ['dog', 'hotdog']
+    assert _names(index.search('ca', fuzzy=False)) == ['cat', 'cat_wave', 'caterpillar', 'catjam']
+    assert index.search('cat', limit=2, fuzzy=False) == [0, 2]
+    assert index.search('') == []
+
+
+def test_fuzzy_matches_typos():
+    assert 'caterpillar' in _names(_index().search('catrpillar'))
+
+
+def test_updates():
+    index = _index()
+    emojis = [SimpleNamespace(id=4, name='dog'), SimpleNamespace(id=5, name='hotdog')]
+    index.update(emojis, [SimpleNamespace(id=4, name='puppy')]) # renamed and removed
+    assert index.search('dog', fuzzy=False) == []
+    assert index.search('pup') == [4]
+    assert len(index) == len(NAMES) - 1
+
+
+def test_updates_during_a_rebuild_are_replayed(monkeypatch):
+    realIndex = emotesearch._index
+    def slow_index(names):
+        time.sleep(0.2)
+        return realIndex(names)
+    monkeypatch.setattr(emotesearch, '_index', slow_index)
+
+    async def run():
+        index = EmoteNameIndex()
+        emojis = [SimpleNamespace(id=i, name=name) for i, name in enumerate(NAMES)]
+        build = asyncio.create_task(index.rebuild(emojis))
+        await asyncio.sleep(0.05) # the build thread is running
+        index.update([], [SimpleNamespace(id=100, name='newcat')]) # a guild joined
+        index.update([emojis[4], emojis[5]], [SimpleNamespace(id=4, name='puppy')]) # renamed and deleted
+        await build
+        return index
+
+    index = asyncio.run(run())
+    assert index.search('newcat') == [100]
+    assert index.search('dog', fuzzy=False) == []
+    assert index.search('puppy') == [4]
+    assert len(index) == len(NAMES)
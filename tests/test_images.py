@@ -0,0 +1,52 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from utils.images import SOURCE_MAX_FRAMES, ImageError, normalize, sniff_animated
+
+
+def _png(frames):
+    out = BytesIO()
+    frames[0].save(out, format='PNG', save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return out.getvalue()
+
+
+def test_static_png_that_fits_is_passed_through():
+    data = _png([Image.new('RGBA', (32, 32), (255, 0, 0, 255))])
+    assert normalize(data) == (data, False)
+
+
+def test_apng_becomes_a_gif():
+    data = _png([Image.new('RGBA', (32, 32), (40*i, 0, 0, 255)) for i in range(4)])
+    assert sniff_animated(data[:4096]) is True
+    out, animated = normalize(data)
+    assert animated
+    assert out[:6] == b'GIF89a'
+
+
+def _gif(frames):
+    out = BytesIO()
+    frames[0].save(out, format='GIF', save_all=True, append_images=frames[1:], duration=20, loop=0)
+    return out.getvalue()
+
+
+def test_oversized_sources_are_refused_before_decoding():
+    huge = BytesIO()
+    Image.new('L', (5000, 5000)).save(huge, format='PNG') # a few KB on disk, 25M pixels
+    with pytest.raises(ImageError, match='too large'):
+        normalize(huge.getvalue())
+
+    countless = _gif([Image.new('RGB', (8, 8), (i % 256, i // 256, 0)) for i in range(SOURCE_MAX_FRAMES + 1)])
+    with pytest.raises(ImageError, match='animation is too large'):
+        normalize(countless)
+
+
+def test_long_animation_keeps_fewer_frames_with_longer_durations():
+    data = _gif([Image.new('RGB', (300, 200), (i, 255 - i, 0)) for i in range(0, 250, 2)]) # 125 frames
+    out, animated = normalize(data, max_frames=50)
+    result = Image.open(BytesIO(out))
+    assert animated
+    assert max(result.size) <= 128
+    assert result.n_frames <= 50
+    assert result.info['duration'] >= 40
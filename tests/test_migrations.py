@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+
+import config
+import utils.migrations as migrations
+from utils.migrations import MIGRATIONS, migrate, schema_state
+
+# the tables as they were before any migration
+BASELINE = {
+    'config' : 'guildID INTEGER PRIMARY KEY, prefix TEXT',
+    'emotelog' : 'guildID INTEGER PRIMARY KEY, logChannelID INTEGER, updateMessage TEXT, updateMessageStickers TEXT, '
+                 'messageColumnCount INTEGER, messageRowCount INTEGER, maxCol INTEGER, maxRow INTEGER, '
+                 'autopublish INTEGER, sourceChannelID INTEGER',
+    'emotedisplay' : 'guildID INTEGER PRIMARY KEY, displayChannelID INTEGER, message TEXT, maxCol INTEGER, '
+                     'maxRow INTEGER, messageCount INTEGER',
+}
+
+
+def _make_baseline(path):
+    with sqlite3.connect(path) as db:
+        for table, columns in BASELINE.items():
+            db.execute(f'CREATE TABLE {table} ({columns})')
+        db.executemany('INSERT INTO emotelog VALUES (?, 0, ?, ?, 0, 0, 6, 5, 0, 0)', [
+            (1, '<:cat:11><a:dog:12>\n<:cat:11>', '21 22'),
+            (2, '', ''),
+        ])
+        db.executemany('INSERT INTO emotedisplay VALUES (?, ?, ?, 6, 5, ?)', [
+            (1, 100, '301,302,303', 3),
+            (2, 0, '', 0),
+        ])
+    return str(path)
+
+def _columns(path, table):
+    with sqlite3.connect(path) as db:
+        return [column[1] for column in db.execute(f'PRAGMA table_info({table})')]
+
+def _select(path, query):
+    with sqlite3.connect(path) as db:
+        return db.execute(query).fetchall()
+
+
+def _run_twice(path):
+    async def run():
+        first = await migrate(path, config.DATABASE_TABLES)
+        second = await migrate(path, config.DATABASE_TABLES)
+        return first, second, await schema_state(path)
+    return asyncio.run(run())
+
+
+def _check_converted_rows(path):
+    assert _select(path, 'SELECT guildID, kind, itemID FROM emotelog_pending ORDER BY kind, addedAt') == [
+        (1, 'emoji', 11), (1, 'emoji', 12), (1, 'sticker', 21), (1, 'sticker', 22)]
+    assert _select(path, 'SELECT guildID, position, channelID, messageID, content FROM emotedisplay_messages ORDER BY position') == [
+        (1, 0, 100, 301, ''), (1, 1, 100, 302, ''), (1, 2, 100, 303, '')]
+    assert _select(path, 'SELECT message, messageCount FROM emotedisplay') == [('', 0), ('', 0)]
+
+
+def test_migrate_converts_the_blobs_once(tmp_path):
+    path = _make_baseline(tmp_path / 'test.db')
+    first, second, (version, tablesHash) = _run_twice(path)
+
+    assert [description for description, _ in first] == ['sync DATABASE_TABLES'] + [description for description, _ in MIGRATIONS]
+    assert second == []
+    assert version == len(MIGRATIONS)
+    assert tablesHash == migrations.tables_hash(config.DATABASE_TABLES)
+    _check_converted_rows(path)
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        assert _columns(path, 'emotelog') == ['guildID', 'logChannelID', 'maxCol', 'maxRow', 'autopublish', 'sourceChannelID']
+
+
+def test_migrate_without_drop_column(tmp_path, monkeypatch):
+    # sqlite < 3.35 can't drop columns, the blobs are emptied instead
+    monkeypatch.setattr(migrations.sqlite3, 'sqlite_version_info', (3, 34, 0))
+    path = _make_baseline(tmp_path / 'test.db')
+    first, second, (version, _) = _run_twice(path)
+
+    assert first and (second == [])
+    assert version == len(MIGRATIONS)
+    _check_converted_rows(path)
+    assert 'updateMessage' in _columns(path, 'emotelog')
+    assert _select(path, 'SELECT updateMessage, updateMessageStickers FROM emotelog') == [('', ''), ('', '')]
+
+
+def test_new_database(tmp_path):
+    path = str(tmp_path / 'test.db')
+    first, second, (version, _) = _run_twice(path)
+    assert first and (second == [])
+    assert version == len(MIGRATIONS)
+    assert _select(path, 'SELECT COUNT(*) FROM emotelog_pending') == [(0,)]
@@ -0,0 +1,32 @@
+import asyncio
+
+from utils.rest import GuildRestScheduler, split_message
+
+
+def test_split_message_packs_lines_under_the_limit():
+    assert split_message([]) == []
+    assert split_message(['a', 'b', 'c'], limit=3) == ['a\nb', 'c']
+    assert split_message(['abc', 'de'], limit=5) == ['abc', 'de']
+    assert split_message(['x'*10, 'y'], limit=4) == ['xxxx', 'y'] # long lines are cut
+    for message in split_message([f'line {i}' for i in range(1000)], limit=100):
+        assert len(message) <= 100
+
+
+def test_slots_bound_concurrency_per_guild():
+    rest = GuildRestScheduler(concurrency=2)
+    running = {1 : 0, 2 : 0}
+    peak = {1 : 0, 2 : 0}
+
+    async def call(guildID):
+        async with rest.slot(guildID):
+            running[guildID] += 1
+            peak[guildID] = max(peak[guildID], running[guildID])
+            await asyncio.sleep(0.01)
+            running[guildID] -= 1
+
+    async def run():
+        await asyncio.gather(*(call(1) for _ in range(10)), call(2))
+        return rest.busy(1)
+
+    assert asyncio.run(run()) == 0
+    assert peak == {1 : 2, 2 : 1}
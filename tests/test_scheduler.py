@@ -0,0 +1,72 @@
+import asyncio
+
+from utils.scheduler import Debouncer, DeadlineScheduler
+
+
+def test_deadlines_run_in_order_and_cancel():
+    ran = []
+
+    async def callback(key):
+        ran.append(key)
+
+    async def run():
+        scheduler = DeadlineScheduler(callback)
+        scheduler.start()
+        scheduler.schedule('b', 0.1)
+        scheduler.schedule('a', 0.05)
+        scheduler.schedule('a', 1., replace=False) # kept at 0.05
+        scheduler.schedule('c', 0.05)
+        assert scheduler.cancel('c')
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return len(scheduler)
+
+    assert asyncio.run(run()) == 0
+    assert ran == ['a', 'b']
+
+
+def test_debouncer_runs_once_per_burst():
+    ran = []
+
+    async def callback(key):
+        ran.append(key)
+
+    async def run():
+        debouncer = Debouncer(callback, delay=0.05)
+        debouncer.start()
+        for _ in range(5):
+            debouncer.trigger(1)
+            await asyncio.sleep(0.01)
+        debouncer.trigger(2)
+        await asyncio.sleep(0.2)
+        await debouncer.stop()
+        return debouncer.metrics()
+
+    metrics = asyncio.run(run())
+    assert sorted(ran) == [1, 2]
+    assert metrics['coalesced'] == 4
+    assert metrics['runs'] == 2
+
+
+def test_debouncer_cancels_a_stale_run():
+    started, finished = [], []
+
+    async def callback(key):
+        started.append(key)
+        await asyncio.sleep(0.1)
+        finished.append(key)
+
+    async def run():
+        debouncer = Debouncer(callback, delay=0.02)
+        debouncer.start()
+        debouncer.trigger(1)
+        await asyncio.sleep(0.05) # the run is going
+        debouncer.trigger(1)
+        await asyncio.sleep(0.3)
+        await debouncer.stop()
+        return debouncer.metrics()
+
+    metrics = asyncio.run(run())
+    assert started == [1, 1]
+    assert finished == [1]
+    assert metrics['cancelled'] == 1
@@ -0,0 +1,47 @@
+import asyncio
+import sqlite3
+
+import config
+from utils.migrations import migrate
+from utils.settings import SettingsRepository
+from utils.writebehind import WriteBehindQueue
+
+
+def _select(path, query):
+    with sqlite3.connect(path) as db:
+        return db.execute(query).fetchall()
+
+
+def test_update_inserts_a_missing_row(tmp_path):
+    path = str(tmp_path / 'test.db')
+
+    async def run():
+        await migrate(path, config.DATABASE_TABLES)
+        settings = SettingsRepository(path, config.DATABASE_TABLES)
+        await settings.load()
+        await settings.update('config', 1, prefix='!')
+        await settings.update('config', 1, prefix='?')
+        return settings.get('config', 1).prefix
+
+    assert asyncio.run(run()) == '?'
+    assert _select(path, 'SELECT guildID, prefix FROM config') == [(1, '?')]
+
+
+def test_deferred_update_of_a_missing_row_is_written_through(tmp_path):
+    path = str(tmp_path / 'test.db')
+
+    async def run():
+        await migrate(path, config.DATABASE_TABLES)
+        writes = WriteBehindQueue(path, delay=60)
+        settings = SettingsRepository(path, config.DATABASE_TABLES, writes=writes)
+        await settings.load()
+        await settings.update('emotedisplay', 1, defer=True, messageCount=3)
+        assert _select(path, 'SELECT guildID, messageCount, maxCol FROM emotedisplay') == [(1, 3, 6)]
+        # the row exists now, so the next deferred update is queued
+        await settings.update('emotedisplay', 1, defer=True, messageCount=0)
+        queued = writes.metrics()['depth']
+        await writes.stop()
+        return queued
+
+    assert asyncio.run(run()) == 1
+    assert _select(path, 'SELECT messageCount FROM emotedisplay') == [(0,)]
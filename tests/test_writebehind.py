@@ -0,0 +1,75 @@
+import asyncio
+import contextlib
+import sqlite3
+
+import utils.writebehind as writebehind
+from utils.writebehind import WriteBehindQueue
+
+
+def _make_db(path):
+    with sqlite3.connect(path) as db:
+        db.execute('CREATE TABLE items (key TEXT PRIMARY KEY, value INTEGER)')
+    return str(path)
+
+def _rows(path):
+    with sqlite3.connect(path) as db:
+        return dict(db.execute('SELECT key, value FROM items'))
+
+INSERT = 'INSERT OR REPLACE INTO items (key, value) VALUES (?, ?)'
+
+
+def test_put_coalesces_and_flushes_after_delay(tmp_path):
+    path = _make_db(tmp_path / 'test.db')
+
+    async def run():
+        queue = WriteBehindQueue(path, delay=0.05)
+        queue.put(('items', 'a'), INSERT, 'a', 1)
+        queue.put(('items', 'a'), INSERT, 'a', 2)
+        queue.put(('items', 'b'), INSERT, 'b', 3)
+        assert queue.metrics()['depth'] == 2
+        await asyncio.sleep(0.2)
+        return queue.metrics()
+
+    metrics = asyncio.run(run())
+    assert _rows(path) == {'a' : 2, 'b' : 3}
+    assert metrics['depth'] == 0
+    assert metrics['coalesced'] == 1
+    assert metrics['flushes'] == 1
+
+
+def test_writes_queued_during_a_slow_flush_are_flushed(tmp_path, monkeypatch):
+    path = _make_db(tmp_path / 'test.db')
+    realTransaction = writebehind.transaction
+
+    @contextlib.asynccontextmanager
+    async def slow_transaction(db_path):
+        async with realTransaction(db_path) as tx:
+            await asyncio.sleep(0.3)
+            yield tx
+    monkeypatch.setattr(writebehind, 'transaction', slow_transaction)
+
+    async def run():
+        queue = WriteBehindQueue(path, delay=0.05)
+        queue.put(('items', 'a'), INSERT, 'a', 1)
+        await asyncio.sleep(0.1) # the first flush is running
+        queue.put(('items', 'b'), INSERT, 'b', 2)
+        await asyncio.sleep(0.1) # its timer fires while the first flush still runs
+        queue.put(('items', 'c'), INSERT, 'c', 3)
+        await asyncio.sleep(1.)
+        return queue.metrics()
+
+    metrics = asyncio.run(run())
+    assert metrics['depth'] == 0
+    assert _rows(path) == {'a' : 1, 'b' : 2, 'c' : 3}
+
+
+def test_stop_flushes_everything(tmp_path):
+    path = _make_db(tmp_path / 'test.db')
+
+    async def run():
+        queue = WriteBehindQueue(path, delay=60)
+        queue.put(('items', 'a'), INSERT, 'a', 1)
+        await queue.stop()
+
+    asyncio.run(run())
+    assert _rows(path) == {'a' : 1}
@@ -0,0 +1,194 @@
+"""
+This contains the asset cache, a disk-backed content-addressed store for downloaded files.
+
+Files are stored once per content, under their sha256 (objects/ab/cdef...), and looked up either
+by that hash or by a key (a source URL, 'emoji:<id>' for emoji assets) whose key file
+(keys/<sha256 of key>) holds the content hash. The total size of the objects is kept under a
+byte budget by evicting the least recently used ones; recency is the file modification time, so
+it survives restarts. Key files of evicted objects are dropped when next looked up.
+
+File IO runs in threads, off the event loop, with the index guarded by a lock.
+"""
+
+import asyncio
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class AssetCache:
+    """
+    Disk-backed content-addressed LRU cache.
+
+    Parameters
+    ----------
+    root : str
+        The cache directory, created if missing.
+    max_bytes : int
+        The size budget of the stored objects.
+    """
+
+    def __init__(self, root, max_bytes=256*1024*1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._objects = collections.OrderedDict() # sha256 -> size, least recently used first
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+    def _key_path(self, key):
+        return os.path.join(self.root, 'keys', hashlib.sha256(key.encode()).hexdigest())
+
+    def _load(self):
+        """Index the stored objects by modification time. Runs once, on first use"""
+        objects = []
+        objectsDir = os.path.join(self.root, 'objects')
+        os.makedirs(objectsDir, exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'keys'), exist_ok=True)
+        for prefix in os.listdir(objectsDir):
+            for entry in os.scandir(os.path.join(objectsDir, prefix)):
+                if entry.name.startswith('.'): # unfinished write
+                    os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+                objects.append((stat.st_mtime, prefix + entry.name, stat.st_size))
+        for _, digest, size in sorted(objects):
+            self._objects[digest] = size
+            self._size += size
+        self._loaded = True
+
+    def _read(self, digest):
+        if digest not in self._objects:
+            return None
+        path = self._object_path(digest)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self._size -= self._objects.pop(digest)
+            return None
+        self._objects.move_to_end(digest)
+        return data
+
+    def _write(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self._objects:
+            self._objects.move_to_end(digest)
+            return digest
+        path = self._object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so a crash never leaves a partial object
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.tmp', delete=False) as file:
+            file.write(data)
+        os.replace(file.name, path)
+        self._objects[digest] = len(data)
+        self._size += len(data)
+        self._evict()
+        return digest
+
+    def _evict(self):
+        while (self._size > self.max_bytes) and (len(self._objects) > 1):
+            digest, size = self._objects.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _get(self, key):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            keyPath = self._key_path(key)
+            try:
+                with open(keyPath, 'r') as file:
+                    digest = file.read().strip()
+            except FileNotFoundError:
+                return None
+            data = self._read(digest)
+            if data is None:
+                os.remove(keyPath)
+            return data
+
+    def _get_hash(self, digest):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return self._read(digest)
+
+    def _put(self, data, key):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            digest = self._write(data)
+            if key is not None:
+                with open(self._key_path(key), 'w') as file:
+                    file.write(digest)
+            return digest
+
+    async def get(self, key, count=True):
+        """The cached bytes for a key, None if not cached. Counts a hit or a miss if count"""
+        data = await asyncio.to_thread(self._get, key)
+        if not count:
+            pass
+        elif data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    async def get_hash(self, digest):
+        """The cached bytes with a sha256 hex digest, None if not cached"""
+        return await asyncio.to_thread(self._get_hash, digest)
+
+    async def put(self, data, key=None):
+        """Store bytes, under key if given. Returns their sha256 hex digest"""
+        return await asyncio.to_thread(self._put, data, key)
+
+    async def fetch(self, key, loader):
+        """
+        Get the bytes for a key, loading and storing them on a miss.
+
+        Parameters
+        ----------
+        key : str
+            The key, ex: a source URL or 'emoji:<id>'.
+        loader : coroutine function
+            Called with no arguments on a miss, returns the bytes.
+
+        Returns
+        -------
+        data : bytes
+        """
+        data = await self.get(key)
+        if data is None:
+            data = await loader()
+            await self.put(data, key)
+        return data
+
+    def stats(self):
+        """
+        Return the cache statistics.
+
+        Returns
+        -------
+        stats : dict
+            The number of objects, their total bytes, the budget, the hits, misses and hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'objects' : len(self._objects),
+            'bytes' : self._size,
+            'max_bytes' : self.max_bytes,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'hit_rate' : self.hits / lookups if lookups else 0.,
+        }
@@ -2,13 +2,14 @@
 
 import config
 import json
-import discord
-from discord.ext import commands
-import aiosqlite
+import time
+from utils.database import db_execute, transaction
 
 with open('config.json', 'r') as config_file:
     configData = json.load(config_file)
 
+logger = config.logging.getLogger("bot")
+
 async def load_extensions(bot):
     for cog in configData['COGS']:
         try:
@@ -16,40 +17,81 @@ async def load_extensions(bot):
         except Exception as e:
             print(f'Error loading cog {cog}: {e}')
 
+# guildID -> prefix list returned to commands.Bot.get_prefix, so reading messages does not
+# hit the database. The prefixes themselves come from bot.settings
+_PREFIX_LISTS = {}
+
+def _prefix_list(bot, prefix):
+    """Same list as commands.when_mentioned_or(prefix)(bot, message), built once"""
+    return [f'<@{bot.user.id}> ', f'<@!{bot.user.id}> ', prefix]
+
+def reset_cached_prefix(guildID):
+    """Rebuild the prefix list of a guild on its next message. Use after the prefix changed"""
+    _PREFIX_LISTS.pop(guildID, None)
+
 async def get_prefix(bot, message):
     """Prefix function to allow customizable prefix"""
     if message:
-        async with aiosqlite.connect(configData["DATABASE"]) as db:
-            async with db.cursor() as cursor:
-                await cursor.execute("SELECT prefix FROM config WHERE guildID=?", (message.guild.id,))
-                result = await cursor.fetchone()
-            if result is not None:
-                return commands.when_mentioned_or(result[0])(bot,message)
-            else:
-                return commands.when_mentioned_or(configData['DEFAULT_PREFIX'])(bot,message)
+        # DMs use the default prefix
+        if message.guild is None:
+            return _prefix_list(bot, configData['DEFAULT_PREFIX'])
+
+        guildID = message.guild.id
+        prefixList = _PREFIX_LISTS.get(guildID)
+        if prefixList is not None:
+            return prefixList
+
+        if bot.settings.loaded:
+            prefix = bot.settings.get('config', guildID).prefix
+        else:
+            # message before on_ready finished loading the settings, don't cache
+            result = await db_execute(configData["DATABASE"], "SELECT prefix FROM config WHERE guildID=?", guildID)
+            prefix = result[0] if result is not None else configData['DEFAULT_PREFIX']
+            return _prefix_list(bot, prefix)
+        prefixList = _PREFIX_LISTS[guildID] = _prefix_list(bot, prefix)
+        return prefixList
             
-async def initialize_database_per_guild(guild):
-    """Create database row for a guild in all tables"""
-    guildID = guild.id
+async def initialize_database(guilds):
+    """
+    Create the database rows of all given guilds that don't have them yet, in all tables.
+    Missing rows are found and inserted with one set-based statement per table, all in one
+    transaction.
+
+    Parameters
+    ----------
+    guilds : list
+        The guilds (anything with an id) to initialize.
+
+    Returns
+    -------
+    inserted : dict
+        The {table name : number of rows inserted}.
+    """
     database = configData["DATABASE"]
     db_tables = configData["DATABASE_TABLES"]
+    start = time.perf_counter()
+
+    inserted = {}
+    async with transaction(database) as tx:
+        await tx.execute('CREATE TEMP TABLE IF NOT EXISTS bootstrap_guilds (guildID INTEGER PRIMARY KEY)')
+        await tx.execute('DELETE FROM bootstrap_guilds')
+        await tx.executemany('INSERT OR IGNORE INTO bootstrap_guilds (guildID) VALUES (?)', [(guild.id,) for guild in guilds])
+
+        for table_name, columns_dict in db_tables.items():
+            # the default values are SQL literals, same as used in createTable
+            columns = [col.split(' ')[0] for col in columns_dict.keys() if col.split(' ')[0] != 'guildID']
+            defaults = [str(columns_dict[col]) for col in columns_dict.keys() if col.split(' ')[0] != 'guildID']
+            inserted[table_name] = await tx.execute(
+                f'INSERT OR IGNORE INTO {table_name} (guildID, {", ".join(columns)}) '
+                f'SELECT guildID, {", ".join(defaults)} FROM bootstrap_guilds '
+                f'WHERE guildID NOT IN (SELECT guildID FROM {table_name})'
+            )
 
-    for table_name in db_tables.keys():
-        db_tables[table_name]["guildID INTEGER PRIMARY KEY"] = guildID  # set guild ID
-
-        # prepare data for sql command strings
-        columns_full = db_tables[table_name].keys()
-        default_values = db_tables[table_name].values()
-        cols = ', '.join([col.split(' ')[0] for col in columns_full])
-        question_string = ', '.join(['?'] * len(default_values))
-
-        # now update guild row data in all database tables
-        async with aiosqlite.connect(database) as db:
-            async with db.cursor() as cursor:
-                await cursor.execute(f'SELECT COUNT(*) FROM {table_name} WHERE guildID = ?', (guildID,))
-                exists = await cursor.fetchone()
-                if not exists[0]:
-                    await cursor.execute(
-                        f'INSERT INTO {table_name} ({cols}) VALUES ({question_string})', (*default_values,)
-                    )
-                    await db.commit()
\ No newline at end of file
+        await tx.execute('DROP TABLE bootstrap_guilds')
+
+    logger.info(f"Database bootstrap: {len(guilds)} guilds, inserted {inserted} in {time.perf_counter() - start:.3f} s")
+    return inserted
+
+async def initialize_database_per_guild(guild):
+    """Create database row for a guild in all tables"""
+    await initialize_database([guild])
@@ -1,7 +1,273 @@
 """This contains useful functions for database related operations"""
 
 import aiosqlite
+import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
+
+
+class ConnectionPool:
+    """
+    A long-lived pool of database connections. A single writer connection serializes
+    all writes, while a set of reader connections serve selects concurrently (WAL mode).
+    Connections stay open for the lifetime of the bot instead of being opened per query.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    readers : int
+        The number of reader connections to keep open.
+    """
+
+    def __init__(self, db_path, readers=4):
+        self.db_path = db_path
+        self.size = readers
+        self._writer = None
+        self._writerLock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._allReaders = []
+        self.is_open = False
+
+        # stats
+        self._checkouts = {'reader' : 0, 'writer' : 0}
+        self._waitTime = {'reader' : 0., 'writer' : 0.}
+        self._maxWait = {'reader' : 0., 'writer' : 0.}
+
+    async def open(self):
+        """Open the writer and reader connections"""
+        if self.is_open:
+            return
+        self._writer = await aiosqlite.connect(self.db_path)
+        # WAL lets the readers run while the writer holds a transaction
+        await self._writer.execute('PRAGMA journal_mode=WAL')
+        await self._writer.execute('PRAGMA synchronous=NORMAL')
+        for _ in range(self.size):
+            reader = await aiosqlite.connect(self.db_path)
+            await reader.execute('PRAGMA query_only=1')
+            self._allReaders.append(reader)
+            self._readers.put_nowait(reader)
+        self.is_open = True
+
+    async def close(self):
+        """Close all connections, waiting for any checked out connection to be returned"""
+        if not self.is_open:
+            return
+        self.is_open = False
+        async with self._writerLock:
+            await self._writer.close()
+        for _ in range(self.size):
+            await self._readers.get()
+        for reader in self._allReaders:
+            await reader.close()
+        self._allReaders = []
+        self._writer = None
+
+    def _record(self, kind, start):
+        wait = time.perf_counter() - start
+        self._checkouts[kind] += 1
+        self._waitTime[kind] += wait
+        self._maxWait[kind] = max(self._maxWait[kind], wait)
+
+    @asynccontextmanager
+    async def reader(self):
+        """Check out a reader connection"""
+        start = time.perf_counter()
+        db = await self._readers.get()
+        self._record('reader', start)
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def writer(self):
+        """
+        Check out the writer connection. Only one writer is checked out at a time, so don't
+        call db_execute updates on the same database while holding it (it would wait forever).
+        """
+        start = time.perf_counter()
+        async with self._writerLock:
+            self._record('writer', start)
+            try:
+                yield self._writer
+            except BaseException:
+                # don't leave a half done transaction on the shared connection (also when cancelled)
+                await self._writer.rollback()
+                raise
+
+    def stats(self):
+        """
+        Return the pool statistics.
+
+        Returns
+        -------
+        stats : dict
+            The pool size, idle readers, and per connection type the number of checkouts,
+            the total and max wait time (s) for a checkout.
+        """
+        stats = {
+            'size' : self.size + 1,
+            'idle_readers' : self._readers.qsize(),
+            'writer_busy' : self._writerLock.locked(),
+        }
+        for kind in ('reader', 'writer'):
+            stats[kind] = {
+                'checkouts' : self._checkouts[kind],
+                'wait_total' : self._waitTime[kind],
+                'wait_max' : self._maxWait[kind],
+            }
+        return stats
+
+
+_POOLS = {}
+
+async def open_pool(db_path, readers=4):
+    """
+    Open the connection pool for a database, if not already open. Every db_execute call
+    on this database path goes through the pool afterwards.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database. Create if not already exists.
+    readers : int
+        The number of reader connections to keep open.
+
+    Returns
+    -------
+    pool : ConnectionPool
+        The open pool for db_path.
+    """
+    pool = _POOLS.get(db_path)
+    if pool is None:
+        pool = ConnectionPool(db_path, readers=readers)
+        _POOLS[db_path] = pool
+    await pool.open()
+    return pool
+
+async def close_pool(db_path=None):
+    """Close the pool of the given database path, or all pools if none given"""
+    paths = [db_path] if db_path else list(_POOLS.keys())
+    for path in paths:
+        pool = _POOLS.pop(path, None)
+        if pool is not None:
+            await pool.close()
+
+def get_pool(db_path):
+    """Return the open pool for db_path, or None if there is none"""
+    pool = _POOLS.get(db_path)
+    if (pool is not None) and pool.is_open:
+        return pool
+    return None
+
+@asynccontextmanager
+async def connect(db_path, write=False):
+    """
+    Get a connection to the database. Uses the pool if one is open, otherwise a new
+    connection is made and closed afterwards.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    write : bool
+        If True, the pool's writer connection is used.
+    """
+    pool = get_pool(db_path)
+    if pool is None:
+        async with aiosqlite.connect(db_path) as db:
+            yield db
+    elif write:
+        async with pool.writer() as db:
+            yield db
+    else:
+        async with pool.reader() as db:
+            yield db
+
+class Transaction:
+    """
+    A unit of work on one connection. Statements are committed together when the
+    transaction() block exits, or rolled back if it raises.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._callbacks = []
+
+    async def execute(self, execute_str, *args):
+        """Execute a statement and return the number of rows changed. Args fed into execute(execute_str, (*args,))"""
+        async with self.db.execute(execute_str, (*args,)) as cursor:
+            return cursor.rowcount
+
+    async def executemany(self, execute_str, args_list):
+        """Execute a statement for every tuple of args in args_list"""
+        await self.db.executemany(execute_str, args_list)
+
+    async def fetchone(self, execute_str, *args):
+        """Execute a select and return the first row, or None"""
+        async with self.db.execute(execute_str, (*args,)) as cursor:
+            return await cursor.fetchone()
+
+    async def fetchall(self, execute_str, *args):
+        """Execute a select and return all rows"""
+        async with self.db.execute(execute_str, (*args,)) as cursor:
+            return await cursor.fetchall()
+
+    def on_commit(self, callback):
+        """Call callback() once the transaction is committed, before other writers can run"""
+        self._callbacks.append(callback)
+
+
+# used to serialize transactions when no pool is open
+_TX_LOCKS = {}
+
+@asynccontextmanager
+async def transaction(db_path):
+    """
+    Group several reads and writes into one connection and one commit.
+
+    Transactions on the same database run one at a time (they hold the pool writer, or a
+    lock when there is no pool), and start with BEGIN IMMEDIATE so that the reads inside
+    see the latest committed state. This makes read-modify-write safe when two events for
+    the same guild arrive at the same time.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+
+    Example
+    -------
+    async with transaction(db_path) as tx:
+        row = await tx.fetchone('SELECT ... WHERE guildID=?', guildID)
+        await tx.execute('UPDATE ... WHERE guildID=?', ..., guildID)
+    """
+    pool = get_pool(db_path)
+    if pool is not None:
+        conn = pool.writer()
+    else:
+        lock = _TX_LOCKS.setdefault(db_path, asyncio.Lock())
+        conn = _locked_connect(db_path, lock)
+
+    async with conn as db:
+        await db.execute('BEGIN IMMEDIATE')
+        tx = Transaction(db)
+        try:
+            yield tx
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+        for callback in tx._callbacks:
+            callback()
+
+@asynccontextmanager
+async def _locked_connect(db_path, lock):
+    async with lock:
+        async with aiosqlite.connect(db_path) as db:
+            yield db
 
 async def createTable(db_path, table_name, columns_dict):
     """
@@ -22,7 +288,7 @@ async def createTable(db_path, table_name, columns_dict):
         open(db_path, "a")
         print(f"Warning [database.createTable]: Database created at {db_path}")
 
-    async with aiosqlite.connect(db_path) as db:
+    async with connect(db_path, write=True) as db:
         async with db.cursor() as cursor:
             # Check if table exists
             await cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'")
@@ -70,7 +336,7 @@ async def db_execute(db_path, execute_str, *args, exec_type='select', fetch='one
     result : tuple, None
         The result of cursor.fetchone() or cursor.fetchall(). If exec_type is 'update', return is None.
     """
-    async with aiosqlite.connect(db_path) as db:
+    async with connect(db_path, write=(exec_type == 'update')) as db:
         async with db.cursor() as cursor:
 
             await cursor.execute(execute_str,(*args,))
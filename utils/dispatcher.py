@@ -0,0 +1,176 @@
+"""
+This contains the log dispatcher, which posts the emote logs of different guilds concurrently.
+
+Guild flushes are queued and run by a bounded number of workers, a guild being queued at most
+once at a time. Posts to the same channel are serialized by a per-channel lock, so one slow or
+rate-limited channel only holds up its own guild (discord.py already waits out the HTTP rate
+limit buckets of each route). Publishing in news channels is limited by Discord to 10 messages
+per hour per channel, so publishes are handed to a per-channel background task that waits for
+the limit instead of sleeping in the worker.
+"""
+
+import asyncio
+import collections
+import time
+
+import config
+
+logger = config.logging.getLogger("bot")
+
+
+class RateLimiter:
+    """
+    Sliding window limiter, at most rate acquisitions per `per` seconds.
+
+    Parameters
+    ----------
+    rate : int
+        The number of acquisitions allowed in a window.
+    per : float
+        The window length in seconds.
+    """
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self._times = collections.deque()
+
+    def delay(self):
+        """Seconds to wait before the next acquisition is allowed"""
+        now = time.monotonic()
+        while self._times and (now - self._times[0] >= self.per):
+            self._times.popleft()
+        if len(self._times) < self.rate:
+            return 0.
+        return self._times[0] + self.per - now
+
+    async def acquire(self):
+        """Wait until an acquisition is allowed, then take it"""
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self._times.append(time.monotonic())
+
+
+class LogDispatcher:
+    """
+    Run guild log flushes on a bounded pool of workers.
+
+    Parameters
+    ----------
+    flush : coroutine function
+        Called with a guild ID to post its log.
+    workers : int
+        The number of flushes running at the same time.
+    publish_rate : int, float
+        At most publish_rate publishes per publish_per seconds in a channel.
+    """
+
+    def __init__(self, flush, workers=4, publish_rate=10, publish_per=3600.):
+        self.flush = flush
+        self.workers = workers
+        self.publish_rate = publish_rate
+        self.publish_per = publish_per
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        self._tasks = []
+        self._channelLocks = {}
+        self._publishQueues = {} # channel ID -> deque of messages to publish
+        self._publishLimits = {} # channel ID -> RateLimiter
+        self._publishTasks = {}
+
+        # metrics
+        self._flushes = 0
+        self._failures = 0
+        self._flushTime = 0.
+        self._maxFlushTime = 0.
+        self._published = 0
+
+    def start(self):
+        """Start the workers"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers and the publishers. Queued flushes and publishes are dropped"""
+        tasks = self._tasks + list(self._publishTasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._publishTasks = {}
+
+    def submit(self, guildID):
+        """Queue the log flush of a guild, unless it is already queued. Returns True if queued"""
+        if guildID in self._queued:
+            return False
+        self._queued.add(guildID)
+        self._queue.put_nowait(guildID)
+        return True
+
+    def channel(self, channelID):
+        """The lock serializing posts to a channel, use with async with"""
+        lock = self._channelLocks.get(channelID)
+        if lock is None:
+            lock = self._channelLocks[channelID] = asyncio.Lock()
+        return lock
+
+    def publish(self, message):
+        """Queue a news channel message to publish, within the channel publish limit"""
+        channelID = message.channel.id
+        self._publishQueues.setdefault(channelID, collections.deque()).append(message)
+        task = self._publishTasks.get(channelID)
+        if (task is None) or task.done():
+            self._publishTasks[channelID] = asyncio.create_task(self._publisher(channelID))
+
+    async def _publisher(self, channelID):
+        queue = self._publishQueues[channelID]
+        limiter = self._publishLimits.setdefault(channelID, RateLimiter(self.publish_rate, self.publish_per))
+        while queue:
+            await limiter.acquire()
+            message = queue.popleft()
+            try:
+                await message.publish()
+                self._published += 1
+            except Exception as e:
+                logger.error(f"Publishing message {message.id} in channel {channelID} failed: {e}")
+        del self._publishQueues[channelID]
+
+    async def _worker(self):
+        while True:
+            guildID = await self._queue.get()
+            self._queued.discard(guildID)
+            start = time.perf_counter()
+            try:
+                await self.flush(guildID)
+            except Exception as e:
+                self._failures += 1
+                logger.error(f"Emote log flush for guild {guildID} failed: {e}")
+                continue
+            finally:
+                self._queue.task_done()
+
+            flushTime = time.perf_counter() - start
+            self._flushes += 1
+            self._flushTime += flushTime
+            self._maxFlushTime = max(self._maxFlushTime, flushTime)
+            logger.info(f"Emote log flush for guild {guildID} took {flushTime:.3f} s")
+
+    def metrics(self):
+        """
+        Return the dispatcher metrics.
+
+        Returns
+        -------
+        metrics : dict
+            The number of queued flushes and pending publishes, the number of flushes done
+            and failed, their average/max duration (s) and the number of messages published.
+        """
+        return {
+            'queued' : self._queue.qsize(),
+            'publishing' : sum(len(queue) for queue in self._publishQueues.values()),
+            'flushes' : self._flushes,
+            'failures' : self._failures,
+            'flush_avg' : self._flushTime / self._flushes if self._flushes else 0.,
+            'flush_max' : self._maxFlushTime,
+            'published' : self._published,
+        }
@@ -0,0 +1,178 @@
+"""
+This contains the downloader used to fetch emote sources, sharing one aiohttp session.
+
+Downloads never block the event loop, run concurrently up to a limit, and are streamed with a
+size cap, so a huge file is dropped as soon as it passes the cap instead of being read into
+memory first. Discord attachments are read with Attachment.read(), their size being known
+before reading. If an asset cache is given, downloads are cached by URL (without the signature
+query of Discord CDN links, which changes over time).
+"""
+
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
+
+DISCORD_CDN_HOSTS = {'cdn.discordapp.com', 'media.discordapp.net'}
+
+
+def cache_key(url):
+    """The asset cache key of a URL"""
+    parts = urlsplit(url)
+    if parts.hostname in DISCORD_CDN_HOSTS:
+        return f'{parts.scheme}://{parts.netloc}{parts.path}'
+    return url
+
+
+class DownloadError(Exception):
+    """A source could not be downloaded (bad status, too large, timeout, ...)"""
+
+
+class Downloader:
+    """
+    Download files with one long-lived aiohttp session.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Files larger than this are rejected.
+    timeout : float
+        Seconds allowed for a whole download.
+    concurrency : int
+        The number of downloads running at the same time.
+    cache : AssetCache, None
+        The cache of downloaded files. If None, nothing is cached.
+    """
+
+    def __init__(self, max_bytes=256*1024, timeout=10., concurrency=4, cache=None):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.cache = cache
+        self._session = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _get_session(self):
+        # created on first use, inside the running event loop
+        if (self._session is None) or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self):
+        """Close the session. Called on shutdown"""
+        if (self._session is not None) and (not self._session.closed):
+            await self._session.close()
+        self._session = None
+
+    async def fetch(self, source, max_bytes=None):
+        """
+        Download a source.
+
+        Parameters
+        ----------
+        source : str, discord.Attachment
+            A http(s) link or a message attachment.
+        max_bytes : int, None
+            The size cap for this download. If None, self.max_bytes.
+
+        Returns
+        -------
+        data : bytes
+            The file content.
+
+        Raises
+        ------
+        DownloadError
+            If the download failed, timed out or is larger than the cap.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if self.cache is None:
+            return await self._fetch(source, max_bytes)
+
+        key = cache_key(source if isinstance(source, str) else source.url)
+        data = await self.cache.get(key)
+        if data is None:
+            data = await self._fetch(source, max_bytes)
+            await self.cache.put(data, key)
+        elif len(data) > max_bytes:
+            raise DownloadError(f'file is too large ({len(data) // 1024} KB, max {max_bytes // 1024} KB)')
+        return data
+
+    async def _fetch(self, source, max_bytes):
+        async with self._semaphore:
+            if not isinstance(source, str): # attachment
+                if source.size > max_bytes:
+                    raise DownloadError(f'file is too large ({source.size // 1024} KB, max {max_bytes // 1024} KB)')
+                try:
+                    return await asyncio.wait_for(source.read(), self.timeout)
+                except asyncio.TimeoutError:
+                    raise DownloadError('download timed out')
+                except Exception as e:
+                    raise DownloadError(f'download failed: {e}')
+
+            try:
+                async with self._get_session().get(source) as response:
+                    if response.status != 200:
+                        raise DownloadError(f'download failed (HTTP {response.status})')
+                    if (response.content_length or 0) > max_bytes:
+                        raise DownloadError(f'file is too large ({response.content_length // 1024} KB, max {max_bytes // 1024} KB)')
+                    data = bytearray()
+                    async for chunk in response.content.iter_chunked(64*1024):
+                        data += chunk
+                        if len(data) > max_bytes:
+                            raise DownloadError(f'file is too large (max {max_bytes // 1024} KB)')
+                    return bytes(data)
+            except asyncio.TimeoutError:
+                raise DownloadError('download timed out')
+            except aiohttp.ClientError as e:
+                raise DownloadError(f'download failed: {e}')
+
+    async def fetch_head(self, source, nbytes=4096):
+        """
+        Get the first bytes of a source, ex: to tell its format before downloading it.
+
+        Served from the cache if the whole file is cached. Otherwise only nbytes are read, with a
+        Range request (servers ignoring it have the rest of the body dropped).
+
+        Returns
+        -------
+        head : bytes
+            Up to nbytes from the start of the file.
+
+        Raises
+        ------
+        DownloadError
+            If the request failed or timed out.
+        """
+        url = source if isinstance(source, str) else source.url
+        if self.cache is not None:
+            data = await self.cache.get(cache_key(url), count=False)
+            if data is not None:
+                return data[:nbytes]
+
+        async with self._semaphore:
+            try:
+                async with self._get_session().get(url, headers={'Range' : f'bytes=0-{nbytes - 1}'}) as response:
+                    if response.status not in (200, 206):
+                        raise DownloadError(f'download failed (HTTP {response.status})')
+                    head = bytearray()
+                    async for chunk in response.content.iter_chunked(nbytes):
+                        head += chunk
+                        if len(head) >= nbytes:
+                            break
+                    return bytes(head[:nbytes])
+            except asyncio.TimeoutError:
+                raise DownloadError('download timed out')
+            except aiohttp.ClientError as e:
+                raise DownloadError(f'download failed: {e}')
+
+    async def check(self, url):
+        """Check that a link can be downloaded, without reading the body. Raises DownloadError"""
+        async with self._semaphore:
+            try:
+                async with self._get_session().get(url) as response:
+                    if response.status != 200:
+                        raise DownloadError(f'download failed (HTTP {response.status})')
+            except asyncio.TimeoutError:
+                raise DownloadError('download timed out')
+            except aiohttp.ClientError as e:
+                raise DownloadError(f'download failed: {e}')
@@ -0,0 +1,193 @@
+"""
+This contains the layout of the emote display channel, the gallery of a guild's emotes.
+
+The display is a list of message texts: the static emotes in grids of maxRow rows of maxCol,
+a blank emote as separator, then the animated emotes the same way. The channel, ID and text of
+every posted message are kept in the emotedisplay_messages table (one row per message, keyed by
+guild and position), so an emote change only edits the messages whose text changed (usually the
+last few), appends the new ones and deletes the extra ones, and removing a display deletes its
+messages by ID. The channel history is never scanned. These rows are few and costly to lose (a
+lost message ID means a duplicate display and an orphaned message), so they are committed right
+away rather than through the write-behind queue.
+
+Layouts are cached per guild, selection and grid size, and keyed by a fingerprint of the guild's
+emotes, so a repeated emote display (of any server, by any user) doesn't rebuild them.
+
+emote display image posts the emotes as sprite sheets instead (see utils.images.sprite_sheet),
+SHEET_COLUMNS x SHEET_ROWS emotes per sheet. The asset cache keeps every emote tile and sheet
+under keys made of the emote IDs and names, so a re-render only draws the changed tiles.
+"""
+
+import collections
+import hashlib
+
+from utils.database import db_execute, transaction
+from utils.emotelog import grid
+
+BLANK = '<:blank:1144405351333113886>' # separator between static and animated emotes
+SHEET_COLUMNS = 10
+SHEET_ROWS = 10
+
+
+def layout(emojis, maxCol, maxRow, static=True, animated=True):
+    """
+    The message texts of a display.
+
+    Parameters
+    ----------
+    emojis : list
+        The guild emojis, in order.
+    maxCol, maxRow : int
+        The emotes per row and rows per message.
+    static, animated : bool
+        Which emotes are displayed.
+
+    Returns
+    -------
+    messages : list
+        The message texts, in the order they are posted.
+    """
+    staticMsgs = grid([str(emoji) for emoji in emojis if not emoji.animated], maxCol, maxRow) if static else []
+    animatedMsgs = grid([str(emoji) for emoji in emojis if emoji.animated], maxCol, maxRow) if animated else []
+    return staticMsgs + [BLANK] + animatedMsgs if (staticMsgs and animatedMsgs) else staticMsgs + animatedMsgs
+
+def fingerprint(emojis):
+    """A hash of the emotes of a guild that changes when one is added, removed or renamed"""
+    return hash(tuple((emoji.id, emoji.name) for emoji in emojis))
+
+def diff(old, new):
+    """
+    The message changes that turn a display into another.
+
+    Parameters
+    ----------
+    old, new : list
+        The message texts of the posted display and of the new one.
+
+    Returns
+    -------
+    edits, appends, deletes : list, list, list
+        The (index, text) of posted messages to edit, the texts to post after them, and the
+        indices of posted messages to delete (the last ones).
+    """
+    edits = [(i, text) for i, (before, text) in enumerate(zip(old, new)) if before != text]
+    return edits, new[len(old):], list(range(len(new), len(old)))
+
+def tile_key(emoji):
+    """The asset cache key of the sprite sheet tile of an emote"""
+    return f'tile:{emoji.id}:{emoji.name}'
+
+def sheet_key(emojis, columns):
+    """The asset cache key of a sprite sheet, changed by any added, removed or renamed emote"""
+    tiles = '|'.join(tile_key(emoji) for emoji in emojis)
+    return f'sheet:{columns}:' + hashlib.sha256(tiles.encode()).hexdigest()
+
+
+class LayoutCache:
+    """
+    Display layouts, least recently used dropped.
+
+    Parameters
+    ----------
+    size : int
+        The number of layouts kept.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self._layouts = collections.OrderedDict() # (guildID, static, animated, maxCol, maxRow) -> (fingerprint, messages)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, guild, maxCol, maxRow, static=True, animated=True):
+        """
+        The layout of a guild's display, see layout.
+
+        Returns
+        -------
+        messages : tuple
+            The message texts, shared with the cache (not to be changed).
+        """
+        key = (guild.id, static, animated, maxCol, maxRow)
+        emojiHash = fingerprint(guild.emojis)
+        entry = self._layouts.get(key)
+        if (entry is not None) and (entry[0] == emojiHash):
+            self.hits += 1
+            self._layouts.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        messages = tuple(layout(guild.emojis, maxCol, maxRow, static, animated))
+        self._layouts[key] = (emojiHash, messages)
+        self._layouts.move_to_end(key)
+        if len(self._layouts) > self.size:
+            self._layouts.popitem(last=False)
+        return messages
+
+    def stats(self):
+        """Cache size and hit counts, for monitoring"""
+        lookups = self.hits + self.misses
+        return {'layouts' : len(self._layouts), 'size' : self.size, 'hits' : self.hits, 'misses' : self.misses,
+                'hit_rate' : self.hits / lookups if lookups else 0.}
+
+
+class DisplayMessages:
+    """
+    The posted display messages of all guilds.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._displays = {} # guildID -> (channelID, [messageIDs], [texts]), in display order
+
+    async def load(self):
+        """Load the display messages of all guilds. Called at startup"""
+        rows = await db_execute(self.db_path, 'SELECT guildID, channelID, messageID, content FROM emotedisplay_messages ORDER BY guildID, position', fetch='all')
+        self._displays = {}
+        for guildID, channelID, messageID, content in rows:
+            _, messageIDs, texts = self._displays.setdefault(guildID, (channelID, [], []))
+            messageIDs.append(messageID)
+            texts.append(content)
+
+    def get(self, guildID):
+        """
+        The posted display of a guild.
+
+        Returns
+        -------
+        channelID, messageIDs, texts : int, list, list
+            Copies of the posted messages, in display order. (None, [], []) if there are none.
+        """
+        channelID, messageIDs, texts = self._displays.get(guildID, (None, [], []))
+        return channelID, list(messageIDs), list(texts)
+
+    def guilds(self):
+        """The guild IDs with posted display messages"""
+        return list(self._displays)
+
+    async def set(self, guildID, channelID, messageIDs, texts):
+        """Record the posted display of a guild, committing only the positions that changed"""
+        oldChannelID, oldIDs, oldTexts = self.get(guildID)
+        oldCount = len(oldIDs)
+        if channelID != oldChannelID:
+            oldIDs, oldTexts = [], []
+        changed = [(guildID, position, channelID, messageID, text)
+                   for position, (messageID, text) in enumerate(zip(messageIDs, texts))
+                   if not ((position < len(oldIDs)) and (oldIDs[position] == messageID) and (oldTexts[position] == text))]
+        if changed or (len(messageIDs) < oldCount):
+            async with transaction(self.db_path) as tx:
+                await tx.executemany('INSERT OR REPLACE INTO emotedisplay_messages (guildID, position, channelID, messageID, content) VALUES (?, ?, ?, ?, ?)', changed)
+                await tx.execute('DELETE FROM emotedisplay_messages WHERE guildID=? AND position>=?', guildID, len(messageIDs))
+        if messageIDs:
+            self._displays[guildID] = (channelID, list(messageIDs), list(texts))
+        else:
+            self._displays.pop(guildID, None)
+
+    async def clear(self, guildID):
+        """Forget the display messages of a guild"""
+        await self.set(guildID, None, [], [])
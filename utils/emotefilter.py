@@ -0,0 +1,200 @@
+"""
+This contains the emote filters of the bulk emote commands (emote rename/remove with --flags).
+
+A filter is parsed from the command words and selects the guild emotes to work on:
+
+    --match <regex>               names matching the regex (searched anywhere in the name)
+    --pattern <regex> <new name>  rename only: names matching the regex, renamed with re.sub
+                                  (groups as \\1, \\2...)
+    --animated / --static         only animated or static emotes
+    --ids <emote/ID> ...          only these emotes
+    --dry-run                     show the preview only, change nothing
+
+Filters combine (all must match). Quotes around the regex and the new name are optional.
+
+The regexes run on the event loop, so the ones that can backtrack catastrophically are refused:
+a repeat of something that repeats or branches (ex: (a+)+, (a|aa)*, (a?){30}), or more than
+MAX_PATTERN_REPEATS variable repeats in a row (ex: .*.*.*.*x, polynomial but steep even on
+32 character names).
+"""
+
+import re
+try:
+    from re import _parser as sre_parse
+except ImportError: # python < 3.11
+    import sre_parse
+
+NAME_REGEX = re.compile(r'^[A-Za-z0-9_]{2,32}$') # discord emoji names
+QUOTES = '\'"`'
+MAX_PATTERN_LENGTH = 100
+MAX_PATTERN_REPEATS = 3
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT} | ({sre_parse.POSSESSIVE_REPEAT} if hasattr(sre_parse, 'POSSESSIVE_REPEAT') else set())
+
+
+class FilterError(ValueError):
+    """The filter words are invalid"""
+
+
+def _unquote(word):
+    if (len(word) >= 2) and (word[0] in QUOTES) and (word[-1] == word[0]):
+        return word[1:-1]
+    return word
+
+def _subpatterns(av):
+    # the nested patterns of a parsed regex item
+    for value in (av if isinstance(av, (tuple, list)) else [av]):
+        if isinstance(value, sre_parse.SubPattern):
+            yield value
+        elif isinstance(value, (tuple, list)):
+            yield from _subpatterns(value)
+
+def _backtracks(parsed, repeated=False):
+    """If a parsed regex repeats something that repeats (a variable number of times) or branches"""
+    for op, av in parsed:
+        if (op is sre_parse.BRANCH) and repeated:
+            return True
+        if op in _REPEATS:
+            if repeated and (av[0] != av[1]):
+                return True
+            if any(_backtracks(subpattern, repeated or (av[1] > 1)) for subpattern in _subpatterns(av)):
+                return True
+            continue
+        if any(_backtracks(subpattern, repeated) for subpattern in _subpatterns(av)):
+            return True
+    return False
+
+def _repeats(parsed):
+    """The number of repeats of a parsed regex that can match many lengths (*, +, {m,n})"""
+    count = 0
+    for op, av in parsed:
+        if (op in _REPEATS) and (av[1] > 1) and (av[0] != av[1]):
+            count += 1
+        count += sum(_repeats(subpattern) for subpattern in _subpatterns(av))
+    return count
+
+def _compile(pattern):
+    regex = _unquote(pattern)
+    if len(regex) > MAX_PATTERN_LENGTH:
+        raise FilterError(f'Regex too long (at most {MAX_PATTERN_LENGTH} characters)')
+    try:
+        parsed = sre_parse.parse(regex)
+        if _backtracks(parsed):
+            raise FilterError(f'Regex `{pattern}` is too slow to run, avoid repeating a repeat or an alternative, ex: (a+)+ or (a|b)*')
+        if _repeats(parsed) > MAX_PATTERN_REPEATS:
+            raise FilterError(f'Regex `{pattern}` is too slow to run, use at most {MAX_PATTERN_REPEATS} of *, + or {{m,n}}')
+        return re.compile(regex)
+    except re.error as e:
+        raise FilterError(f'Invalid regex `{pattern}`: {e}')
+
+def _emoji_ids(word):
+    # accepts <:name:id>, <a:name:id>, several emotes stuck together, or plain IDs
+    ids = re.findall(r'<a?:\w+:(\d+)>', word)
+    if ids:
+        return [int(id) for id in ids]
+    if word.isdigit():
+        return [int(word)]
+    raise FilterError(f'`{word}` is not an emote or an emote ID')
+
+def is_filter(args):
+    """If the command words are a bulk filter (start with a --flag)"""
+    return bool(args) and args[0].startswith('--')
+
+
+class EmoteFilter:
+    """
+    A bulk emote selection, parsed from command words.
+
+    Parameters
+    ----------
+    args : list
+        The command words, ex: ['--pattern', "'old_(.*)'", "'new_\\1'", '--static'].
+    rename : bool
+        If True, --pattern is allowed (and required).
+
+    Raises
+    ------
+    FilterError
+        If a flag is unknown, misses its value or the regex is invalid.
+    """
+
+    def __init__(self, args, rename=False):
+        self.match = None
+        self.pattern = None
+        self.replacement = None
+        self.animated = None
+        self.ids = None
+        self.dryRun = False
+
+        args = list(args)
+        i = 0
+        while i < len(args):
+            flag = args[i].lower()
+            i += 1
+            if flag == '--match':
+                if i >= len(args):
+                    raise FilterError('--match needs a regex')
+                self.match = _compile(args[i])
+                i += 1
+            elif (flag == '--pattern') and rename:
+                if i + 1 >= len(args):
+                    raise FilterError('--pattern needs a regex and a new name')
+                self.pattern = _compile(args[i])
+                self.replacement = _unquote(args[i+1])
+                i += 2
+            elif flag in ('--animated', '--static'):
+                self.animated = (flag == '--animated')
+            elif flag == '--ids':
+                self.ids = set()
+                while (i < len(args)) and not args[i].startswith('--'):
+                    self.ids.update(_emoji_ids(args[i]))
+                    i += 1
+                if not self.ids:
+                    raise FilterError('--ids needs emotes or emote IDs')
+            elif flag == '--dry-run':
+                self.dryRun = True
+            else:
+                raise FilterError(f'Unknown option `{args[i-1]}`')
+
+        if rename and (self.pattern is None):
+            raise FilterError('Bulk rename needs --pattern <regex> <new name>')
+        if (self.match is None) and (self.pattern is None) and (self.animated is None) and (self.ids is None):
+            raise FilterError('No filter given, use --match, --animated, --static or --ids')
+
+    def select(self, emojis):
+        """The emojis matching every filter, in order"""
+        selected = []
+        for emoji in emojis:
+            if (self.ids is not None) and (emoji.id not in self.ids):
+                continue
+            if (self.animated is not None) and (emoji.animated != self.animated):
+                continue
+            if (self.match is not None) and not self.match.search(emoji.name):
+                continue
+            if (self.pattern is not None) and not self.pattern.search(emoji.name):
+                continue
+            selected.append(emoji)
+        return selected
+
+    def renames(self, emojis):
+        """
+        Plan the renames of the selected emojis.
+
+        Returns
+        -------
+        renames, invalid : list, list
+            The (emoji, new name) to apply, and the (emoji, reason) of new names discord would
+            refuse. Emojis whose name doesn't change are left out.
+        """
+        renames, invalid = [], []
+        for emoji in self.select(emojis):
+            try:
+                newName = self.pattern.sub(self.replacement, emoji.name, count=1)
+            except (re.error, IndexError) as e:
+                raise FilterError(f'Invalid new name `{self.replacement}`: {e}')
+            if newName == emoji.name:
+                continue
+            if not NAME_REGEX.match(newName):
+                invalid.append((emoji, f'`{newName}` is not a valid name (2-32 letters, digits or _)'))
+                continue
+            renames.append((emoji, newName))
+        return renames, invalid
@@ -0,0 +1,223 @@
+"""
+This contains the perceptual hash index of guild emotes, used to find near-duplicate uploads.
+
+Each emote gets a 64 bit difference hash (dHash) of its first frame: visually similar images
+(rescaled, recompressed, recolored slightly) have hashes a few bits apart, so near-duplicates
+are found by Hamming distance. Hashes are computed in the image process pool, kept in memory
+per guild and persisted in the emote_hashes table (through the write-behind queue if given).
+A guild has at most a few hundred emotes, so a lookup is a scan of a small dict of ints, a few
+microseconds.
+
+Searching all guilds at once uses a multi-index hash table (SimilarityIndex): the 64 bits are
+split in 4 chunks of 16, each chunk indexing the emotes by its value. Two hashes within distance
+d have a chunk within distance d // 4 (pigeonhole), so a search only probes the chunk values a
+few bits away from the query's, instead of scanning every emote.
+"""
+
+import itertools
+from io import BytesIO
+
+from PIL import Image
+
+from utils.database import db_execute
+from utils.writebehind import write
+
+HASH_SIZE = 8 # 8x8 bits
+
+
+def dhash(data):
+    """
+    The 64 bit difference hash of an image. Runs in a worker process.
+
+    The first frame is converted to grayscale, shrunk to 9x8 and every bit tells if a pixel is
+    brighter than its right neighbour. Transparent pixels are put on white first.
+
+    Parameters
+    ----------
+    data : bytes
+        The image file.
+
+    Returns
+    -------
+    hash : int
+        The hash, as a signed 64 bit int (the SQLite INTEGER range).
+    """
+    image = Image.open(BytesIO(data))
+    image.seek(0)
+    image = image.convert('RGBA')
+    background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+    image = Image.alpha_composite(background, image).convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = image.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row*(HASH_SIZE + 1) + col]
+            right = pixels[row*(HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def distance(hash1, hash2):
+    """The number of differing bits of two hashes"""
+    return ((hash1 ^ hash2) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# the XOR masks of each number of flipped bits in a chunk
+_FLIPS = [[sum(1 << bit for bit in bits) for bits in itertools.combinations(range(CHUNK_BITS), count)]
+          for count in range(CHUNK_BITS + 1)]
+
+def _chunks(value):
+    value &= 0xFFFFFFFFFFFFFFFF
+    return [(value >> (CHUNK_BITS*i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+class SimilarityIndex:
+    """
+    Multi-index hash table over the hashes of emotes of all guilds.
+    """
+
+    def __init__(self):
+        self._hashes = {} # emojiID -> (guildID, hash)
+        self._tables = [{} for _ in range(CHUNKS)] # chunk value -> set of emojiIDs
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, guildID, emojiID, value):
+        """Add or replace the hash of an emote"""
+        self.remove(emojiID)
+        self._hashes[emojiID] = (guildID, value)
+        for table, chunk in zip(self._tables, _chunks(value)):
+            table.setdefault(chunk, set()).add(emojiID)
+
+    def remove(self, emojiID):
+        """Remove the hash of an emote"""
+        entry = self._hashes.pop(emojiID, None)
+        if entry is None:
+            return
+        for table, chunk in zip(self._tables, _chunks(entry[1])):
+            bucket = table[chunk]
+            bucket.discard(emojiID)
+            if not bucket:
+                del table[chunk]
+
+    def search(self, value, k=10, max_distance=12):
+        """
+        Find the emotes closest to a hash, across all guilds.
+
+        Parameters
+        ----------
+        value : int
+            The query hash.
+        k : int
+            The number of results.
+        max_distance : int
+            Results further than this many bits are not returned.
+
+        Returns
+        -------
+        matches : list
+            Up to k (distance, guildID, emojiID), closest first.
+        """
+        queryChunks = _chunks(value)
+        found = {} # emojiID -> distance
+        for flips in range(max_distance // CHUNKS + 1):
+            for table, chunk in zip(self._tables, queryChunks):
+                for mask in _FLIPS[flips]:
+                    for emojiID in table.get(chunk ^ mask, ()):
+                        if emojiID not in found:
+                            found[emojiID] = distance(value, self._hashes[emojiID][1])
+            # every emote within this distance has been found
+            complete = min(CHUNKS*(flips + 1) - 1, max_distance)
+            if sum(1 for bits in found.values() if bits <= complete) >= k:
+                break
+        matches = sorted((bits, emojiID) for emojiID, bits in found.items() if bits <= max_distance)[:k]
+        return [(bits, self._hashes[emojiID][0], emojiID) for bits, emojiID in matches]
+
+
+class EmoteHashIndex:
+    """
+    The emote hashes of all guilds.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    writes : WriteBehindQueue, None
+        The queue used to persist changes. If None, every change is committed right away.
+    """
+
+    def __init__(self, db_path, writes=None):
+        self.db_path = db_path
+        self.writes = writes
+        self._hashes = {} # guildID -> {emojiID : hash}
+        self._similar = None # SimilarityIndex over all guilds, built on first use
+
+    async def load(self):
+        """Load the hashes of all guilds. Called at startup"""
+        rows = await db_execute(self.db_path, 'SELECT guildID, emojiID, hash FROM emote_hashes', fetch='all')
+        self._hashes = {}
+        for guildID, emojiID, value in rows:
+            self._hashes.setdefault(guildID, {})[emojiID] = value
+        self._similar = None
+
+    async def add(self, guildID, emojiID, value):
+        """Set the hash of an emote"""
+        self._hashes.setdefault(guildID, {})[emojiID] = value
+        if self._similar is not None:
+            self._similar.add(guildID, emojiID, value)
+        await write(self.writes, self.db_path, ('emote_hashes', guildID, emojiID),
+                    'INSERT OR REPLACE INTO emote_hashes (guildID, emojiID, hash) VALUES (?, ?, ?)',
+                    guildID, emojiID, value)
+
+    async def remove(self, guildID, emojiID):
+        """Remove the hash of an emote"""
+        hashes = self._hashes.get(guildID)
+        if (hashes is None) or (hashes.pop(emojiID, None) is None):
+            return
+        if self._similar is not None:
+            self._similar.remove(emojiID)
+        await write(self.writes, self.db_path, ('emote_hashes', guildID, emojiID),
+                    'DELETE FROM emote_hashes WHERE guildID=? AND emojiID=?', guildID, emojiID)
+
+    async def prune(self, guildID, emojiIDs):
+        """Remove the hashes of emotes not in emojiIDs, ex: deleted while the bot was offline"""
+        keep = set(emojiIDs)
+        for emojiID in [emojiID for emojiID in self._hashes.get(guildID, {}) if emojiID not in keep]:
+            await self.remove(guildID, emojiID)
+
+    def missing(self, guildID, emojiIDs):
+        """The emoji IDs with no hash yet"""
+        hashes = self._hashes.get(guildID, {})
+        return [emojiID for emojiID in emojiIDs if emojiID not in hashes]
+
+    def count(self):
+        """The number of emotes hashed, in all guilds"""
+        return sum(len(hashes) for hashes in self._hashes.values())
+
+    def similar(self):
+        """The SimilarityIndex of all guilds, built on first use and kept up to date after"""
+        if self._similar is None:
+            self._similar = SimilarityIndex()
+            for guildID, hashes in self._hashes.items():
+                for emojiID, value in hashes.items():
+                    self._similar.add(guildID, emojiID, value)
+        return self._similar
+
+    def matches(self, guildID, value, max_distance):
+        """
+        Find the emotes of a guild similar to a hash.
+
+        Returns
+        -------
+        matches : list
+            The (distance, emojiID) within max_distance, closest first.
+        """
+        found = []
+        for emojiID, other in self._hashes.get(guildID, {}).items():
+            bits = distance(value, other)
+            if bits <= max_distance:
+                found.append((bits, emojiID))
+        return sorted(found)
@@ -0,0 +1,173 @@
+"""
+This contains the pending emote log, the emotes and stickers added since the last log post.
+
+The pending entries of all guilds are kept in memory, so adding, removing or counting entries
+is O(1), and persisted as rows of the emotelog_pending table keyed by (guildID, kind, itemID),
+where kind is 'emoji' or 'sticker'. Row writes go through the write-behind queue if one is
+given, so a burst of emote events is written in one batch. The log grid is built from the
+entries when the log is posted.
+"""
+
+import time
+
+from utils.database import db_execute
+from utils.writebehind import write
+
+EMOJI = 'emoji'
+STICKER = 'sticker'
+
+
+class PendingLog:
+    """
+    The pending emote log of all guilds.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    writes : WriteBehindQueue, None
+        The queue used to persist changes. If None, every change is committed right away.
+    """
+
+    def __init__(self, db_path, writes=None):
+        self.db_path = db_path
+        self.writes = writes
+        self._pending = {} # guildID -> {kind : {itemID : addedAt}}, in the order added
+
+    async def load(self):
+        """Load the pending entries of all guilds. Called at startup"""
+        rows = await db_execute(self.db_path, 'SELECT guildID, kind, itemID, addedAt FROM emotelog_pending ORDER BY addedAt, rowid', fetch='all')
+        self._pending = {}
+        for guildID, kind, itemID, addedAt in rows:
+            self._guild(guildID)[kind][itemID] = addedAt
+
+    def _guild(self, guildID):
+        pending = self._pending.get(guildID)
+        if pending is None:
+            pending = self._pending[guildID] = {EMOJI : {}, STICKER : {}}
+        return pending
+
+    async def add(self, guildID, kind, itemID):
+        """
+        Add an entry to the pending log of a guild.
+
+        Parameters
+        ----------
+        guildID : int
+            The guild ID.
+        kind : ['emoji', 'sticker']
+            The kind of item.
+        itemID : int
+            The emoji or sticker ID.
+
+        Returns
+        -------
+        count : int
+            The number of pending entries of this kind for the guild, after adding.
+        """
+        items = self._guild(guildID)[kind]
+        if itemID not in items:
+            addedAt = items[itemID] = time.time()
+            await write(self.writes, self.db_path, ('emotelog_pending', guildID, kind, itemID),
+                        'INSERT OR REPLACE INTO emotelog_pending (guildID, kind, itemID, addedAt) VALUES (?, ?, ?, ?)',
+                        guildID, kind, itemID, addedAt)
+        return len(items)
+
+    async def remove(self, guildID, kind, itemID):
+        """Remove an entry from the pending log of a guild. Returns True if it was pending"""
+        pending = self._pending.get(guildID)
+        if (pending is None) or (itemID not in pending[kind]):
+            return False
+        del pending[kind][itemID]
+        if not (pending[EMOJI] or pending[STICKER]):
+            del self._pending[guildID]
+        await write(self.writes, self.db_path, ('emotelog_pending', guildID, kind, itemID),
+                    'DELETE FROM emotelog_pending WHERE guildID=? AND kind=? AND itemID=?',
+                    guildID, kind, itemID)
+        return True
+
+    def get(self, guildID):
+        """
+        Get the pending log of a guild.
+
+        Returns
+        -------
+        pending : dict
+            The {kind : [itemID, ...]} in the order they were added.
+        """
+        pending = self._pending.get(guildID, {EMOJI : {}, STICKER : {}})
+        return {kind : list(items) for kind, items in pending.items()}
+
+    def snapshot(self, guildID):
+        """A copy of the pending entries of a guild, {kind : {itemID : addedAt}}, for restore"""
+        pending = self._pending.get(guildID, {EMOJI : {}, STICKER : {}})
+        return {kind : dict(items) for kind, items in pending.items()}
+
+    async def restore(self, guildID, snapshot):
+        """
+        Put back entries taken from the pending log of a guild (ex: the log post failed), with
+        their original time. Entries added since are kept.
+        """
+        for kind, items in snapshot.items():
+            for itemID, addedAt in items.items():
+                current = self._guild(guildID)[kind]
+                if itemID in current:
+                    continue
+                current[itemID] = addedAt
+                await write(self.writes, self.db_path, ('emotelog_pending', guildID, kind, itemID),
+                            'INSERT OR REPLACE INTO emotelog_pending (guildID, kind, itemID, addedAt) VALUES (?, ?, ?, ?)',
+                            guildID, kind, itemID, addedAt)
+        pending = self._pending.get(guildID)
+        if pending is not None:
+            # restored entries go back before the ones added since
+            for kind in pending:
+                pending[kind] = dict(sorted(pending[kind].items(), key=lambda item: item[1]))
+            if not (pending[EMOJI] or pending[STICKER]):
+                del self._pending[guildID]
+
+    async def take(self, guildID):
+        """Get the pending log of a guild like get, and clear it"""
+        pending = self.get(guildID)
+        await self.clear(guildID)
+        return pending
+
+    async def clear(self, guildID):
+        """Clear the pending log of a guild"""
+        self._pending.pop(guildID, None)
+        await write(self.writes, self.db_path, ('emotelog_pending', guildID), 'DELETE FROM emotelog_pending WHERE guildID=?', guildID)
+
+    def first_added(self, guildID):
+        """The time.time() of the oldest pending entry of a guild, None if nothing is pending"""
+        pending = self._pending.get(guildID)
+        if pending is None:
+            return None
+        return min(next(iter(items.values())) for items in pending.values() if items)
+
+    def guilds(self):
+        """The IDs of the guilds with a pending log"""
+        return list(self._pending)
+
+def grid(items, maxCol, maxRow=None):
+    """
+    Lay out items (emote strings) in rows of maxCol.
+
+    Parameters
+    ----------
+    items : list
+        The strings to lay out.
+    maxCol : int
+        The number of items per row.
+    maxRow : int, None
+        If given, the number of rows per message.
+
+    Returns
+    -------
+    messages : list
+        The message texts, one per maxRow rows (a single message if maxRow is None).
+    """
+    maxCol = max(int(maxCol), 1)
+    rows = [''.join(items[i:i+maxCol]) for i in range(0, len(items), maxCol)]
+    if not maxRow:
+        return ['\n'.join(rows)] if rows else []
+    maxRow = max(int(maxRow), 1)
+    return ['\n'.join(rows[i:i+maxRow]) for i in range(0, len(rows), maxRow)]
@@ -0,0 +1,205 @@
+"""
+This contains the emote name search index, over the emotes of all guilds.
+
+Names are lowercased and indexed by their trigrams (every 3 character substring), each trigram
+mapping to the set of emoji IDs whose name contains it:
+
+    - names starting with the query come first, from a sorted list of names (bisect), which is
+      all there is for queries shorter than 3 characters
+    - substring queries intersect the sets of the query trigrams, smallest first, and only check
+      the few candidates left. When even the smallest set is large (a common query), its names
+      are checked lazily until enough are found, so the cost depends on the number of results
+      asked, not on the number of matches
+    - fuzzy queries (typos) rank the names sharing the most trigrams with the query, counting
+      over the rarest trigrams only, so a common trigram doesn't make every name a candidate
+
+The index is built once at startup, in a thread (rebuild), and updated per emote from the emoji
+update events. Updates made while the thread runs apply to the previous index and are replayed
+on the new one once it is swapped in. See benchmarks/bench_search.py for build time, memory and
+query latency on 500k emotes.
+"""
+
+import asyncio
+import bisect
+import collections
+import heapq
+import itertools
+
+FUZZY_MAX_POSTINGS = 20000 # trigrams in more names than this are too common to rank fuzzy matches
+FUZZY_TRIGRAMS = 4 # fuzzy matches are counted over this many of the rarest query trigrams
+SMALL_POSTINGS = 500 # substring matches are ranked (shortest names first) below this many candidates
+
+
+def _normalize(name):
+    return name.strip(':').lower()
+
+def _trigrams(name):
+    return {name[i:i+3] for i in range(len(name) - 2)}
+
+def _index(names):
+    # the trigram postings and sorted names of {emojiID : normalized name}
+    trigrams = collections.defaultdict(set)
+    for emojiID, name in names.items():
+        for trigram in _trigrams(name):
+            trigrams[trigram].add(emojiID)
+    return trigrams, sorted((name, emojiID) for emojiID, name in names.items())
+
+
+class EmoteNameIndex:
+    """
+    Trigram and prefix index over emote names.
+    """
+
+    def __init__(self):
+        self._names = {} # emojiID -> normalized name
+        self._trigrams = collections.defaultdict(set) # trigram -> emojiIDs
+        self._sorted = [] # (normalized name, emojiID), sorted
+        self._replay = None # the updates made during a rebuild, [(before, after)]
+
+    def __len__(self):
+        return len(self._names)
+
+    def build(self, emojis):
+        """Index emojis from scratch"""
+        self._names = {emoji.id : _normalize(emoji.name) for emoji in emojis}
+        self._trigrams, self._sorted = _index(self._names)
+
+    async def rebuild(self, emojis):
+        """
+        Index emojis from scratch in a thread, ex: bot.emojis at startup (seconds for hundreds of
+        thousands of emotes). Searches and updates use the previous index meanwhile, and the
+        updates are replayed on the new one.
+        """
+        names = {emoji.id : _normalize(emoji.name) for emoji in emojis}
+        self._replay = []
+        try:
+            trigrams, ordered = await asyncio.to_thread(_index, names)
+        finally:
+            replay, self._replay = self._replay, None
+        self._names, self._trigrams, self._sorted = names, trigrams, ordered
+        for before, after in replay:
+            self.update(before, after)
+
+    def add(self, emojiID, name):
+        """Add an emote, or update its name"""
+        self.remove(emojiID)
+        name = _normalize(name)
+        self._names[emojiID] = name
+        for trigram in _trigrams(name):
+            self._trigrams[trigram].add(emojiID)
+        bisect.insort(self._sorted, (name, emojiID))
+
+    def remove(self, emojiID):
+        """Remove an emote"""
+        name = self._names.pop(emojiID, None)
+        if name is None:
+            return
+        for trigram in _trigrams(name):
+            postings = self._trigrams[trigram]
+            postings.discard(emojiID)
+            if not postings:
+                del self._trigrams[trigram]
+        i = bisect.bisect_left(self._sorted, (name, emojiID))
+        if (i < len(self._sorted)) and (self._sorted[i] == (name, emojiID)):
+            del self._sorted[i]
+
+    def update(self, before, after):
+        """Apply an emoji update event, from the before and after emoji lists of a guild"""
+        if self._replay is not None:
+            self._replay.append((list(before), list(after)))
+        afterNames = {emoji.id : emoji.name for emoji in after}
+        for emoji in before:
+            if emoji.id not in afterNames:
+                self.remove(emoji.id)
+        for emojiID, name in afterNames.items():
+            if self._names.get(emojiID) != _normalize(name):
+                self.add(emojiID, name)
+
+    def _prefix(self, query, limit):
+        found = []
+        i = bisect.bisect_left(self._sorted, (query,))
+        while (i < len(self._sorted)) and self._sorted[i][0].startswith(query) and (len(found) < limit):
+            found.append(self._sorted[i][1])
+            i += 1
+        return found
+
+    def _substring(self, query, limit, exclude):
+        postings = sorted((self._trigrams.get(trigram, set()) for trigram in _trigrams(query)), key=len)
+        names = self._names
+        candidates = postings[0] if len(postings) == 1 else postings[0] & postings[1]
+        if len(candidates) <= SMALL_POSTINGS:
+            candidates = candidates.intersection(*postings[2:])
+            return self._ranked({emojiID for emojiID in candidates if (query in names[emojiID]) and (emojiID not in exclude)}, limit)
+
+        found = []
+        for emojiID in candidates:
+            if (query in names[emojiID]) and (emojiID not in exclude):
+                found.append(emojiID)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _fuzzy(self, query, limit, exclude):
+        # the rarest query trigrams that are in the index
+        postings = sorted((self._trigrams.get(trigram, ()) for trigram in _trigrams(query)), key=len)
+        postings = [ids for ids in postings if 0 < len(ids) <= FUZZY_MAX_POSTINGS][:FUZZY_TRIGRAMS]
+        if len(postings) < 2:
+            return self._ranked(postings[0] - exclude, limit) if postings else []
+
+        # names sharing all of them first, then one less, down to 2 (set operations, no per name
+        # work), stopping as soon as there are enough
+        found = []
+        for shared in range(len(postings), 1, -1):
+            tier = None
+            for first, *others in itertools.combinations(postings, shared):
+                if tier is None:
+                    tier = first.intersection(*others)
+                else:
+                    tier |= first.intersection(*others)
+                if len(tier) > SMALL_POSTINGS: # too many to rank, any will do
+                    break
+            tier.difference_update(exclude, found)
+            found += self._ranked(tier, limit - len(found))
+            if len(found) >= limit:
+                break
+        return found
+
+    def _ranked(self, emojiIDs, limit):
+        """The shortest names first, or any if there are too many to rank"""
+        names = self._names
+        if len(emojiIDs) > SMALL_POSTINGS:
+            return list(itertools.islice(emojiIDs, limit))
+        return heapq.nsmallest(limit, emojiIDs, key=lambda emojiID: (len(names[emojiID]), names[emojiID]))
+
+    def search(self, query, limit=25, fuzzy=True):
+        """
+        Find emotes by name.
+
+        Parameters
+        ----------
+        query : str
+            Part of a name, case insensitive.
+        limit : int
+            The max number of results.
+        fuzzy : bool
+            If True, fill the results with close names (typos) after the substring matches.
+
+        Returns
+        -------
+        emojiIDs : list
+            The matching emoji IDs: names starting with the query first (alphabetically, so an
+            exact name comes first), then containing it (shortest names first, unless there are
+            many), then fuzzy matches.
+        """
+        query = _normalize(query)
+        if not query:
+            return []
+        found = self._prefix(query, limit)
+        if len(query) < 3:
+            return found
+
+        if len(found) < limit:
+            found += self._substring(query, limit - len(found), set(found))
+        if fuzzy and (len(found) < limit):
+            found += self._fuzzy(query, limit - len(found), set(found))
+        return found
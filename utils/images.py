@@ -0,0 +1,328 @@
+"""
+This contains the image normalization of emote uploads.
+
+Downloaded sources are converted so Discord accepts them on the first try: static images become
+PNG and animated ones (GIF, APNG, animated WebP) become GIF, scaled to fit the emoji dimensions
+and recompressed until they fit the emoji size limit, dropping frames of long animations.
+Sources that already fit are passed through untouched, except APNG (Discord would make it a
+static emoji).
+
+The work is CPU bound, so it runs in a process pool, off the event loop. Results are cached by
+the sha256 of the input, so the same source uploaded again (or to another server) is not
+processed twice.
+
+The pool also renders the sprite sheets of emote display image: every emote becomes a labeled
+tile (its first frame, scaled, with its name below), and the tiles are pasted into sheets.
+Tiles and sheets are small PNGs, kept in the asset cache by the caller, so a re-render only
+draws the tiles of new or renamed emotes and only pastes the sheets whose tiles changed.
+"""
+
+import asyncio
+import collections
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont, ImageSequence, UnidentifiedImageError
+
+from utils.emotehash import dhash
+
+EMOJI_MAX_BYTES = 256*1024
+EMOJI_MAX_SIZE = 128 # px, Discord shows emojis at most this large
+PASS_FORMATS = {'PNG', 'JPEG', 'GIF'}
+SOURCE_MAX_PIXELS = 4096*4096 # per frame, larger sources are refused before decoding
+SOURCE_MAX_FRAMES = 1000
+SOURCE_MAX_TOTAL_PIXELS = 256*1024*1024 # over all frames, bounds the decoding work of an animation
+TILE_EMOJI_SIZE = 64 # px, the emote in a sprite sheet tile
+TILE_LABEL_HEIGHT = 20 # px, the name below it
+TILE_PADDING = 16 # px, around the emote, the width left for the name
+TILE_BACKGROUND = (49, 51, 56, 255) # discord dark theme
+TILE_TEXT = (219, 222, 225, 255)
+
+
+class ImageError(Exception):
+    """A source is not an image, or can't be made to fit the emoji limits"""
+
+
+def sniff_animated(head):
+    """
+    Tell if an image is animated from its first bytes, without decoding it.
+
+    Parameters
+    ----------
+    head : bytes
+        The start of the file (a few KB).
+
+    Returns
+    -------
+    animated : bool, None
+        True for GIF (uploaded as an animated emoji), APNG and animated WebP, False for other
+        PNG, WebP and JPEG, None if it can't be told.
+    """
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return True
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        # the animation control chunk comes before the first image data
+        actl, idat = head.find(b'acTL'), head.find(b'IDAT')
+        if (actl != -1) and ((idat == -1) or (actl < idat)):
+            return True
+        return False if idat != -1 else None
+    if (head[:4] == b'RIFF') and (head[8:12] == b'WEBP'):
+        if head[12:16] == b'VP8X':
+            return bool(head[20] & 0x02) if len(head) > 20 else None
+        return False
+    if head[:3] == b'\xff\xd8\xff':
+        return False
+    return None
+
+def _scaled(size, maxSize):
+    width, height = size
+    scale = min(1., maxSize / max(width, height))
+    return max(1, round(width*scale)), max(1, round(height*scale))
+
+def _save_static(image, size):
+    image = image.convert('RGBA').resize(_scaled(image.size, size), Image.LANCZOS)
+    out = BytesIO()
+    image.save(out, format='PNG', optimize=True)
+    return out.getvalue(), image
+
+def _save_animated(frames, durations, size):
+    size = _scaled(frames[0].size, size)
+    frames = [frame.resize(size, Image.LANCZOS) for frame in frames]
+    out = BytesIO()
+    frames[0].save(out, format='GIF', save_all=True, append_images=frames[1:], duration=durations,
+                   loop=0, disposal=2, optimize=True)
+    return out.getvalue()
+
+def normalize(data, max_bytes=EMOJI_MAX_BYTES, max_size=EMOJI_MAX_SIZE, max_frames=60):
+    """
+    Convert an image so it fits the emoji limits. Runs in a worker process.
+
+    Parameters
+    ----------
+    data : bytes
+        The source file.
+    max_bytes : int
+        The emoji size limit.
+    max_size : int
+        The largest width/height in pixels.
+    max_frames : int
+        Longer animations keep every n-th frame, with longer frame durations.
+
+    Returns
+    -------
+    data, animated : bytes, bool
+        The normalized file (PNG or GIF), and whether it is animated.
+
+    Raises
+    ------
+    ImageError
+        If the source is not an image, is too large to decode or can't be made small enough.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        # a small file can hold huge or countless frames, checked from the headers before decoding
+        width, height = image.size
+        frameCount = getattr(image, 'n_frames', 1)
+        if width*height > SOURCE_MAX_PIXELS:
+            raise ImageError(f'image is too large ({width}x{height} pixels)')
+        if (frameCount > SOURCE_MAX_FRAMES) or (width*height*frameCount > SOURCE_MAX_TOTAL_PIXELS):
+            raise ImageError(f'animation is too large ({frameCount} frames of {width}x{height} pixels)')
+        image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageError(f'not a supported image ({e})')
+    # discord makes every GIF an animated emoji
+    animated = (image.format == 'GIF') or (getattr(image, 'n_frames', 1) > 1)
+
+    # APNG passed as is would be a static emoji, it becomes a GIF like the other animations
+    apng = (image.format == 'PNG') and getattr(image, 'is_animated', False)
+    if (len(data) <= max_bytes) and (image.format in PASS_FORMATS) and (max(image.size) <= max_size) and not apng:
+        return data, animated
+
+    if not animated:
+        size = max_size
+        while size >= 16:
+            out, scaledImage = _save_static(image, size)
+            if len(out) <= max_bytes:
+                return out, False
+            # fewer colors before fewer pixels
+            quantized = BytesIO()
+            scaledImage.quantize(256, method=Image.FASTOCTREE).save(quantized, format='PNG', optimize=True)
+            if quantized.tell() <= max_bytes:
+                return quantized.getvalue(), False
+            size = int(size*0.75)
+        raise ImageError('image is too large, even scaled down')
+
+    # keep every step-th frame, scaled down as it is decoded, each lasting the frames it replaces
+    step = -(-frameCount // max_frames)
+    frames, durations = [], []
+    for i, frame in enumerate(ImageSequence.Iterator(image)):
+        duration = frame.info.get('duration', image.info.get('duration', 100)) or 100
+        if i % step:
+            durations[-1] += duration
+            continue
+        frame = frame.convert('RGBA')
+        frame.thumbnail((max_size, max_size), Image.LANCZOS)
+        frames.append(frame)
+        durations.append(duration)
+
+    size = max_size
+    while True:
+        if len(frames) > max_frames:
+            step = -(-len(frames) // max_frames)
+            frames, durations = frames[::step], [sum(durations[i:i+step]) for i in range(0, len(durations), step)]
+        out = _save_animated(frames, durations, size)
+        if len(out) <= max_bytes:
+            return out, True
+        # halve the frames first, then the size
+        if len(frames) > 8:
+            max_frames = len(frames) // 2
+        elif size > 32:
+            size = int(size*0.75)
+        else:
+            raise ImageError('animation is too large, even with fewer frames')
+
+def _label(draw, name, font, width):
+    # the name, shortened with ... to fit the width
+    if draw.textlength(name, font=font) <= width:
+        return name
+    while name and (draw.textlength(name + '...', font=font) > width):
+        name = name[:-1]
+    return name + '...'
+
+def render_tile(data, name, size=TILE_EMOJI_SIZE):
+    """
+    Draw the sprite sheet tile of an emote. Runs in a worker process.
+
+    Parameters
+    ----------
+    data : bytes, None
+        The emote image (the first frame is used). If None (ex: the download failed), the tile
+        only has the name.
+    name : str
+        The emote name, drawn below it.
+    size : int
+        The largest width/height of the emote in pixels.
+
+    Returns
+    -------
+    tile : bytes
+        The tile PNG, (size + TILE_PADDING) x (size + TILE_PADDING + TILE_LABEL_HEIGHT).
+    """
+    width = size + TILE_PADDING
+    tile = Image.new('RGBA', (width, width + TILE_LABEL_HEIGHT), TILE_BACKGROUND)
+    if data is not None:
+        try:
+            image = Image.open(BytesIO(data))
+            image.seek(0)
+            image = image.convert('RGBA')
+            image = image.resize(_scaled(image.size, size), Image.LANCZOS) if max(image.size) > size else image
+            offset = ((width - image.width) // 2, (width - image.height) // 2)
+            tile.alpha_composite(image, offset)
+        except (UnidentifiedImageError, OSError):
+            pass
+    draw = ImageDraw.Draw(tile)
+    font = ImageFont.load_default(size=TILE_LABEL_HEIGHT - 8)
+    label = _label(draw, name, font, width - 4)
+    draw.text((width // 2, width + TILE_LABEL_HEIGHT // 2 - 2), label, font=font, fill=TILE_TEXT, anchor='mm')
+    out = BytesIO()
+    tile.save(out, format='PNG')
+    return out.getvalue()
+
+def sprite_sheet(tiles, columns):
+    """
+    Paste tiles into a sprite sheet, row by row. Runs in a worker process.
+
+    Parameters
+    ----------
+    tiles : list
+        The tile PNGs (see render_tile), all the same size.
+    columns : int
+        The tiles per row.
+
+    Returns
+    -------
+    sheet : bytes
+        The sheet PNG.
+    """
+    images = [Image.open(BytesIO(tile)) for tile in tiles]
+    tileWidth, tileHeight = images[0].size
+    columns = min(columns, len(images))
+    rows = -(-len(images) // columns)
+    sheet = Image.new('RGBA', (columns*tileWidth, rows*tileHeight), TILE_BACKGROUND)
+    for i, image in enumerate(images):
+        sheet.paste(image, ((i % columns)*tileWidth, (i // columns)*tileHeight))
+    out = BytesIO()
+    sheet.save(out, format='PNG')
+    return out.getvalue()
+
+
+class ImagePipeline:
+    """
+    Normalize images in a process pool, with a cache keyed by input hash.
+
+    Parameters
+    ----------
+    workers : int
+        The number of worker processes.
+    cache_size : int
+        The number of results kept (least recently used are dropped).
+    """
+
+    def __init__(self, workers=2, cache_size=256):
+        self.workers = workers
+        self.cache_size = cache_size
+        self._executor = None
+        self._cache = collections.OrderedDict() # sha256 -> (data, animated)
+        self.hits = 0
+        self.misses = 0
+
+    def _get_executor(self):
+        # started on first use, so the workers are not forked at import
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def close(self):
+        """Shut down the worker processes. Called on shutdown"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def normalize(self, data):
+        """
+        Normalize an image, see normalize. Cached by the sha256 of data.
+
+        Returns
+        -------
+        data, animated : bytes, bool
+        """
+        key = hashlib.sha256(data).hexdigest()
+        result = self._cache.get(key)
+        if result is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return result
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._get_executor(), normalize, data)
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def dhash(self, data):
+        """The perceptual hash of an image (see utils.emotehash.dhash), in a worker process"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), dhash, data)
+
+    async def tile(self, data, name, size=TILE_EMOJI_SIZE):
+        """The sprite sheet tile of an emote (see render_tile), in a worker process"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), render_tile, data, name, size)
+
+    async def sheet(self, tiles, columns):
+        """A sprite sheet of tiles (see sprite_sheet), in a worker process"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), sprite_sheet, tiles, columns)
@@ -0,0 +1,163 @@
+"""
+This contains the schema migrations of the database.
+
+The schema is described by DATABASE_TABLES (guild settings tables, one row per guild) and by
+MIGRATIONS (anything DATABASE_TABLES can't describe: other tables, indexes, data changes).
+The database stores the number of migrations applied and a hash of DATABASE_TABLES in the
+`schema` table, so when nothing changed, startup costs a single select. Otherwise all pending
+work runs in one transaction.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+import aiosqlite
+
+import config
+from utils.database import db_execute, transaction
+
+logger = config.logging.getLogger("bot")
+
+
+async def _pending_emote_log(tx):
+    """Move the emotelog updateMessage/updateMessageStickers text into emotelog_pending rows"""
+    await tx.execute(
+        'CREATE TABLE IF NOT EXISTS emotelog_pending ('
+        'guildID INTEGER, kind TEXT, itemID INTEGER, addedAt REAL, '
+        'PRIMARY KEY (guildID, kind, itemID))'
+    )
+    await tx.execute('CREATE INDEX IF NOT EXISTS emotelog_pending_added ON emotelog_pending (guildID, addedAt)')
+
+    oldColumns = ['updateMessage', 'updateMessageStickers', 'messageColumnCount', 'messageRowCount']
+    existing_column_names = [column[1] for column in await tx.fetchall("PRAGMA table_info(emotelog)")]
+    if 'updateMessage' not in existing_column_names:
+        return
+
+    now = time.time()
+    rows = []
+    for guildID, updateMsg, updateMsgSt in await tx.fetchall("SELECT guildID, updateMessage, updateMessageStickers FROM emotelog WHERE updateMessage != '' OR updateMessageStickers != ''"):
+        for order, emojiID in enumerate(re.findall(r'<a?:\w+:(\d+)>', updateMsg or '')):
+            rows.append((guildID, 'emoji', int(emojiID), now + order*1e-6))
+        for order, stickerID in enumerate(str(updateMsgSt or '').split()):
+            rows.append((guildID, 'sticker', int(stickerID), now + order*1e-6))
+    await tx.executemany('INSERT OR IGNORE INTO emotelog_pending (guildID, kind, itemID, addedAt) VALUES (?, ?, ?, ?)', rows)
+
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        for column in oldColumns:
+            if column in existing_column_names:
+                await tx.execute(f'ALTER TABLE emotelog DROP COLUMN {column}')
+    else:
+        await tx.execute("UPDATE emotelog SET updateMessage='', updateMessageStickers=''")
+
+
+async def _emote_hashes(tx):
+    """Perceptual hashes of guild emotes, see utils.emotehash"""
+    await tx.execute(
+        'CREATE TABLE IF NOT EXISTS emote_hashes ('
+        'guildID INTEGER, emojiID INTEGER, hash INTEGER, '
+        'PRIMARY KEY (guildID, emojiID))'
+    )
+
+
+async def _display_messages(tx):
+    """Move the emotedisplay message IDs (comma separated in the message column) into emotedisplay_messages rows"""
+    await tx.execute(
+        'CREATE TABLE IF NOT EXISTS emotedisplay_messages ('
+        'guildID INTEGER, position INTEGER, channelID INTEGER, messageID INTEGER, content TEXT, '
+        'PRIMARY KEY (guildID, position))'
+    )
+    rows = []
+    for guildID, channelID, messageIDs in await tx.fetchall("SELECT guildID, displayChannelID, message FROM emotedisplay WHERE message != ''"):
+        # the texts are unknown, the next display update edits every message once
+        for position, messageID in enumerate(re.findall(r'\d+', str(messageIDs))):
+            rows.append((guildID, position, channelID, int(messageID), ''))
+    await tx.executemany('INSERT OR IGNORE INTO emotedisplay_messages (guildID, position, channelID, messageID, content) VALUES (?, ?, ?, ?, ?)', rows)
+    await tx.execute("UPDATE emotedisplay SET message='', messageCount=0 WHERE message != ''")
+
+
+# Append only: migration i brings the database to schema version i + 1. Each is a
+# (description, async function(tx)) pair, run after the DATABASE_TABLES tables are synced.
+MIGRATIONS = [
+    ('emotelog pending entries table', _pending_emote_log),
+    ('emote perceptual hashes table', _emote_hashes),
+    ('emote display messages table', _display_messages),
+]
+
+
+def tables_hash(tables):
+    """The hash of a DATABASE_TABLES dictionary, used to detect schema changes"""
+    return hashlib.sha256(json.dumps(tables, sort_keys=True).encode()).hexdigest()
+
+async def schema_state(db_path):
+    """
+    Get the stored schema state.
+
+    Returns
+    -------
+    version, tablesHash : int, str
+        The number of migrations applied and the DATABASE_TABLES hash. (0, '') for a new database.
+    """
+    try:
+        row = await db_execute(db_path, 'SELECT version, tablesHash FROM schema')
+    except aiosqlite.OperationalError: # no schema table yet
+        row = None
+    return row if row is not None else (0, '')
+
+async def _sync_tables(tx, tables):
+    """Create missing tables and add missing columns with their default values"""
+    for table_name, columns_dict in tables.items():
+        columns_definition = ', '.join(columns_dict.keys())
+        await tx.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_definition})")
+
+        existing_column_names = [column[1] for column in await tx.fetchall(f"PRAGMA table_info({table_name})")]
+        for col_def, col_default in columns_dict.items():
+            col_name = col_def.split(' ')[0]
+            if col_name not in existing_column_names:
+                await tx.execute(f"ALTER TABLE {table_name} ADD {col_name} DEFAULT {col_default}")
+
+async def migrate(db_path, tables):
+    """
+    Bring the database schema up to date with DATABASE_TABLES and MIGRATIONS.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    tables : dict
+        The DATABASE_TABLES dictionary, {table name : {column definition : default value}}.
+
+    Returns
+    -------
+    timings : list
+        The (description, seconds) of every step that ran. Empty if the schema was up to date.
+    """
+    version, storedHash = await schema_state(db_path)
+    newHash = tables_hash(tables)
+    if (version == len(MIGRATIONS)) and (storedHash == newHash):
+        return []
+    if version > len(MIGRATIONS):
+        raise RuntimeError(f"Error in utils.migrations.migrate: database schema version {version} is newer than this code ({len(MIGRATIONS)})")
+
+    timings = []
+    async with transaction(db_path) as tx:
+        if storedHash != newHash:
+            start = time.perf_counter()
+            await _sync_tables(tx, tables)
+            timings.append(('sync DATABASE_TABLES', time.perf_counter() - start))
+
+        for description, migration in MIGRATIONS[version:]:
+            start = time.perf_counter()
+            await migration(tx)
+            timings.append((description, time.perf_counter() - start))
+
+        await tx.execute('CREATE TABLE IF NOT EXISTS schema (version INTEGER, tablesHash TEXT)')
+        await tx.execute('DELETE FROM schema')
+        await tx.execute('INSERT INTO schema (version, tablesHash) VALUES (?, ?)', len(MIGRATIONS), newHash)
+
+    for description, seconds in timings:
+        logger.info(f"Migration '{description}' took {1000*seconds:.1f} ms")
+    logger.info(f"Database schema migrated from version {version} to {len(MIGRATIONS)}")
+    return timings
@@ -0,0 +1,105 @@
+"""
+This contains the per-guild REST job scheduling used by bulk emote commands.
+
+Discord rate limits emoji creation per guild, so concurrent creates in one guild only queue up
+behind the same bucket (and risk long 429 waits), while different guilds have their own. The
+scheduler gives each guild a bounded number of REST slots, so bulk commands in one guild are
+paced and never hold up another guild. StatusMessage reports the progress of a long command
+by editing a single message, throttled to stay clear of the message edit rate limit.
+"""
+
+import asyncio
+import time
+
+MESSAGE_MAX_LENGTH = 2000
+
+
+class GuildRestScheduler:
+    """
+    Per-guild REST slots.
+
+    Parameters
+    ----------
+    concurrency : int
+        The number of calls running at the same time in one guild.
+    """
+
+    def __init__(self, concurrency=1):
+        self.concurrency = concurrency
+        self._slots = {} # guildID -> [semaphore, users]
+
+    def slot(self, guildID):
+        """Wait for a REST slot of a guild, use with async with"""
+        return _Slot(self, guildID)
+
+    def busy(self, guildID):
+        """The number of calls running or waiting in a guild"""
+        return self._slots[guildID][1] if guildID in self._slots else 0
+
+
+class _Slot:
+    def __init__(self, scheduler, guildID):
+        self.scheduler = scheduler
+        self.guildID = guildID
+
+    async def __aenter__(self):
+        slots = self.scheduler._slots
+        if self.guildID not in slots:
+            slots[self.guildID] = [asyncio.Semaphore(self.scheduler.concurrency), 0]
+        slots[self.guildID][1] += 1
+        try:
+            await slots[self.guildID][0].acquire()
+        except BaseException:
+            self._release(acquired=False)
+            raise
+
+    async def __aexit__(self, *exc):
+        self._release(acquired=True)
+
+    def _release(self, acquired):
+        slots = self.scheduler._slots
+        semaphore, users = slots[self.guildID]
+        if acquired:
+            semaphore.release()
+        if users == 1: # drop idle guilds
+            del slots[self.guildID]
+        else:
+            slots[self.guildID][1] = users - 1
+
+
+def split_message(lines, limit=MESSAGE_MAX_LENGTH):
+    """Join lines into as few messages as possible under the length limit"""
+    messages = ['']
+    for line in lines:
+        line = line[:limit]
+        if messages[-1] and (len(messages[-1]) + 1 + len(line) > limit):
+            messages.append(line)
+        else:
+            messages[-1] = f'{messages[-1]}\n{line}' if messages[-1] else line
+    return [message for message in messages if message]
+
+
+class StatusMessage:
+    """
+    A message edited to report progress.
+
+    Parameters
+    ----------
+    message : discord.Message
+        The status message, sent by the bot.
+    interval : float
+        Minimum seconds between two edits, except forced ones.
+    """
+
+    def __init__(self, message, interval=2.):
+        self.message = message
+        self.interval = interval
+        self._lastEdit = time.monotonic()
+
+    async def update(self, content, force=False):
+        """Edit the message, unless it was edited less than interval seconds ago and not forced"""
+        now = time.monotonic()
+        if (not force) and (now - self._lastEdit < self.interval):
+            return
+        self._lastEdit = now
+        await self.message.edit(content=content[:MESSAGE_MAX_LENGTH])
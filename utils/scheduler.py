@@ -0,0 +1,202 @@
+"""
+This contains the deadline scheduler, which runs a callback for a key at a given time.
+
+Deadlines are kept in a heap, and the background task sleeps until the earliest one, so its cost
+scales with the number of scheduled keys, not with the number of guilds. Rescheduling or
+cancelling a key leaves its old heap entry in place; stale entries are skipped when popped
+and the heap is compacted when they outnumber the live ones.
+
+The debouncer builds on it: every trigger of a key pushes its deadline back, so a burst of
+triggers runs the callback once, after a quiet period. A run still going when the key is
+triggered again is cancelled, since its result is already stale.
+"""
+
+import asyncio
+import heapq
+import time
+
+import config
+
+logger = config.logging.getLogger("bot")
+
+
+class DeadlineScheduler:
+    """
+    Run an async callback(key) once per scheduled key, when its deadline is reached.
+
+    Parameters
+    ----------
+    callback : coroutine function
+        Called with the key when its deadline is reached.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._deadlines = {} # key -> deadline (time.monotonic)
+        self._heap = [] # (deadline, key), may hold stale entries
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay, replace=False):
+        """
+        Schedule the callback for a key.
+
+        Parameters
+        ----------
+        key : hashable
+            The key, ex: a guild ID.
+        delay : float
+            Seconds from now.
+        replace : bool
+            If False and the key is already scheduled, keep the current deadline.
+
+        Returns
+        -------
+        scheduled : bool
+            True if the deadline was set.
+        """
+        if (not replace) and (key in self._deadlines):
+            return False
+        deadline = time.monotonic() + max(delay, 0)
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if self._heap[0] == (deadline, key): # new earliest deadline
+            self._wakeup.set()
+        if len(self._heap) > 2*len(self._deadlines) + 64:
+            self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def cancel(self, key):
+        """Unschedule a key. Returns True if it was scheduled"""
+        return self._deadlines.pop(key, None) is not None
+
+    def deadline(self, key):
+        """Seconds until the deadline of a key, None if it is not scheduled"""
+        deadline = self._deadlines.get(key)
+        return None if deadline is None else deadline - time.monotonic()
+
+    def start(self):
+        """Start the background task"""
+        if (self._task is None) or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task. Scheduled keys are kept"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _pop_due(self):
+        """Pop the keys whose deadline passed"""
+        now = time.monotonic()
+        due = []
+        while self._heap and (self._heap[0][0] <= now):
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            for key in self._pop_due():
+                try:
+                    await self.callback(key)
+                except Exception as e:
+                    logger.error(f"Scheduled callback for {key} failed: {e}")
+
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class Debouncer:
+    """
+    Run an async callback(key) once per burst of triggers of the key, after a quiet period.
+
+    Runs of different keys are concurrent, a key runs at most once at a time.
+
+    Parameters
+    ----------
+    callback : coroutine function
+        Called with the key. It may be cancelled by a new trigger of the key.
+    delay : float
+        Seconds without a trigger before the callback runs.
+    """
+
+    def __init__(self, callback, delay):
+        self.callback = callback
+        self.delay = delay
+        self._scheduler = DeadlineScheduler(self._start_run)
+        self._running = {} # key -> task
+        self.triggers = 0
+        self.coalesced = 0 # triggers merged into an already scheduled run
+        self.cancelled = 0 # stale runs cancelled by a new trigger
+        self.runs = 0
+        self.failures = 0
+
+    def trigger(self, key):
+        """Schedule a run of key after the quiet period, pushing back a scheduled one"""
+        self.triggers += 1
+        if key in self._scheduler:
+            self.coalesced += 1
+        running = self._running.get(key)
+        if (running is not None) and not running.done():
+            running.cancel()
+            self.cancelled += 1
+        self._scheduler.schedule(key, self.delay, replace=True)
+
+    def cancel(self, key):
+        """Unschedule a key and cancel its run if one is going"""
+        self._scheduler.cancel(key)
+        running = self._running.pop(key, None)
+        if running is not None:
+            running.cancel()
+
+    async def _start_run(self, key):
+        # runs in their own task, so a slow key doesn't hold up the others
+        task = asyncio.create_task(self._run(key))
+        self._running[key] = task
+        task.add_done_callback(lambda done: self._running.pop(key, None) if self._running.get(key) is done else None)
+
+    async def _run(self, key):
+        try:
+            await self.callback(key)
+            self.runs += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Debounced callback for {key} failed: {e}")
+
+    def start(self):
+        """Start the background task"""
+        self._scheduler.start()
+
+    async def stop(self):
+        """Stop the background task and cancel the runs going"""
+        await self._scheduler.stop()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running = {}
+
+    def metrics(self):
+        """Trigger and run counts, for monitoring"""
+        return {'scheduled' : len(self._scheduler), 'running' : len(self._running), 'triggers' : self.triggers,
+                'coalesced' : self.coalesced, 'cancelled' : self.cancelled, 'runs' : self.runs, 'failures' : self.failures}
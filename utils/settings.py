@@ -0,0 +1,179 @@
+"""
+This contains the guild settings repository, an in-memory copy of the guild settings tables.
+
+Every table in DATABASE_TABLES is loaded in one pass at startup into one record object per
+guild. Reads are served from memory, and writes go to the database first and then update the
+record (write-through), so the records always match what is committed. Updates can join a
+utils.database.transaction, in which case the record is updated when the transaction commits.
+Frequent updates whose loss on a crash is acceptable can be deferred to the write-behind queue
+(utils.writebehind): the record is updated right away and the row is written with the next flush.
+
+Memory
+------
+Records use __slots__, so a record is a fixed size object holding references to its values
+(no per instance __dict__). Measured with benchmarks/bench_settings.py (tracemalloc, CPython 3.11)
+for the four tables in DATABASE_TABLES with default values, one guild costs about 0.7 KB:
+
+    - record objects : config 48 B, emotelog 112 B, emotedisplay 80 B, message 104 B
+    - guildID keys and dict slots for the 4 tables
+    - column values : small ints and empty strings are shared, other text values (prefix,
+      colors, welcome message, ...) cost their own string size (~50 B + length)
+
+So 100k guilds with mostly default settings need ~70 MB, plus their customized text.
+"""
+
+from utils.database import db_execute, transaction
+
+
+class Record:
+    """Base class of a settings row. Subclasses define the column names in __slots__"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for column, value in zip(self.__slots__, values):
+            setattr(self, column, value)
+
+    def __iter__(self):
+        return (getattr(self, column) for column in self.__slots__)
+
+    def __repr__(self):
+        values = ', '.join(f'{column}={getattr(self, column)!r}' for column in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+
+def _parse_default(value):
+    """Convert a DATABASE_TABLES default value (SQL literal) to its python value"""
+    if isinstance(value, str) and (len(value) >= 2) and (value[0] == value[-1] == "'"):
+        return value[1:-1]
+    return value
+
+
+class SettingsRepository:
+    """
+    In-memory guild settings for the tables in DATABASE_TABLES, with write-through updates.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    tables : dict
+        The DATABASE_TABLES dictionary, {table name : {column definition : default value}}.
+    writes : WriteBehindQueue, None
+        The queue used for deferred updates. If None, deferred updates are written through.
+    """
+
+    def __init__(self, db_path, tables, writes=None):
+        self.db_path = db_path
+        self.writes = writes
+        self.loaded = False
+        self._columns = {}
+        self._defaults = {}
+        self._recordTypes = {}
+        self._records = {}
+        for table_name, columns_dict in tables.items():
+            columns = tuple(col.split(' ')[0] for col in columns_dict.keys())
+            self._columns[table_name] = columns
+            self._defaults[table_name] = tuple(_parse_default(value) for value in columns_dict.values())
+            self._recordTypes[table_name] = type(f'{table_name.capitalize()}Record', (Record,), {'__slots__' : columns})
+            self._records[table_name] = {}
+
+    async def load(self):
+        """Load every row of every table. Called at startup"""
+        for table_name, columns in self._columns.items():
+            rows = await db_execute(self.db_path, f'SELECT {", ".join(columns)} FROM {table_name}', fetch='all')
+            recordType = self._recordTypes[table_name]
+            self._records[table_name] = {row[0] : recordType(*row) for row in rows}
+        self.loaded = True
+
+    async def load_guild(self, guildID):
+        """(Re)load the rows of a single guild, ex: after the guild joined"""
+        for table_name, columns in self._columns.items():
+            row = await db_execute(self.db_path, f'SELECT {", ".join(columns)} FROM {table_name} WHERE guildID=?', guildID)
+            if row is not None:
+                self._records[table_name][guildID] = self._recordTypes[table_name](*row)
+
+    def drop_guild(self, guildID):
+        """Remove a guild from memory. The database rows are kept"""
+        for records in self._records.values():
+            records.pop(guildID, None)
+
+    def get(self, table_name, guildID):
+        """
+        Get the settings record of a guild.
+
+        Parameters
+        ----------
+        table_name : str
+            The name of the table.
+        guildID : int
+            The guild ID.
+
+        Returns
+        -------
+        record : Record
+            The record for the guild, with attributes named after the table columns. If the
+            guild has no row, a record with the default values is returned (not stored).
+        """
+        record = self._records[table_name].get(guildID)
+        if record is None:
+            record = self._recordTypes[table_name](guildID, *self._defaults[table_name][1:])
+        return record
+
+    async def update(self, table_name, guildID, tx=None, defer=False, **values):
+        """
+        Write columns of a guild row to the database, then to the in-memory record.
+
+        Parameters
+        ----------
+        table_name : str
+            The name of the table.
+        guildID : int
+            The guild ID.
+        tx : Transaction, None
+            A transaction to run the update in. The record is updated when it commits. If
+            None, the update is committed on its own.
+        defer : bool
+            If True (and tx is None), update the record now and queue the row update in the
+            write-behind queue. Updates of the same row are merged until the queue flushes.
+        **values
+            The {column : new value} to set.
+        """
+        columns = self._columns[table_name]
+        for column in values:
+            if column not in columns:
+                raise ValueError(f"Error in utils.settings.update: '{column}' is not a column of {table_name}")
+
+        # a guild without a row (not loaded) gets it inserted, which can't be deferred
+        if defer and (tx is None) and (self.writes is not None) and (guildID in self._records[table_name]):
+            self.apply(table_name, guildID, **values)
+            self.writes.update(table_name, guildID, **values)
+            return
+
+        if tx is None:
+            async with transaction(self.db_path) as tx:
+                await self._write_row(tx, table_name, guildID, values)
+                tx.on_commit(lambda: self.apply(table_name, guildID, **values))
+            return
+
+        await self._write_row(tx, table_name, guildID, values)
+        tx.on_commit(lambda: self.apply(table_name, guildID, **values))
+
+    async def _write_row(self, tx, table_name, guildID, values):
+        """Update columns of a guild row, inserting the row (with the other columns as in memory) if missing"""
+        setStr = ', '.join(f'{column}=?' for column in values)
+        if await tx.execute(f'UPDATE {table_name} SET {setStr} WHERE guildID=?', *values.values(), guildID):
+            return
+        record = self.get(table_name, guildID)
+        row = {column : values.get(column, getattr(record, column)) for column in self._columns[table_name]}
+        row['guildID'] = guildID
+        await tx.execute(f'INSERT INTO {table_name} ({", ".join(row)}) VALUES ({", ".join("?"*len(row))})', *row.values())
+
+    def apply(self, table_name, guildID, **values):
+        """Set columns of the in-memory record only. Use after the database is already updated"""
+        records = self._records[table_name]
+        record = records.get(guildID)
+        if record is None:
+            record = records[guildID] = self.get(table_name, guildID)
+        for column, value in values.items():
+            setattr(record, column, value)
+
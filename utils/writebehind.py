@@ -0,0 +1,195 @@
+"""
+This contains the write-behind queue, which coalesces frequent writes in memory and flushes
+them to the database in one batched transaction.
+
+Writes are keyed, and a new write replaces the queued one with the same key (only the latest
+state is written). The queue is flushed a short delay after the first queued write, when it
+reaches a size threshold, and when stop() is called (shutdown, cog reload). Writes queued
+since the last flush are lost if the process crashes, so only use it for data where that is
+acceptable and that is kept in memory by its owner (ex: the pending emote log).
+"""
+
+import asyncio
+import time
+
+import config
+from utils.database import db_execute, transaction
+
+logger = config.logging.getLogger("bot")
+
+
+def _update_op(table_name, guildID, values):
+    """The (execute_str, args) to update columns of a guild row"""
+    columns = ', '.join(f'{column}=?' for column in values)
+    return f'UPDATE {table_name} SET {columns} WHERE guildID=?', (*values.values(), guildID)
+
+
+async def write(writes, db_path, key, execute_str, *args):
+    """
+    Queue a keyed statement on a write-behind queue, or commit it right away if there is none.
+
+    Parameters
+    ----------
+    writes : WriteBehindQueue, None
+        The queue of the caller (ex: PendingLog.writes).
+    db_path : str
+        The path of the database, used when writes is None.
+    key, execute_str, *args
+        See WriteBehindQueue.put.
+    """
+    if writes is not None:
+        writes.put(key, execute_str, *args)
+    else:
+        await db_execute(db_path, execute_str, *args, exec_type='update')
+
+
+class WriteBehindQueue:
+    """
+    Coalescing write-behind queue for one database.
+
+    Parameters
+    ----------
+    db_path : str
+        The path of the database.
+    delay : float
+        Seconds between the first queued write and the flush.
+    max_pending : int
+        Flush right away when this many writes are queued.
+    """
+
+    def __init__(self, db_path, delay=2., max_pending=500):
+        self.db_path = db_path
+        self.delay = delay
+        self.max_pending = max_pending
+        self._ops = {} # key -> (execute_str, args), in the order of the latest write
+        self._rows = {} # (table name, guildID) -> queued {column : value} of update()
+        self._timer = None
+        self._flushTask = None
+        self._flushLock = asyncio.Lock()
+
+        # metrics
+        self._queued = 0
+        self._coalesced = 0
+        self._flushes = 0
+        self._written = 0
+        self._flushTime = 0.
+        self._maxFlushTime = 0.
+        self._maxDepth = 0
+
+    def put(self, key, execute_str, *args):
+        """
+        Queue a statement. Replaces the queued statement with the same key, if any.
+
+        Parameters
+        ----------
+        key : tuple
+            The coalescing key, ex: (table name, guildID, itemID).
+        execute_str : str
+            The statement.
+        *args
+            Args fed into execute(execute_str, (*args,)).
+        """
+        if self._ops.pop(key, None) is not None:
+            self._coalesced += 1
+        self._ops[key] = (execute_str, args)
+        self._queued += 1
+        self._maxDepth = max(self._maxDepth, len(self._ops))
+
+        if len(self._ops) >= self.max_pending:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.delay)
+
+    def update(self, table_name, guildID, **values):
+        """Queue an UPDATE of a guild row. Columns are merged with a queued update of the same row"""
+        key = (table_name, guildID)
+        values = self._rows[key] = {**self._rows.get(key, {}), **values}
+        execute_str, args = _update_op(table_name, guildID, values)
+        self.put(key, execute_str, *args)
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        # flushes are serialized by _flushLock, so one started during a slow flush waits for it
+        self._timer = None
+        self._flushTask = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Write all queued statements in one transaction"""
+        try:
+            await self._flush()
+        finally:
+            # writes queued during the flush get their own
+            if self._ops and (self._timer is None):
+                self._schedule(self.delay)
+
+    async def _flush(self):
+        async with self._flushLock:
+            if not self._ops:
+                return
+            ops, self._ops = self._ops, {}
+            rows, self._rows = self._rows, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            start = time.perf_counter()
+            try:
+                async with transaction(self.db_path) as tx:
+                    # consecutive writes of the same statement go in one executemany
+                    batch_str, batch = None, []
+                    for execute_str, args in ops.values():
+                        if (execute_str != batch_str) and batch:
+                            await tx.executemany(batch_str, batch)
+                            batch = []
+                        batch_str = execute_str
+                        batch.append(args)
+                    if batch:
+                        await tx.executemany(batch_str, batch)
+            except Exception as e:
+                # put back what was not written again since, and retry later
+                logger.error(f"Write-behind flush of {len(ops)} writes failed: {e}")
+                self._ops = {**{key : op for key, op in ops.items() if key not in self._ops}, **self._ops}
+                for key, values in rows.items():
+                    # columns updated again since: the newer values win
+                    values = self._rows[key] = {**values, **self._rows.get(key, {})}
+                    self._ops[key] = _update_op(*key, values)
+                return
+
+            flushTime = time.perf_counter() - start
+            self._flushes += 1
+            self._written += len(ops)
+            self._flushTime += flushTime
+            self._maxFlushTime = max(self._maxFlushTime, flushTime)
+
+    async def stop(self):
+        """Flush everything queued. Called on shutdown and cog reload"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    def metrics(self):
+        """
+        Return the queue metrics.
+
+        Returns
+        -------
+        metrics : dict
+            The queue depth (and max seen), the number of writes queued, coalesced and
+            written, the number of flushes and the average/max flush latency (s).
+        """
+        return {
+            'depth' : len(self._ops),
+            'max_depth' : self._maxDepth,
+            'queued' : self._queued,
+            'coalesced' : self._coalesced,
+            'written' : self._written,
+            'flushes' : self._flushes,
+            'flush_avg' : self._flushTime / self._flushes if self._flushes else 0.,
+            'flush_max' : self._maxFlushTime,
+        }